@@ -0,0 +1,60 @@
+import json
+import os
+from ij import IJ
+from java.io import File, RandomAccessFile
+from java.lang import String, System
+from java.nio import ByteOrder
+from java.nio.channels.FileChannel import MapMode
+from ijpb.fiji.IPythonProxy import IPythonProxy
+
+# Write the active image to a memory-mapped file, in the format read by
+# napari_j.shm, and display it in the viewer without sending the pixels
+# through the kernel.
+
+DTYPES = {8: '|u1', 16: '<u2', 32: '<f4'}
+ALIGNMENT = 64
+
+image = IJ.getImage()
+depth = image.getBitDepth()
+if depth not in DTYPES:
+	IJ.error("RGB images can't be sent through shared memory")
+else:
+	width, height, channels, slices, frames = image.getDimensions()
+	calibration = image.getCalibration()
+	description = json.dumps({'dtype': DTYPES[depth],
+	                          'shape': [frames, slices, channels, height, width],
+	                          'title': image.getShortTitle(),
+	                          'voxelSize': [calibration.getZ(1), calibration.getY(1), calibration.getX(1)],
+	                          'unit': calibration.getUnit()})
+	descriptionBytes = String(description).getBytes('UTF-8')
+	offset = (8 + len(descriptionBytes) + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+	size = offset + width * height * channels * slices * frames * depth // 8
+	folder = '/dev/shm'
+	if not File(folder).isDirectory():
+		folder = System.getProperty('java.io.tmpdir')
+	path = os.path.join(folder, 'napari-j-image' + str(image.getID()))
+	aFile = RandomAccessFile(path, 'rw')
+	aFile.setLength(size)
+	buffer = aFile.getChannel().map(MapMode.READ_WRITE, 0, size)
+	aFile.close()
+	buffer.order(ByteOrder.LITTLE_ENDIAN)
+	buffer.put(String('NPJ1').getBytes('US-ASCII'))
+	buffer.putInt(len(descriptionBytes))
+	buffer.put(descriptionBytes)
+	buffer.position(offset)
+	pixels = buffer.slice().order(ByteOrder.LITTLE_ENDIAN)
+	if depth == 16:
+		pixels = pixels.asShortBuffer()
+	if depth == 32:
+		pixels = pixels.asFloatBuffer()
+	stack = image.getStack()
+	for index in range(1, stack.getSize() + 1):
+		pixels.put(stack.getPixels(index))
+	buffer.force()
+
+	p = IPythonProxy()
+	p.run("from napari_j.bridge import Bridge")
+	p.run("bridge = Bridge(viewer)")
+	# repr quotes the path, so that the backslashes of windows paths are kept
+	p.run("bridge.displaySharedImage(" + repr(path) + ", unlink=True)")
+	p.disconnect()
@@ -6,7 +6,9 @@ Created on Sun Jan 23 22:19:32 2022
 @author: baecker
 """
 
+import os
 import sys
+import tempfile
 sys.path.append('./napari_j/_tests/surrogate')
 if __name__ == '__main__':
     from surrogate.surrogate import surrogate
@@ -21,8 +23,13 @@ def getImage():
     imageMock = MagicMock()
     imageMock.getDimensions.return_value = [3, 2, 1, 2, 1]
     imageMock.getShortTitle.return_value = 'blobs'
+    imageMock.getBitDepth.return_value = 32
+    imageMock.getStackIndex.side_effect = lambda c, z, t: (t - 1) * 2 + (z - 1) + c
+    planes = [np.array([255.0, 0.0 ,128.0, 0.0, 64.0, 32.0], dtype=np.float32),
+              np.array([255.0, 0.0 ,128.0, 0.0, 64.0, 32.0], dtype=np.float32)]
     stackMock = MagicMock()
-    stackMock.getVoxels.return_value = [255.0, 0.0 ,128.0, 0.0, 64.0, 32.0, 255.0, 0.0 ,128.0, 0.0, 64.0, 32.0]
+    stackMock.getPixels.side_effect = lambda index: planes[index - 1]
+    stackMock.isVirtual.return_value = False
     imageMock.getStack.return_value = stackMock
     calibrationMock = MagicMock()
     calibrationMock.getX.return_value = 1
@@ -33,9 +40,50 @@ def getImage():
     imageMock.getCalibration.return_value = calibrationMock
     return imageMock
 
+def getConfig():
+    """
+    The default settings, so that the tests don't read or create the
+    config file in the home folder.
+    """
+    return Mock(memmapDir=None, streamingThreshold=2147483647, planeCacheSize=1024,
+                transferCacheSize=4096, transferCacheEntries=8, workers=4,
+                memoryBudget=8192, pyramidMinSize=256, prefetchDepth=2)
+
+class JList(list):
+    """
+    A stand-in for a java.util.List.
+    """
+    def size(self):
+        return len(self)
+
+def getCellT(offset):
+    """
+    A LimeSeg CellT with a tetrahedron whose first dot is at offset.
+    """
+    ct = Mock()
+    positions = [(0, 0, 0), (1, 0, 0), (0, 1, 0), (0, 0, 1)]
+    ct.dots = JList(Mock(pos=Mock(x=x + offset, y=y + offset, z=z + offset)) for x, y, z in positions)
+    ct.triangles = JList(Mock(id1=a, id2=b, id3=c) for a, b, c in [(0, 1, 2), (0, 1, 3), (0, 2, 3), (1, 2, 3)])
+    return ct
+
+def getLimeSeg():
+    """
+    A LimeSeg with two cells, the first over three frames, the second only
+    in the last frame.
+    """
+    limeSeg = Mock()
+    limeSeg.opt.getOptParam.return_value = 1
+    cells = [Mock(id_Cell=1), Mock(id_Cell=2)]
+    cells[0].cellTs = [Mock(frame=frame) for frame in (1, 2, 3)]
+    cells[0].getCellTAt.side_effect = lambda frame: getCellT(frame * 10)
+    cells[1].cellTs = [Mock(frame=3)]
+    cells[1].getCellTAt.side_effect = lambda frame: getCellT(100) if frame == 3 else None
+    limeSeg.allCells = cells
+    return limeSeg
+
 IJMock = Mock()
 IJMock.getImage = getImage
-HyperStackConverterMock = Mock()
+LimeSegMock = getLimeSeg()
 
 @patch('napari.Viewer')
 @surrogate('ij.measure.ResultsTable')
@@ -43,8 +91,6 @@ HyperStackConverterMock = Mock()
 @patch('ij.IJ', IJMock)
 @surrogate('ij.ImagePlus')
 @surrogate('ij.WindowManager')
-@surrogate('ij.plugin.HyperStackConverter')
-@patch('ij.plugin.HyperStackConverter', HyperStackConverterMock)
 def test_constructor(Viewer):
     if __name__ == '__main__':
         from bridge import Bridge 
@@ -52,6 +98,7 @@ def test_constructor(Viewer):
         from ..bridge import Bridge 
     viewer = napari.Viewer()
     bridge = Bridge(viewer)
+    bridge.config = getConfig()
     assert(bridge.viewer==viewer)
 
 @patch('napari.Viewer')
@@ -60,8 +107,6 @@ def test_constructor(Viewer):
 @patch('ij.IJ', IJMock)
 @surrogate('ij.ImagePlus')
 @surrogate('ij.WindowManager')
-@surrogate('ij.plugin.HyperStackConverter')
-@patch('ij.plugin.HyperStackConverter', HyperStackConverterMock)
 def test_getActiveImageFromIJ(Viewer):
     if __name__ == '__main__':
         from bridge import Bridge 
@@ -69,6 +114,7 @@ def test_getActiveImageFromIJ(Viewer):
         from ..bridge import Bridge 
     viewer = napari.Viewer()
     bridge = Bridge(viewer)
+    bridge.config = getConfig()
     bridge.getActiveImageFromIJ()
     
     # Display should be set to 3D
@@ -106,8 +152,265 @@ def test_getActiveImageFromIJ(Viewer):
 @patch('ij.IJ', IJMock)
 @surrogate('ij.ImagePlus')
 @surrogate('ij.WindowManager')
-@surrogate('ij.plugin.HyperStackConverter')
-@patch('ij.plugin.HyperStackConverter', HyperStackConverterMock)    
+def test_fetchAllImages(Viewer):
+    if __name__ == '__main__':
+        import bridge as bridgeModule
+        from lazy import LazyImage
+    else:
+        from .. import bridge as bridgeModule
+        from ..lazy import LazyImage
+    viewer = napari.Viewer()
+    bridge = bridgeModule.Bridge(viewer)
+    bridge.config = Mock(workers=2, memoryBudget=1, planeCacheSize=1, memmapDir=None,
+                         streamingThreshold=2147483647, prefetchDepth=0,
+                         transferCacheSize=1, transferCacheEntries=4)
+    images = {-1: getImage(), -2: getImage(), -3: getImage()}
+    images[-1].getSizeInBytes.return_value = 48
+    images[-2].getSizeInBytes.return_value = 2 * 1024 * 1024
+    images[-3].getSizeInBytes.return_value = 48
+    windowManager = Mock()
+    windowManager.getIDList.return_value = [-1, -2, -3]
+    windowManager.getImage.side_effect = lambda imageID: images[imageID]
+    fetched = []
+    with patch.object(bridgeModule, 'WindowManager', windowManager):
+        results = bridge.fetchAllImages(imageDone=fetched.append)
+
+    # All images are answered in the order of their IDs.
+    assert(len(results) == 3)
+    assert(len(fetched) == 3)
+    assert(all(result[0] == 'blobs' for result in results))
+
+    # An image that exceeds the memory budget is answered as a lazy array.
+    assert(isinstance(results[0][4][0], np.ndarray))
+    assert(isinstance(results[1][4][0], LazyImage))
+    assert(isinstance(results[2][4][0], np.ndarray))
+    images[-2].getStack().getPixels.assert_not_called()
+
+    # The lazy image uses the prefetcher created before the pool.
+    assert(results[1][4][0].prefetcher is bridge.prefetcher)
+
+@patch('napari.Viewer')
+@surrogate('ij.measure.ResultsTable')
+@surrogate('ij.IJ')
+@patch('ij.IJ', IJMock)
+@surrogate('ij.ImagePlus')
+@surrogate('ij.WindowManager')
+def test_fetchVirtualStack(Viewer):
+    if __name__ == '__main__':
+        from bridge import Bridge
+        from lazy import LazyImage
+    else:
+        from ..bridge import Bridge
+        from ..lazy import LazyImage
+    viewer = napari.Viewer()
+    bridge = Bridge(viewer)
+    bridge.config = getConfig()
+    image = getImage()
+    image.getStack().isVirtual.return_value = True
+    title, dims, voxelSize, unit, channels = bridge.fetchImage(image)
+
+    # A virtual stack is answered as a lazy array, without reading a plane.
+    assert(isinstance(channels[0], LazyImage))
+    assert(channels[0].shape == (2, 2, 3))
+    image.getStack().getPixels.assert_not_called()
+
+    # The plane next to a displayed plane is read ahead.
+    channels[0][0]
+    for future in bridge.getPrefetcher().futures:
+        future.result()
+    assert(channels[0].isCached((1,)))
+
+@patch('napari.Viewer')
+@surrogate('ij.measure.ResultsTable')
+@surrogate('ij.IJ')
+@patch('ij.IJ', IJMock)
+@surrogate('ij.ImagePlus')
+@surrogate('ij.WindowManager')
+def test_displaySharedImage(Viewer):
+    if __name__ == '__main__':
+        from bridge import Bridge
+        from shm import publish
+    else:
+        from ..bridge import Bridge
+        from ..shm import publish
+    viewer = napari.Viewer()
+    bridge = Bridge(viewer)
+    bridge.config = getConfig()
+    data = np.arange(2 * 2 * 3 * 4, dtype=np.uint16).reshape(2, 2, 3, 4)
+    with tempfile.TemporaryDirectory() as folder:
+        path = publish(data, path=os.path.join(folder, 'image'), title='blobs',
+                       voxelSize=[2.5, 1, 1], unit='micron')
+        bridge.displaySharedImage(path, unlink=True)
+        assert(not os.path.exists(path))
+
+    # Each channel is added as a view of the mapped file.
+    assert(viewer.add_image.call_count == 2)
+    channel = viewer.add_image.call_args[0][0]
+    assert((channel == data[:, 1]).all())
+    assert(np.shares_memory(channel, bridge.sharedArrays[path][0].array))
+    assert(viewer.add_image.call_args[1]['name'] == 'C2-blobs')
+    assert(viewer.scale_bar.unit == 'micron')
+    viewer.layers.events.removed.connect.assert_called_once_with(bridge.releaseSharedImages)
+
+    # The mapping is dropped once the layers have been removed.
+    viewer.layers.__contains__.return_value = True
+    bridge.releaseSharedImages()
+    assert(path in bridge.sharedArrays)
+    viewer.layers.__contains__.return_value = False
+    bridge.releaseSharedImages()
+    assert(not bridge.sharedArrays)
+    viewer.layers.events.removed.disconnect.assert_called_once_with(bridge.releaseSharedImages)
+
+@patch('napari.Viewer')
+@surrogate('ij.measure.ResultsTable')
+@surrogate('ij.IJ')
+@patch('ij.IJ', IJMock)
+@surrogate('ij.ImagePlus')
+@surrogate('ij.WindowManager')
+def test_releaseSharedImages(Viewer):
+    if __name__ == '__main__':
+        import bridge as bridgeModule
+    else:
+        from .. import bridge as bridgeModule
+    viewer = napari.Viewer()
+    bridge = bridgeModule.Bridge(viewer)
+    bridge.config = getConfig()
+    shared = Mock()
+    shared.unlink.side_effect = [OSError("in use"), None]
+    bridge.sharedArrays['image'] = (shared, [Mock()], True)
+    viewer.layers.__contains__.return_value = False
+
+    # The mapping is always dropped, a file that can't be removed yet is
+    # kept for the next release.
+    with patch.object(bridgeModule, 'show_warning') as show_warning:
+        bridge.releaseSharedImages()
+        show_warning.assert_called_once()
+    shared.close.assert_called_once()
+    assert(not bridge.sharedArrays)
+    assert(bridge.pendingUnlinks == [('image', shared)])
+    viewer.layers.events.removed.disconnect.assert_not_called()
+
+    bridge.releaseSharedImages()
+    assert(shared.unlink.call_count == 2)
+    assert(bridge.pendingUnlinks == [])
+    viewer.layers.events.removed.disconnect.assert_called_once_with(bridge.releaseSharedImages)
+
+@patch('napari.Viewer')
+@surrogate('ij.measure.ResultsTable')
+@surrogate('ij.IJ')
+@patch('ij.IJ', IJMock)
+@surrogate('ij.ImagePlus')
+@surrogate('ij.WindowManager')
+def test_getPyramid(Viewer):
+    if __name__ == '__main__':
+        from bridge import Bridge
+    else:
+        from ..bridge import Bridge
+    viewer = napari.Viewer()
+    bridge = Bridge(viewer)
+    bridge.config = Mock(workers=2, pyramidMinSize=8)
+    data = np.zeros((5, 32, 16), dtype=np.uint8)
+
+    # The z-dimension is reduced together with x and y.
+    levels = bridge.getPyramid(data, [16, 32, 1, 5, 1])
+    assert([level.shape for level in levels] == [(5, 32, 16), (2, 16, 8), (1, 8, 4)])
+
+    # A time series of 2D images is only reduced in x and y.
+    levels = bridge.getPyramid(data, [16, 32, 1, 1, 5])
+    assert(levels[2].shape == (5, 8, 4))
+
+    bridge.addChannel(0, levels, 'blobs', [16, 32, 1, 1, 5], [1, 1, 1], multiscale=True)
+    assert(viewer.add_image.call_args[0][0] is levels)
+    assert(viewer.add_image.call_args[1]['multiscale'])
+
+@patch('napari.Viewer')
+@surrogate('ij.measure.ResultsTable')
+@surrogate('ij.IJ')
+@patch('ij.IJ', IJMock)
+@surrogate('ij.ImagePlus')
+@surrogate('ij.WindowManager')
+def test_syncImageFromIJ(Viewer):
+    if __name__ == '__main__':
+        import bridge as bridgeModule
+        from cache import ChangeTracker, TransferCache
+    else:
+        from .. import bridge as bridgeModule
+        from ..cache import ChangeTracker, TransferCache
+    viewer = napari.Viewer()
+    bridge = bridgeModule.Bridge(viewer)
+    bridge.config = getConfig()
+    tracker = ChangeTracker()
+    bridge.transferCache = TransferCache(1024, 4, tracker)
+    image = getImage()
+    image.getID.return_value = -1
+    image.changes = False
+    image.getStack().isVirtual.return_value = False
+    hashCodes = np.array([1, 2])
+    hashPlanes = Mock(side_effect=lambda image, indices=None: hashCodes.copy())
+    with patch.object(IJMock, 'getImage', lambda: image), \
+         patch.object(bridgeModule, 'hashPlanes', hashPlanes):
+        title, dims, voxelSizes, unit, pixels = bridge.getPixelsFromImageJ()
+        layer = MagicMock()
+        layer.data = pixels.reshape(2, 2, 3)
+        viewer.layers.__contains__.return_value = True
+        viewer.layers.__getitem__.return_value = layer
+
+        # The hash codes of the planes are computed by the first sync, not
+        # by the transfer.
+        hashPlanes.assert_not_called()
+        assert(bridge.syncImageFromIJ() == [])
+        hashPlanes.assert_called_once()
+
+        # Nothing is read as long as the image has not been updated.
+        assert(bridge.syncImageFromIJ() == [])
+
+        # Only the plane that has changed in ImageJ is read.
+        newPlane = np.array([1.0, 2.0, 3.0, 4.0, 5.0, 6.0], dtype=np.float32)
+        image.getStack().getPixels.side_effect = lambda index: newPlane
+        image.getStack().getPixels.reset_mock()
+        hashCodes[1] = 3
+        tracker.imageUpdated(-1)
+        assert(bridge.syncImageFromIJ() == [1])
+        image.getStack().getPixels.assert_called_once_with(2)
+
+        # The plane is written into a copy, which replaces the data of the
+        # layer. The pixels answered before are unchanged.
+        assert((layer.data[1].reshape(-1) == newPlane).all())
+        assert((layer.data[0, 0] == [255.0, 0.0, 128.0]).all())
+        assert((pixels[6:] == [255.0, 0.0, 128.0, 0.0, 64.0, 32.0]).all())
+        assert(not layer.data.flags.writeable)
+
+        # An image that can't be synchronized is fetched again, not the
+        # active image.
+        other = getImage()
+        other.getID.return_value = -2
+        with patch.object(bridge, 'getActiveImageFromIJ') as getActiveImageFromIJ:
+            assert(bridge.syncImageFromIJ(other) == [0, 1])
+            getActiveImageFromIJ.assert_called_once_with(image=other)
+
+        # Lazy layers of the image are fetched again, without reading their
+        # planes to compare the arrays.
+        pixels = layer.data
+        lazyData = Mock(side_effect=lambda *args, **kwargs: pixels.reshape(2, 2, 3))
+        lazyLayer = MagicMock()
+        lazyLayer.data = type('LazyData', (), {'__array__': lambda self, *args, **kwargs: lazyData()})()
+        viewer.layers.__getitem__.return_value = lazyLayer
+        tracker.imageUpdated(-1)
+        assert(bridge.syncImageFromIJ(fetch=False) == [])
+        lazyData.assert_not_called()
+
+        # While the planes are tracked, the transfer computes the hash codes.
+        bridge.planeTracking = True
+        hashPlanes.reset_mock()
+        bridge.getPixelsFromImageJ()
+        hashPlanes.assert_called_once()
+
+@patch('napari.Viewer')
+@surrogate('ij.measure.ResultsTable')
+@surrogate('ij.IJ')
+@patch('ij.IJ', IJMock)
+@surrogate('ij.ImagePlus')
+@surrogate('ij.WindowManager')
 def test_getLabelsFromIJ(Viewer):
     if __name__ == '__main__':
         from bridge import Bridge 
@@ -115,14 +418,16 @@ def test_getLabelsFromIJ(Viewer):
         from ..bridge import Bridge 
     viewer = napari.Viewer()
     bridge = Bridge(viewer)
+    bridge.config = getConfig()
     bridge.getLabelsFromIJ()
 
-    # The image data should be of type int, independent from the image type in ij.
+    # The image data should be of the smallest unsigned integer type that
+    # holds the biggest label, independent from the image type in ij.
     actual = viewer.add_labels.call_args[0]
     expected = np.array([[[[255.0, 0.0, 128.0], [0.0, 64.0, 32.0]]]])
     comparison = actual == expected
     assert(comparison.all())
-    assert(isinstance(actual[0][0][0][0], np.int_))
+    assert(actual[0].dtype == np.uint8)
     
     # The name should be short title of the ij-image
     assert(viewer.add_labels.call_args[1]['name']=='blobs')
@@ -139,8 +444,6 @@ def test_getLabelsFromIJ(Viewer):
 @patch('ij.IJ', IJMock)
 @surrogate('ij.ImagePlus')
 @surrogate('ij.WindowManager')
-@surrogate('ij.plugin.HyperStackConverter')
-@patch('ij.plugin.HyperStackConverter', HyperStackConverterMock)    
 def test_getPixelsFromImageJ(Viewer):
     if __name__ == '__main__':
         from bridge import Bridge 
@@ -148,6 +451,7 @@ def test_getPixelsFromImageJ(Viewer):
         from ..bridge import Bridge
     viewer = napari.Viewer()
     bridge = Bridge(viewer)
+    bridge.config = getConfig()
     title, dims, voxelSizes, unit, pixels = bridge.getPixelsFromImageJ()
 
     # The title should be the short-title of the image in ImageJ
@@ -175,8 +479,208 @@ def test_getPixelsFromImageJ(Viewer):
 @patch('ij.IJ', IJMock)
 @surrogate('ij.ImagePlus')
 @surrogate('ij.WindowManager')
-@surrogate('ij.plugin.HyperStackConverter')
-@patch('ij.plugin.HyperStackConverter', HyperStackConverterMock)    
+def test_getPixelsFromImageJAfterChange(Viewer):
+    if __name__ == '__main__':
+        from bridge import Bridge
+        from cache import ChangeTracker, TransferCache
+    else:
+        from ..bridge import Bridge
+        from ..cache import ChangeTracker, TransferCache
+    bridge = Bridge(napari.Viewer())
+    bridge.config = getConfig()
+    tracker = ChangeTracker()
+    bridge.transferCache = TransferCache(1024, 4, tracker)
+    image = getImage()
+    image.getID.return_value = -1
+    image.changes = False
+    pixels = bridge.getPixelsFromImageJ(image=image)[4]
+    expected = pixels.copy()
+
+    # The pixels are answered from the cache, but can't be modified.
+    assert(np.shares_memory(bridge.getPixelsFromImageJ(image=image)[4], pixels))
+    assert(not pixels.flags.writeable)
+
+    # Reading the changed image doesn't overwrite the pixels answered before.
+    image.getStack().getPixels.side_effect = lambda index: np.full(6, index, dtype=np.float32)
+    tracker.imageUpdated(-1)
+    newPixels = bridge.getPixelsFromImageJ(image=image)[4]
+    assert((newPixels == [1] * 6 + [2] * 6).all())
+    assert((pixels == expected).all())
+    assert(not np.shares_memory(newPixels, pixels))
+
+@patch('napari.Viewer')
+@surrogate('ij.measure.ResultsTable')
+@surrogate('ij.IJ')
+@patch('ij.IJ', IJMock)
+@surrogate('ij.ImagePlus')
+@surrogate('ij.WindowManager')
+def test_getMeshFromCellT(Viewer):
+    if __name__ == '__main__':
+        from bridge import Bridge
+    else:
+        from ..bridge import Bridge
+    viewer = napari.Viewer()
+    bridge = Bridge(viewer)
+    bridge.config = getConfig()
+    vertices, faces = bridge.getMeshFromCellT(getCellT(2), 2)
+
+    # The vertices are in the order z, y, x with z divided by the z-scale.
+    assert(vertices.shape == (4, 3))
+    assert((vertices[0] == [1, 2, 2]).all())
+    assert((vertices[3] == [1.5, 2, 2]).all())
+    assert(faces.shape == (4, 3))
+    assert((faces[3] == [1, 2, 3]).all())
+
+    # The mesh of a cell doesn't contain the geometry of the previous cells.
+    vertices, faces = bridge.getMeshFromCellT(getCellT(5), 1)
+    assert(vertices.shape == (4, 3))
+    assert(vertices.min() == 5)
+
+@patch('napari.Viewer')
+@surrogate('ij.measure.ResultsTable')
+@surrogate('ij.IJ')
+@patch('ij.IJ', IJMock)
+@surrogate('ij.ImagePlus')
+@surrogate('ij.WindowManager')
+def test_addCombinedSurface(Viewer):
+    if __name__ == '__main__':
+        from bridge import Bridge
+    else:
+        from ..bridge import Bridge
+    viewer = napari.Viewer()
+    bridge = Bridge(viewer)
+    bridge.config = getConfig()
+    meshes = [bridge.getMeshFromCellT(getCellT(offset), 1) for offset in (0, 5, 10)]
+    bridge.addCombinedSurface(meshes, ['1', '2', '3'])
+
+    # All cells are added as one layer, the value of a vertex is its cell.
+    viewer.add_surface.assert_called_once()
+    vertices, faces, values = viewer.add_surface.call_args[0][0]
+    assert(vertices.shape == (12, 3))
+    assert(faces.max() == 11)
+    assert((values[4:8] == 1).all())
+    metadata = viewer.add_surface.call_args[1]['metadata']
+    layer = Mock(metadata=metadata, data=(vertices, faces, values))
+
+    bridge.setCellVisible(layer, '2', False)
+    assert(len(layer.data[1]) == 8)
+    assert(not np.isin(layer.data[1], [4, 5, 6, 7]).any())
+    bridge.setCellVisible(layer, '2', True)
+    assert(len(layer.data[1]) == 12)
+
+    # The highlighted cell gets the value of the last color of the colormap.
+    bridge.highlightCell(layer, '3')
+    assert((layer.data[2][8:] == 3).all())
+    assert((metadata['values'][8:] == 2).all())
+
+    # The budget is shared by the cells, each keeps at least 4 triangles.
+    viewer.add_surface.reset_mock()
+    bridge.addCombinedSurface(meshes, ['1', '2', '3'], budget=6, levels=2)
+    metadata = viewer.add_surface.call_args[1]['metadata']
+    assert(len(metadata['levels']) == 2)
+    layer = Mock(metadata=metadata, data=viewer.add_surface.call_args[0][0])
+    bridge.setCellVisible(layer, '1', False)
+    bridge.highlightCell(layer, '2')
+    bridge.setSurfaceLevel(layer, 5)
+
+    # The coarsest level is displayed, cell 1 stays hidden and 2 highlighted.
+    assert(metadata['level'] == 1)
+    assert(not np.isin(layer.data[1], np.arange(0, 4)).any())
+    assert((layer.data[2][4:8] == 3).all())
+
+@patch('napari.Viewer')
+@surrogate('ij.measure.ResultsTable')
+@surrogate('ij.IJ')
+@patch('ij.IJ', IJMock)
+@surrogate('ij.ImagePlus')
+@surrogate('ij.WindowManager')
+def test_addSurfaceLevels(Viewer):
+    if __name__ == '__main__':
+        from bridge import Bridge
+    else:
+        from ..bridge import Bridge
+    viewer = napari.Viewer()
+    bridge = Bridge(viewer)
+    bridge.config = getConfig()
+    # A flat grid of 20x20 vertices.
+    grid = np.arange(400).reshape(20, 20)
+    x, y = np.meshgrid(np.arange(20.0), np.arange(20.0))
+    vertices = np.column_stack((np.zeros(400), y.ravel(), x.ravel()))
+    a, b, c, d = grid[:-1, :-1], grid[:-1, 1:], grid[1:, :-1], grid[1:, 1:]
+    faces = np.concatenate((np.stack((a, b, c), axis=-1).reshape(-1, 3),
+                            np.stack((b, d, c), axis=-1).reshape(-1, 3)))
+
+    # The missing levels of a layer are built when they are displayed.
+    layer = Mock(metadata={'levels': [(vertices, faces)], 'level': 0})
+    bridge.setSurfaceLevel(layer, 2)
+    levels = layer.metadata['levels']
+    assert(len(levels) == 3)
+    assert(len(levels[2][1]) <= len(levels[1][1]) // 4 < len(faces) // 4)
+    assert(layer.data is levels[2])
+
+    # The cells of a combined layer are decimated one by one.
+    bridge.addCombinedSurface([(vertices, faces), (vertices + 30, faces)], ['1', '2'])
+    metadata = viewer.add_surface.call_args[1]['metadata']
+    layer = Mock(metadata=metadata, data=viewer.add_surface.call_args[0][0])
+    bridge.setSurfaceLevel(layer, 1)
+    assert(metadata['level'] == 1)
+    vertices, faces, values, ranges = metadata['levels'][1]
+    assert(len(ranges) == 2)
+    assert(len(faces) < len(metadata['levels'][0][1]) // 4)
+
+    # A mesh that can't be reduced any further has no more levels.
+    meshes = [bridge.getMeshFromCellT(getCellT(offset), 1) for offset in (0, 5)]
+    bridge.addCombinedSurface(meshes, ['1', '2'])
+    metadata = viewer.add_surface.call_args[1]['metadata']
+    bridge.setSurfaceLevel(Mock(metadata=metadata), 2)
+    assert(len(metadata['levels']) == 1)
+    assert(metadata['level'] == 0)
+
+@patch('napari.Viewer')
+@surrogate('ij.measure.ResultsTable')
+@surrogate('ij.IJ')
+@patch('ij.IJ', IJMock)
+@surrogate('ij.ImagePlus')
+@surrogate('ij.WindowManager')
+@surrogate('eu.kiaru.limeseg.LimeSeg')
+@patch('eu.kiaru.limeseg.LimeSeg', LimeSegMock)
+def test_getSurfaceSeriesFromIJ(Viewer):
+    if __name__ == '__main__':
+        from bridge import Bridge
+    else:
+        from ..bridge import Bridge
+    viewer = napari.Viewer()
+    viewer.layers.__len__.return_value = 0
+    viewer.layers.__contains__.return_value = True
+    viewer.dims.current_step = (0, 0, 0, 0)
+    bridge = Bridge(viewer)
+    bridge.config = getConfig()
+    surface = bridge.getSurfaceSeriesFromIJ()
+    surface.metadata = viewer.add_surface.call_args[1]['metadata']
+    series = surface.metadata['series']
+
+    # The layer spans the three frames, but only holds the first one.
+    vertices, faces, values = viewer.add_surface.call_args[0][0]
+    assert(series.frameCount == 3)
+    assert(vertices.shape == (6, 4))
+    assert((vertices[-2:, 0] == [0, 2]).all())
+
+    # Moving the time slider displays the meshes of the new frame.
+    onStepChanged = viewer.dims.events.current_step.connect.call_args[0][0]
+    viewer.dims.current_step = (2, 0, 0, 0)
+    onStepChanged(None)
+    vertices, faces, values = surface.data
+    assert(vertices.shape == (10, 4))
+    assert((vertices[:8, 0] == 2).all())
+    assert((values[4:8] == 1).all())
+    series.shutdown()
+
+@patch('napari.Viewer')
+@surrogate('ij.measure.ResultsTable')
+@surrogate('ij.IJ')
+@patch('ij.IJ', IJMock)
+@surrogate('ij.ImagePlus')
+@surrogate('ij.WindowManager')
 def test_getMetadataFromImage(Viewer):
     if __name__ == '__main__':
         from bridge import Bridge 
@@ -184,6 +688,7 @@ def test_getMetadataFromImage(Viewer):
         from ..bridge import Bridge
     viewer = napari.Viewer()
     bridge = Bridge(viewer)
+    bridge.config = getConfig()
     image = getImage()
     title, dims, voxelSizes, unit, size = bridge.getMetadataFromImage(image)
 
@@ -211,28 +716,141 @@ def test_getMetadataFromImage(Viewer):
 @patch('ij.IJ', IJMock)
 @surrogate('ij.ImagePlus')
 @surrogate('ij.WindowManager')
-@surrogate('ij.plugin.HyperStackConverter')
-@patch('ij.plugin.HyperStackConverter', HyperStackConverterMock)
-def test_toHyperstack(Viewer):
+@surrogate('ij.ImageStack')
+@surrogate('ij.CompositeImage')
+@surrogate('ij.process.LUT')
+@patch('ij.ImageStack', MagicMock())
+@patch('ij.CompositeImage', MagicMock())
+@patch('ij.process.LUT', MagicMock())
+def test_layersToIJ(Viewer):
     if __name__ == '__main__':
-        from bridge import Bridge 
-    else:    
-        from ..bridge import Bridge
+        import bridge as bridgeModule
+    else:
+        from .. import bridge as bridgeModule
+    from ij import ImageStack, CompositeImage
     viewer = napari.Viewer()
-    bridge = Bridge(viewer)
-    image = getImage()
-    title, dims, voxelSizes, unit, size = bridge.getMetadataFromImage(image)
-    bridge.toHyperstack(image, dims)
-    
-    # If the converted image has a different id from the input image, the
-    # input image is closed and the new image is shown.
-    image.close.assert_called_once()
-    
+    viewer.scale_bar.unit = "micrometer"
+    bridge = bridgeModule.Bridge(viewer)
+    bridge.config = getConfig()
+    layer = MagicMock()
+    layer.name = "C1-blobs"
+    layer.data = np.arange(12, dtype=np.int64).reshape(2, 2, 3)
+    layer.scale = [2.5, 1, 1]
+    layer.contrast_limits = [0, 11]
+    layer.colormap.map.return_value = np.ones((256, 4))
+    imagePlus = MagicMock()
+    with patch.object(bridgeModule, 'ImagePlus', imagePlus), \
+         patch.object(bridgeModule, 'toJavaArray', lambda plane: plane.copy()):
+        image = bridge.layersToIJ([layer])
+
+    # One plane per z-slice is added, converted to the smallest ImageJ type.
+    stack = ImageStack.return_value
+    ImageStack.assert_called_with(3, 2)
+    assert(stack.addSlice.call_count == 2)
+    plane = stack.addSlice.call_args[0][1]
+    assert(plane.dtype == np.uint16)
+    assert((plane == [[6, 7, 8], [9, 10, 11]]).all())
+
+    # The image gets the title without the channel prefix and the dimensions.
+    assert(imagePlus.call_args[0][0] == "blobs")
+    image.setDimensions.assert_called_with(1, 2, 1)
+    CompositeImage.assert_not_called()
+
+    # The calibration is taken from the layer and the viewer.
+    assert(image.getCalibration().pixelDepth == 2.5)
+    image.getCalibration().setUnit.assert_called_with("micrometer")
+    image.show.assert_called_once()
+
+@patch('napari.Viewer')
+@surrogate('ij.measure.ResultsTable')
+@surrogate('ij.IJ')
+@patch('ij.IJ', IJMock)
+@surrogate('ij.ImagePlus')
+@surrogate('ij.WindowManager')
+def test_displayPoints(Viewer):
+    if __name__ == '__main__':
+        import bridge as bridgeModule
+    else:
+        from .. import bridge as bridgeModule
+    columns = {'X': np.array([1.0, 2.0]), 'Y': np.array([3.0, 4.0]), 'Z': np.array([5.0, 6.0]),
+               'Confidence': np.array([0.9, 0.1]), 'V': np.array([0.5, 0.25])}
+    headings = list(columns.keys())
+    table = MagicMock()
+    table.getColumnHeadings.return_value = " \t" + "\t".join(headings)
+    table.getColumnIndex.side_effect = lambda heading: headings.index(heading)
+    table.getColumnAsDoubles.side_effect = lambda index: columns[headings[index]]
+    table.size.return_value = 2
+    resultsTable = MagicMock()
+    resultsTable.getResultsTable.return_value = table
+    viewer = napari.Viewer()
+    bridge = bridgeModule.Bridge(viewer)
+    bridge.config = getConfig()
+    with patch.object(bridgeModule, 'ResultsTable', resultsTable):
+        bridge.displayPoints("Spots")
+
+    # The coordinates are reordered to z, y, x and V is preferred as the
+    # confidence, whatever the order of the columns.
+    coords = viewer.add_points.call_args[0][0]
+    assert((coords == [[5, 3, 1], [6, 4, 2]]).all())
+    confidence = viewer.add_points.call_args[1]['properties']['confidence']
+    assert((confidence == [0.5, 0.25]).all())
+    assert(viewer.add_points.call_args[1]['name'] == "Spots")
+
+@patch('napari.Viewer')
+@surrogate('ij.measure.ResultsTable')
+@surrogate('ij.IJ')
+@patch('ij.IJ', IJMock)
+@surrogate('ij.ImagePlus')
+@surrogate('ij.WindowManager')
+@patch('jpype.JArray', lambda type: lambda values: values.copy())
+def test_pointsToIJ(Viewer):
+    if __name__ == '__main__':
+        import bridge as bridgeModule
+    else:
+        from .. import bridge as bridgeModule
+    viewer = napari.Viewer()
+    viewer.layers.selection.active.name = "Spots"
+    bridge = bridgeModule.Bridge(viewer)
+    bridge.config = getConfig()
+    points = MagicMock()
+    points.data = np.array([[1, 2, 3], [4, 5, 6], [7, 8, 9]], dtype=np.float64)
+    points.properties = {'confidence': np.array([0.5, 0, 0.75])}
+    resultsTable = MagicMock()
+    table = resultsTable.return_value
+    with patch.object(bridgeModule, 'ResultsTable', resultsTable), \
+         patch.object(bridgeModule, 'WindowManager', MagicMock()), \
+         patch.object(bridgeModule, 'JObject', lambda value: value), \
+         patch.object(bridgeModule, 'JInt', int):
+        bridge.pointsToIJ(points)
+
+    # Only the points with a confidence are sent, one call per column.
+    resultsTable.assert_called_once_with(2)
+    values = {call[0][0]: call[0][1] for call in table.setValues.call_args_list}
+    assert(table.setValues.call_count == 4)
+    assert((values["X"] == [3, 9]).all())
+    assert((values["Z"] == [1, 7]).all())
+    assert((values["V"] == [0.5, 0.75]).all())
+    table.setValue.assert_not_called()
+    table.show.assert_called_once_with("Spots")
+
 if __name__ == '__main__':
     test_constructor()
     test_getActiveImageFromIJ()
+    test_fetchAllImages()
+    test_fetchVirtualStack()
+    test_displaySharedImage()
+    test_releaseSharedImages()
+    test_getPyramid()
+    test_syncImageFromIJ()
     test_getLabelsFromIJ()
     test_getPixelsFromImageJ()
+    test_getPixelsFromImageJAfterChange()
+    test_getMeshFromCellT()
+    test_addCombinedSurface()
+    test_addSurfaceLevels()
+    test_getSurfaceSeriesFromIJ()
     test_getMetadataFromImage()
-    test_toHyperstack()
+    test_layersToIJ()
+    test_displayPoints()
+    test_pointsToIJ()
 
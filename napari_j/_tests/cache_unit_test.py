@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+from unittest.mock import MagicMock
+import numpy as np
+if __name__ == '__main__':
+    from cache import ChangeTracker, TransferCache
+else:
+    from ..cache import ChangeTracker, TransferCache
+
+
+def getImage(imageID):
+    imageMock = MagicMock()
+    imageMock.getID.return_value = imageID
+    imageMock.getDimensions.return_value = [3, 2, 1, 2, 1]
+    imageMock.getBitDepth.return_value = 8
+    imageMock.changes = False
+    return imageMock
+
+def test_get():
+    tracker = ChangeTracker()
+    cache = TransferCache(1024, 4, tracker)
+    image = getImage(-1)
+    pixels = np.zeros(12, dtype=np.uint8)
+    cache.put(image, pixels)
+
+    # A read-only view of the array is answered as long as the image is
+    # unchanged.
+    view = cache.get(image)
+    assert(np.shares_memory(view, pixels))
+    assert(not view.flags.writeable)
+
+    # When the image has been modified, the entry is no longer valid.
+    image.changes = True
+    assert(cache.get(image) is None)
+
+    # Without a tracker, edits of the pixels can't be seen.
+    cache = TransferCache(1024, 4)
+    image.changes = False
+    cache.put(image, pixels)
+    assert(cache.get(image) is None)
+    assert(cache.getEntry(-1).pixels is pixels)
+
+def test_getWithTracker():
+    tracker = ChangeTracker()
+    cache = TransferCache(1024, 4, tracker)
+    image = getImage(-1)
+    cache.put(image, np.zeros(12, dtype=np.uint8))
+    tracker.imageUpdated(-1)
+    assert(cache.get(image) is None)
+
+    # The entries of closed images are removed.
+    cache.put(image, np.zeros(12, dtype=np.uint8))
+    tracker.imageClosed(-1)
+    assert(cache.nbytes == 0)
+
+def test_eviction():
+    cache = TransferCache(30, 2, ChangeTracker())
+    images = [getImage(-1), getImage(-2), getImage(-3)]
+    for image in images:
+        cache.put(image, np.zeros(12, dtype=np.uint8))
+
+    # The least recently used entry is evicted.
+    assert(cache.get(images[0]) is None)
+    assert(cache.get(images[2]) is not None)
+    assert(cache.nbytes == 24)
+
+    # Entries bigger than the cache are not stored.
+    cache.put(images[0], np.zeros(40, dtype=np.uint8))
+    assert(cache.get(images[0]) is None)
+
+def test_takeBuffer():
+    tracker = ChangeTracker()
+    cache = TransferCache(1024, 4, tracker)
+    image = getImage(-1)
+    cache.put(image, np.zeros((2, 2, 3), dtype=np.uint8))
+    view = cache.get(image)
+    tracker.imageUpdated(-1)
+
+    # The array of an outdated entry isn't reused while a view of it is
+    # referenced.
+    assert(cache.takeBuffer(image, (2, 2, 3), np.uint8) is None)
+    assert(cache.nbytes == 0)
+
+    # Otherwise it is reused if shape and dtype match.
+    cache.put(image, np.zeros((2, 2, 3), dtype=np.uint8))
+    buffer = cache.takeBuffer(image, (2, 2, 3), np.uint8)
+    assert(buffer.shape == (2, 2, 3))
+    assert(buffer.flags.writeable)
+    assert(not np.shares_memory(buffer, view))
+    assert(cache.nbytes == 0)
+
+    cache.put(image, buffer)
+    del buffer
+    assert(cache.takeBuffer(image, (2, 2, 3), np.uint16) is None)
+
+if __name__ == '__main__':
+    test_get()
+    test_getWithTracker()
+    test_eviction()
+    test_takeBuffer()
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+from unittest.mock import MagicMock
+import numpy as np
+if __name__ == '__main__':
+    from cache import ChangeTracker
+    from lazy import LazyImage, PlaneCache, Prefetcher
+else:
+    from ..cache import ChangeTracker
+    from ..lazy import LazyImage, PlaneCache, Prefetcher
+
+
+def getImage(width=3, height=2, channels=2, slices=3, frames=1):
+    """
+    A 16-bit hyperstack in which each pixel of a plane holds the index of
+    the plane in the stack.
+    """
+    imageMock = MagicMock()
+    imageMock.getDimensions.return_value = [width, height, channels, slices, frames]
+    imageMock.getBitDepth.return_value = 16
+    imageMock.getID.return_value = -7
+    imageMock.getStackIndex.side_effect = \
+        lambda c, z, t: (t - 1) * channels * slices + (z - 1) * channels + c
+    stackMock = MagicMock()
+    stackMock.getPixels.side_effect = \
+        lambda index: np.full(width * height, index, dtype=np.int16)
+    imageMock.getStack.return_value = stackMock
+    return imageMock
+
+def test_PlaneCache():
+    cache = PlaneCache(20)
+    cache.put('a', np.zeros(8, dtype=np.uint8))
+    cache.put('b', np.zeros(8, dtype=np.uint8))
+    cache.get('a')
+    cache.put('c', np.zeros(8, dtype=np.uint8))
+
+    # The least recently used plane is evicted when the budget is exceeded.
+    assert(cache.get('b') is None)
+    assert(cache.get('a') is not None)
+    assert(cache.get('c') is not None)
+    assert(cache.nbytes == 16)
+
+    # A plane bigger than the budget is not stored.
+    cache.put('d', np.zeros(32, dtype=np.uint8))
+    assert(cache.get('d') is None)
+
+def test_PlaneCacheTracker():
+    tracker = ChangeTracker()
+    cache = PlaneCache(1024, tracker)
+    image = getImage()
+    data = LazyImage(image, 0, cache)
+    other = LazyImage(getImage(), 0, cache)
+    other.image.getID.return_value = -8
+    assert((data[0] == 1).all())
+    other[0]
+
+    # The planes of an image that has been updated in ImageJ are read again.
+    image.getStack().getPixels.side_effect = lambda index: np.full(6, 9, dtype=np.int16)
+    tracker.imageUpdated(-7)
+    assert(not data.isCached((0,)))
+    assert(other.isCached((0,)))
+    assert((data[0] == 9).all())
+
+    # The planes of a closed image are removed.
+    tracker.imageClosed(-8)
+    assert(not other.isCached((0,)))
+    assert(cache.nbytes == 12)
+
+def test_LazyImageShape():
+    image = getImage()
+    data = LazyImage(image, 1, PlaneCache(1024))
+
+    # The leading dimension t of size one is dropped.
+    assert(data.shape == (3, 2, 3))
+    assert(data.dtype == np.uint16)
+
+    # Nothing is read before the data is sliced.
+    image.getStack().getPixels.assert_not_called()
+
+def test_LazyImageGetItem():
+    image = getImage()
+    data = LazyImage(image, 1, PlaneCache(1024))
+    plane = data[1]
+
+    # Only the requested plane of the second channel is read.
+    assert(plane.shape == (2, 3))
+    assert((plane == 4).all())
+    image.getStack().getPixels.assert_called_once_with(4)
+
+    # The plane comes from the cache the second time.
+    assert(data[1, 0, 1] == 4)
+    image.getStack().getPixels.assert_called_once_with(4)
+
+    volume = data[::2, :, 1:]
+    assert(volume.shape == (2, 2, 2))
+    assert((volume[0] == 2).all())
+    assert((volume[1] == 6).all())
+    assert((np.asarray(data)[:, 0, 0] == [2, 4, 6]).all())
+
+def test_LazyImageDtypes():
+    image = getImage()
+    image.getBitDepth.return_value = 32
+    image.getStack().getPixels.side_effect = \
+        lambda index: np.full(6, index + 0.75, dtype=np.float32)
+    cache = PlaneCache(1024)
+    labels = LazyImage(image, 0, cache, dtype=np.uint32)
+    data = LazyImage(image, 0, cache)
+
+    # Views of the image with different dtypes don't share their planes.
+    assert(labels[0, 0, 0] == 1)
+    assert(data[0, 0, 0] == 1.75)
+    assert(data.dtype == np.float32)
+
+def test_getNeighbours():
+    data = LazyImage(getImage(slices=5, frames=2), 0, PlaneCache(1024))
+
+    # The nearest planes along z come first, then the neighbouring frames.
+    assert(data.getNeighbours((0, 1), 2) == [(0, 2), (0, 0), (0, 3), (1, 1)])
+
+def test_Prefetcher():
+    image = getImage(slices=5)
+    prefetcher = Prefetcher(1)
+    data = LazyImage(image, 0, PlaneCache(1024), prefetcher=prefetcher)
+    data[2]
+    for future in prefetcher.futures:
+        future.result()
+
+    # The planes before and after the displayed plane have been read ahead.
+    assert(data.isCached((1,)))
+    assert(data.isCached((3,)))
+    assert(not data.isCached((0,)))
+
+    # Planes already in the cache are not requested again.
+    data[3]
+    assert(len(prefetcher.futures) == 1)
+    prefetcher.shutdown()
+
+if __name__ == '__main__':
+    test_PlaneCache()
+    test_PlaneCacheTracker()
+    test_LazyImageShape()
+    test_LazyImageGetItem()
+    test_LazyImageDtypes()
+    test_getNeighbours()
+    test_Prefetcher()
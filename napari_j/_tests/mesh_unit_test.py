@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import numpy as np
+if __name__ == '__main__':
+    from mesh import combineMeshes, decimate, getCategoricalColors, getLevelsOfDetail, getVisibleFaces, \
+        splitMeshes
+else:
+    from ..mesh import combineMeshes, decimate, getCategoricalColors, getLevelsOfDetail, getVisibleFaces, \
+        splitMeshes
+
+
+def getTetrahedron(offset):
+    vertices = np.array([[0, 0, 0], [1, 0, 0], [0, 1, 0], [0, 0, 1]], dtype=np.float64) + offset
+    faces = np.array([[0, 1, 2], [0, 1, 3], [0, 2, 3], [1, 2, 3]])
+    return vertices, faces
+
+def getSphere(rings=40, segments=80, radius=10):
+    theta = np.linspace(0, np.pi, rings)
+    phi = np.linspace(0, 2 * np.pi, segments, endpoint=False)
+    theta, phi = np.meshgrid(theta, phi, indexing='ij')
+    vertices = radius * np.column_stack((np.cos(theta).ravel(),
+                                         (np.sin(theta) * np.sin(phi)).ravel(),
+                                         (np.sin(theta) * np.cos(phi)).ravel()))
+    grid = np.arange(rings * segments).reshape(rings, segments)
+    a, b = grid[:-1], np.roll(grid, -1, axis=1)[:-1]
+    c, d = grid[1:], np.roll(grid, -1, axis=1)[1:]
+    faces = np.concatenate((np.stack((a, b, c), axis=-1).reshape(-1, 3),
+                            np.stack((b, d, c), axis=-1).reshape(-1, 3)))
+    return vertices, faces
+
+def test_combineMeshes():
+    triangle = (np.zeros((3, 3)), np.array([[0, 1, 2]]))
+    vertices, faces, values, ranges = combineMeshes([getTetrahedron(0), triangle, getTetrahedron(5)])
+
+    # The face indices of each mesh are offset by the preceding vertices.
+    assert(vertices.shape == (11, 3))
+    assert(faces.shape == (9, 3))
+    assert((faces[4] == [4, 5, 6]).all())
+    assert((faces[5] == [7, 8, 9]).all())
+    assert((vertices[7] == [5, 5, 5]).all())
+    assert((values == [0, 0, 0, 0, 1, 1, 1, 2, 2, 2, 2]).all())
+    assert((ranges[1] == [4, 7, 4, 5]).all())
+
+def test_splitMeshes():
+    meshes = [getTetrahedron(0), getTetrahedron(5)]
+    vertices, faces, values, ranges = combineMeshes(meshes)
+    split = splitMeshes(vertices, faces, ranges)
+
+    # The meshes are answered as they have been combined.
+    assert(len(split) == 2)
+    assert((split[1][0] == meshes[1][0]).all())
+    assert((split[1][1] == meshes[1][1]).all())
+
+def test_getVisibleFaces():
+    vertices, faces, values, ranges = combineMeshes([getTetrahedron(0), getTetrahedron(5)])
+    assert(getVisibleFaces(faces, ranges, set()) is faces)
+    visible = getVisibleFaces(faces, ranges, {0})
+    assert(visible.shape == (4, 3))
+    assert(visible.min() == 4)
+
+def test_getCategoricalColors():
+    colors = getCategoricalColors(5)
+    assert(colors.shape == (5, 4))
+    assert(len(np.unique(colors, axis=0)) == 5)
+
+def test_decimate():
+    vertices, faces = getSphere()
+    decimated, decimatedFaces = decimate(vertices, faces, 1000)
+
+    # The decimated mesh is within the budget and only uses its own vertices.
+    assert(0 < len(decimatedFaces) <= 1000)
+    assert(decimatedFaces.max() == len(decimated) - 1)
+    assert(np.allclose(np.linalg.norm(decimated, axis=1), 10, atol=1.5))
+
+    # A mesh within the budget is not changed.
+    assert(decimate(vertices, faces, len(faces))[1] is faces)
+
+def test_getLevelsOfDetail():
+    vertices, faces = getSphere()
+    levels = getLevelsOfDetail(vertices, faces, 2000, 3)
+    counts = [len(levelFaces) for levelVertices, levelFaces in levels]
+    assert(counts[0] <= 2000)
+    assert(counts[1] <= counts[0] // 4)
+    assert(counts[2] <= counts[1] // 4)
+
+if __name__ == '__main__':
+    test_combineMeshes()
+    test_splitMeshes()
+    test_getVisibleFaces()
+    test_getCategoricalColors()
+    test_decimate()
+    test_getLevelsOfDetail()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import sys
+sys.path.append('./napari_j/_tests/surrogate')
+if __name__ == '__main__':
+    from surrogate.surrogate import surrogate
+else:
+    from surrogate import surrogate
+from unittest.mock import MagicMock, patch
+import numpy as np
+if __name__ == '__main__':
+    from movie import MovieRecorder, getRotationStates, getTimeStates, getViewState, setViewState
+    MODULE = 'movie'
+else:
+    from ..movie import MovieRecorder, getRotationStates, getTimeStates, getViewState, setViewState
+    MODULE = 'napari_j.movie'
+
+
+def getViewer():
+    viewer = MagicMock()
+    viewer.camera.center = (0, 10, 20)
+    viewer.camera.zoom = 2
+    viewer.camera.angles = (0, 0, 90)
+    viewer.dims.current_step = (1, 5, 0, 0)
+    return viewer
+
+def test_viewState():
+    viewer = getViewer()
+    state = getViewState(viewer)
+    assert(state == {'center': (0, 10, 20), 'zoom': 2, 'angles': (0, 0, 90), 'step': (1, 5, 0, 0)})
+
+    setViewState(viewer, {'zoom': 4})
+    assert(viewer.camera.zoom == 4)
+    assert(viewer.camera.center == (0, 10, 20))
+
+def test_getRotationStates():
+    states = getRotationStates(getViewState(getViewer()), 4)
+    assert(len(states) == 4)
+    assert([state['angles'][2] for state in states] == [90, 180, 270, 360])
+    assert(all(state['zoom'] == 2 for state in states))
+
+def test_getTimeStates():
+    states = getTimeStates(getViewState(getViewer()), 3)
+    assert([state['step'] for state in states] == [(0, 5, 0, 0), (1, 5, 0, 0), (2, 5, 0, 0)])
+
+@surrogate('ij.ImageStack')
+@patch(MODULE + '.toJavaArray', side_effect=lambda data: data)
+@patch(MODULE + '.attachThread')
+def test_MovieRecorder(attachThread, toJavaArray):
+    import ij
+    stack = MagicMock()
+    stack.getSize.side_effect = [0, 1, 2]
+    ij.ImageStack = MagicMock(return_value=stack)
+
+    recorder = MovieRecorder(queueSize=1)
+    recorder.start()
+    for index in range(0, 3):
+        recorder.addFrame(np.full((2, 3, 4), index, dtype=np.uint8))
+    assert(recorder.finish() is stack)
+
+    ij.ImageStack.assert_called_once_with(3, 2)
+    assert(stack.addSlice.call_count == 3)
+    title, pixels = stack.addSlice.call_args[0]
+    assert(title == "frame 3")
+    assert(pixels.dtype == np.dtype('<i4'))
+    assert(pixels.shape == (2, 3))
+    attachThread.assert_called_once()
+
+@patch(MODULE + '.attachThread')
+def test_MovieRecorderError(attachThread):
+    recorder = MovieRecorder()
+    recorder.appendFrame = MagicMock(side_effect=ValueError("no JVM"))
+    recorder.start()
+    recorder.addFrame(np.zeros((2, 3, 4), dtype=np.uint8))
+    try:
+        recorder.finish()
+        assert(False)
+    except ValueError:
+        pass
+
+if __name__ == '__main__':
+    test_viewState()
+    test_getRotationStates()
+    test_getTimeStates()
+    test_MovieRecorder()
+    test_MovieRecorderError()
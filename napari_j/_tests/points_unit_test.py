@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import gc
+from unittest.mock import MagicMock, patch
+import numpy as np
+from napari.layers import Points as PointsLayer
+from qtpy.QtWidgets import QApplication
+if __name__ == '__main__':
+    from points import LayerState, Points, getColorIndices
+else:
+    from ..points import LayerState, Points, getColorIndices
+
+
+def getWidget(confidence):
+    """
+    A Points widget with a points layer selected, the confidences are
+    between 0 and 1.
+    """
+    application = QApplication.instance() or QApplication([])
+    widget = Points(MagicMock())
+    layer = PointsLayer(np.zeros((len(confidence), 3)), properties={'confidence': confidence},
+                        face_color='confidence', face_colormap='inferno', face_contrast_limits=(0.0, 1.0))
+    widget.selectedPoints = layer
+    widget.confidence = confidence.copy()
+    return widget, layer
+
+def test_getColorIndices():
+    indices = getColorIndices(np.array([-1, 0, 0.5, 1, 2]), (0, 1))
+    assert(indices.dtype == np.uint8)
+    assert((indices == [0, 0, 128, 255, 255]).all())
+    assert((getColorIndices(np.array([3, 4]), (1, 1)) == 0).all())
+
+def test_setOutsidePointsBlack():
+    confidence = np.linspace(0, 1, 11)
+    widget, layer = getWidget(confidence)
+    colors = layer.face_color.copy()
+    widget.thresholdMin = 0.25
+    widget.thresholdMax = 0.75
+    widget.setOutsidePointsBlack(layer)
+
+    # The confidences outside of the thresholds are zero, the original
+    # confidences are kept by the widget.
+    inside = (confidence >= 0.25) & (confidence <= 0.75)
+    assert((layer.properties['confidence'][inside] == confidence[inside]).all())
+    assert((layer.properties['confidence'][~inside] == 0).all())
+    assert((widget.confidence == confidence).all())
+
+    # The points are colored as napari would color their confidence.
+    assert(np.allclose(layer.face_color[inside], colors[inside], atol=0.02))
+    assert(np.allclose(layer.face_color[~inside], colors[0], atol=0.02))
+
+    # Changing the colormap recolors the thresholded points.
+    widget.getSelectedLayer = lambda: layer
+    widget.changeColormap()
+    viridis = layer.face_colormap.map(np.array([0.0, 0.5]))
+    assert(np.allclose(layer.face_color[0], viridis[0], atol=0.02))
+    assert(np.allclose(layer.face_color[5], viridis[1], atol=0.02))
+
+def test_drawHistogram():
+    confidence = np.random.default_rng(1).random(1000)
+    widget, layer = getWidget(confidence)
+    widget.thresholdMin = 0.25
+    widget.thresholdMax = 0.75
+    widget.drawHistogram()
+    counts, edges = widget.getHistogram()
+    assert(counts.sum() == 1000)
+    assert(edges[0] == 0 and edges[-1] == 1)
+    assert(widget.background is not None)
+
+    # Moving a threshold neither recomputes the counts nor draws the bars.
+    ax = widget.ax
+    widget.thresholdMin = 0.5
+    widget.drawHistogram()
+    assert(widget.ax is ax)
+    assert(widget.getHistogram()[0] is counts)
+    assert(list(widget.thresholdLines[0].get_xdata()) == [0.5, 0.5])
+
+    # A new histogram range recomputes the counts.
+    widget.histogramMax = 0.5
+    widget.drawHistogram()
+    assert(widget.ax is not ax)
+    assert(widget.getHistogram()[1][-1] == 0.5)
+
+    # The confidences of another layer are drawn again, even if equal.
+    ax = widget.ax
+    widget.confidence = confidence.copy()
+    widget.drawHistogram()
+    assert(widget.ax is not ax)
+
+    # Removing the layer drops the cached histogram with the confidences.
+    widget._on_remove_layer(MagicMock(value=layer))
+    assert(widget.histogramConfidence is None)
+
+def test_applyUpdate():
+    confidence = np.linspace(0, 1, 11)
+    widget, layer = getWidget(confidence)
+    widget.drawHistogram()
+    with patch.object(widget, 'setOutsidePointsBlack') as setOutsidePointsBlack:
+        for value in (1000, 2000, 3000):
+            widget.changeSliderMin(value)
+
+        # The changes are merged into one pending update.
+        assert(widget.updateTimer.isActive())
+        setOutsidePointsBlack.assert_not_called()
+        widget.updateTimer.stop()
+        widget.applyUpdate()
+        setOutsidePointsBlack.assert_called_once_with(layer)
+        assert(widget.thresholdMin == widget.getValueFromSlider(3000, 0, 1))
+
+        # Nothing is recolored if the thresholds didn't change.
+        widget.applyUpdate()
+        setOutsidePointsBlack.assert_called_once()
+
+        # The points of another layer are recolored with the same thresholds.
+        widget.confidence = confidence.copy()
+        widget.applyUpdate()
+        assert(setOutsidePointsBlack.call_count == 2)
+
+    # Changing the histogram range moves the sliders, but keeps the thresholds.
+    widget.thresholdMin = 0.3
+    widget.changeHistogramMax(0.6)
+    assert(widget.thresholdMin == 0.3)
+    assert(widget.sliderMin.value() == widget.getValueInSlider(0.3, 0, 0.6))
+    assert(widget.histogramMaxBox.value() == 0.6)
+
+def test_resetHistogramRange():
+    widget, layer = getWidget(np.array([0.5, 0.25, 0.75]))
+    widget.thresholdMin = 0.3
+    widget.resetHistogramRange()
+
+    # The range is that of the confidences, the thresholds are kept.
+    assert((widget.histogramMin, widget.histogramMax) == (0.25, 0.75))
+    assert(type(widget.histogramMin) is float)
+    assert(widget.thresholdMin == 0.3)
+
+def test_LayerState():
+    confidence = np.array([0.5, 0.25, 0.75])
+    state = LayerState(confidence)
+    assert((state.lowBound, state.highBound) == (0.25, 0.75))
+
+    # The state keeps a read-only copy and no other attributes.
+    confidence[0] = 0
+    assert(state.confidence[0] == 0.5)
+    assert(not state.confidence.flags.writeable)
+    try:
+        state.name = "points"
+        assert(False)
+    except AttributeError:
+        pass
+
+def test_getLayerState():
+    widget, layer = getWidget(np.array([0.5, 0.25, 0.75]))
+    state = widget.getLayerState(layer)
+    assert(widget.getLayerState(layer) is state)
+    widget.changeSliderMax(widget.getValueInSlider(0.6, 0, 1))
+    widget.updateTimer.stop()
+    assert(abs(state.highBound - 0.6) < 0.001)
+
+    # Removing the selected layer deselects it, the state goes with the layer.
+    widget._on_remove_layer(MagicMock(value=layer))
+    assert(widget.selectedPoints is None)
+    del layer, state
+    gc.collect()
+    assert(len(widget.layerStates) == 0)
+
+if __name__ == '__main__':
+    test_getColorIndices()
+    test_setOutsidePointsBlack()
+    test_drawHistogram()
+    test_applyUpdate()
+    test_resetHistogramRange()
+    test_LayerState()
+    test_getLayerState()
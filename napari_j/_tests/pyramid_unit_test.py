@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+if __name__ == '__main__':
+    from pyramid import buildPyramid, downsample, getLevelCount, scaleVoxelSize
+else:
+    from ..pyramid import buildPyramid, downsample, getLevelCount, scaleVoxelSize
+
+
+def test_downsample():
+    data = np.arange(2 * 4 * 5, dtype=np.uint16).reshape(2, 4, 5)
+    out = downsample(data, 2, [1, 2])
+
+    # The blocks of 2x2 pixels are averaged, the last column is dropped.
+    assert(out.shape == (2, 2, 2))
+    assert(out.dtype == np.uint16)
+    assert(out[0, 0, 0] == round(np.mean([0, 1, 5, 6])))
+    assert(out[1, 1, 1] == round(np.mean([32, 33, 37, 38])))
+
+    # An axis shorter than the factor is reduced to one pixel.
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        out = downsample(data.astype(np.float32), 4, [0, 1, 2], executor)
+    assert(out.shape == (1, 1, 1))
+    assert(out[0, 0, 0] == np.mean(data[:, :, 0:4]))
+
+def test_buildPyramid():
+    data = np.ones((3, 64, 40), dtype=np.float32)
+    assert(getLevelCount(data.shape, [1, 2], 16) == 3)
+    done = []
+    levels = buildPyramid(data, [1, 2], 16, lambda k, level: done.append(k), 2)
+
+    # The coarsest level is computed first.
+    assert(done == [2, 1])
+    assert(levels[0] is data)
+    assert(levels[1].shape == (3, 32, 20))
+    assert(levels[2].shape == (3, 16, 10))
+    assert(scaleVoxelSize([2.5, 1, 1], data.shape, levels[2].shape) == [2.5, 4, 4])
+
+if __name__ == '__main__':
+    test_downsample()
+    test_buildPyramid()
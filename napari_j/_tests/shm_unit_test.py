@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import os
+import subprocess
+import sys
+import tempfile
+import numpy as np
+if __name__ == '__main__':
+    from shm import SharedArray, decodeHeader, encodeHeader, publish
+else:
+    from ..shm import SharedArray, decodeHeader, encodeHeader, publish
+
+# A stand-in for FIJI: another process that publishes a segment, writing the
+# header by hand, and keeps it until a line is read from its stdin.
+PRODUCER = """
+import json, struct, sys
+from multiprocessing import shared_memory
+import numpy as np
+data = np.arange(2 * 3 * 4, dtype='<u2').reshape(2, 1, 3, 4)
+text = json.dumps({'dtype': '<u2', 'shape': list(data.shape), 'title': 'blobs'}).encode()
+offset = (8 + len(text) + 63) // 64 * 64
+segment = shared_memory.SharedMemory(create=True, size=offset + data.nbytes)
+segment.buf[0:8] = b'NPJ1' + struct.pack('<I', len(text))
+segment.buf[8:8 + len(text)] = text
+segment.buf[offset:offset + data.nbytes] = data.tobytes()
+print(segment.name, flush=True)
+sys.stdin.readline()
+segment.close()
+segment.unlink()
+"""
+
+
+def test_header():
+    header = encodeHeader(np.float32, (2, 3), title='blobs')
+    description, offset = decodeHeader(header)
+
+    # The pixels start at the next multiple of 64 bytes.
+    assert(offset == len(header))
+    assert(offset % 64 == 0)
+    assert(description == {'title': 'blobs', 'dtype': '<f4', 'shape': [2, 3]})
+
+def test_SharedArrayFromProcess():
+    producer = subprocess.Popen([sys.executable, '-c', PRODUCER], text=True,
+                                stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+    try:
+        name = producer.stdout.readline().strip()
+        shared = SharedArray(name)
+        assert(shared.description['title'] == 'blobs')
+        assert(shared.array.shape == (2, 1, 3, 4))
+        assert(shared.array.dtype == np.uint16)
+        assert(shared.array[1, 0, 2, 3] == 23)
+
+        # The array is backed by the segment, not a copy.
+        assert(not shared.array.flags.owndata)
+        shared.close()
+    finally:
+        producer.communicate('\n', timeout=30)
+    assert(producer.returncode == 0)
+
+def test_SharedArrayFromFile():
+    data = np.arange(12, dtype=np.float32).reshape(3, 4)
+    with tempfile.TemporaryDirectory() as folder:
+        path = publish(data, path=os.path.join(folder, 'image'), unit='micron')
+        shared = SharedArray(path)
+        assert((shared.array == data).all())
+        assert(shared.description['unit'] == 'micron')
+        assert(isinstance(shared.array.base, np.memmap))
+        shared.close()
+
+def test_publish():
+    segment = publish(np.ones((2, 2), dtype=np.uint8), title='blobs')
+    try:
+        description, offset = decodeHeader(segment.buf)
+        assert(description['shape'] == [2, 2])
+        assert(bytes(segment.buf[offset:offset + 4]) == b'\x01' * 4)
+    finally:
+        segment.close()
+        segment.unlink()
+
+if __name__ == '__main__':
+    test_header()
+    test_SharedArrayFromProcess()
+    test_SharedArrayFromFile()
+    test_publish()
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import numpy as np
+if __name__ == '__main__':
+    from surfaces import SurfaceSeries
+else:
+    from ..surfaces import SurfaceSeries
+
+
+def readFrame(frame):
+    """
+    A triangle per frame, moved by the frame along x.
+    """
+    vertices = np.array([[0, 0, 0], [0, 1, 0], [0, 0, 1]], dtype=np.float64) + [0, 0, frame]
+    return vertices, np.array([[0, 1, 2]]), np.full(3, 7, dtype=np.float32)
+
+def test_getLayerData():
+    read = []
+    series = SurfaceSeries(lambda frame: read.append(frame) or readFrame(frame), 5)
+    vertices, faces, values = series.getLayerData(2)
+
+    # The mesh of the frame is at its time point, two unconnected vertices
+    # give the layer the extent of the whole series.
+    assert(vertices.shape == (5, 4))
+    assert((vertices[:3, 0] == 2).all())
+    assert((vertices[3:, 0] == [0, 4]).all())
+    assert(faces.max() < 3)
+    assert(len(values) == 5)
+
+    # Only the displayed frame has been read.
+    assert(read == [2])
+    series.getLayerData(2)
+    assert(read == [2])
+
+def test_cache():
+    series = SurfaceSeries(readFrame, 10, cacheSize=2, prefetch=0)
+    for frame in (0, 1, 0, 2):
+        series.getFrame(frame)
+
+    # The least recently used frame is evicted.
+    assert(series.isCached(0))
+    assert(not series.isCached(1))
+    assert(series.isCached(2))
+
+def test_prefetch():
+    series = SurfaceSeries(readFrame, 3, cacheSize=4, prefetch=1)
+    series.prefetch(0)
+    for future in series.futures:
+        future.result()
+
+    # The next frame is read ahead, there is none before the first.
+    assert(series.isCached(1))
+    assert(len(series.futures) == 1)
+    series.shutdown()
+    assert(not series.isCached(1))
+
+if __name__ == '__main__':
+    test_getLayerData()
+    test_cache()
+    test_prefetch()
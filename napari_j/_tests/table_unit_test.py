@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+from unittest.mock import MagicMock, patch
+import numpy as np
+if __name__ == '__main__':
+    from table import findHeading, getHeadings, readColumn, readColumns, writeColumns
+else:
+    from ..table import findHeading, getHeadings, readColumn, readColumns, writeColumns
+
+
+class TableMock:
+    """
+        A stand-in for a ResultsTable that shows row numbers, its columns
+        are numpy arrays instead of java double[].
+    """
+
+    def __init__(self, columns):
+        self.columns = columns
+        self.headings = list(columns.keys())
+
+    def getColumnHeadings(self):
+        return " \t" + "\t".join(self.headings)
+
+    def getColumnIndex(self, heading):
+        return self.headings.index(heading) if heading in self.headings else -1
+
+    def getColumnAsDoubles(self, index):
+        return self.columns[self.headings[index]]
+
+    def size(self):
+        return len(self.columns[self.headings[0]])
+
+
+def getTable():
+    return TableMock({'X': np.array([1.0, 2.0]), 'Y': np.array([3.0, 4.0]),
+                      'Z': np.array([5.0, 6.0]), 'Confidence': np.array([0.5, 0.25])})
+
+def test_getHeadings():
+    table = getTable()
+    headings = getHeadings(table)
+    assert(headings == ['X', 'Y', 'Z', 'Confidence'])
+    assert(findHeading(headings, ["V", "Confidence"]) == "Confidence")
+    assert(findHeading(headings, ["V"]) is None)
+
+def test_readColumn():
+    table = getTable()
+    column = readColumn(table, 'Confidence')
+    assert(column.dtype == np.float64)
+    assert((column == [0.5, 0.25]).all())
+
+    # The column is copied, it doesn't share the memory of the table.
+    column[0] = 1
+    assert(table.columns['Confidence'][0] == 0.5)
+    try:
+        readColumn(table, 'V')
+        assert(False)
+    except KeyError:
+        pass
+
+def test_readColumns():
+    data = readColumns(getTable(), ['X', 'Y', 'Z'])
+    assert(data.shape == (2, 3))
+    assert((data[1] == [2, 4, 6]).all())
+
+@patch('jpype.JArray', lambda type: lambda values: values.copy())
+def test_writeColumns():
+    table = MagicMock()
+    coords = np.arange(6, dtype=np.float32).reshape(2, 3)
+    writeColumns(table, {'X': coords[:, 2], 'V': [1, 0.5]})
+
+    # One call per column, with contiguous doubles.
+    assert(table.setValues.call_count == 2)
+    heading, values = table.setValues.call_args_list[0][0]
+    assert(heading == 'X')
+    assert(values.dtype == np.float64)
+    assert((values == [2, 5]).all())
+    assert((table.setValues.call_args_list[1][0][1] == [1, 0.5]).all())
+
+if __name__ == '__main__':
+    test_getHeadings()
+    test_readColumn()
+    test_readColumns()
+    test_writeColumns()
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+from unittest.mock import MagicMock
+import numpy as np
+def test_packRGB():
+    rgba = np.zeros((2, 3, 4), dtype=np.uint8)
+    rgba[0, 1] = [0x12, 0x34, 0x56, 0]
+    rgba[1, 2] = [255, 0, 1, 255]
+    pixels = packRGB(rgba)
+
+    # The pixels are packed as 0xffRRGGBB, whatever the alpha value.
+    assert(pixels.shape == (2, 3))
+    assert(pixels.dtype == np.int32)
+    assert(pixels[0, 1] == np.uint32(0xff123456).view(np.int32))
+    assert(pixels[1, 2] == np.uint32(0xffff0001).view(np.int32))
+    assert(pixels[0, 0] == np.uint32(0xff000000).view(np.int32))
+
+if __name__ == '__main__':
+    from transfer import allocate, getDtype, getIJDtype, getLabelsDtype, packRGB, readPlane, readStack
+else:
+    from ..transfer import allocate, getDtype, getIJDtype, getLabelsDtype, packRGB, readPlane, readStack
+
+
+def getImage(bitDepth, planes):
+    imageMock = MagicMock()
+    imageMock.getDimensions.return_value = [3, 2, 1, len(planes), 1]
+    imageMock.getBitDepth.return_value = bitDepth
+    imageMock.getStackIndex.side_effect = lambda c, z, t: z
+    stackMock = MagicMock()
+    stackMock.getPixels.side_effect = lambda index: planes[index - 1]
+    imageMock.getStack.return_value = stackMock
+    return imageMock
+
+def test_getDtype():
+    assert(getDtype(getImage(8, [])) == np.uint8)
+    assert(getDtype(getImage(16, [])) == np.uint16)
+    assert(getDtype(getImage(32, [])) == np.float32)
+
+def test_getLabelsDtype():
+    assert(getLabelsDtype(255) == np.uint8)
+    assert(getLabelsDtype(256) == np.uint16)
+    assert(getLabelsDtype(70000) == np.uint32)
+
+def test_getIJDtype():
+    assert(getIJDtype(np.zeros(3, dtype=np.bool_)) == np.uint8)
+    assert(getIJDtype(np.zeros(3, dtype=np.uint16)) == np.uint16)
+
+    # Integers that fit into 16 bits don't need a float image.
+    assert(getIJDtype(np.array([0, 1000], dtype=np.int64)) == np.uint16)
+    assert(getIJDtype(np.array([-1, 1000], dtype=np.int64)) == np.float32)
+    assert(getIJDtype(np.zeros(3, dtype=np.float64)) == np.float32)
+
+def test_readPlane():
+    # Java bytes are signed, the pixels must be reinterpreted as unsigned.
+    stack = MagicMock()
+    stack.getPixels.return_value = np.array([-1, 0, -128, 0, 64, 32], dtype=np.int8)
+    out = np.zeros((2, 3), dtype=np.uint8)
+    readPlane(stack, 1, out)
+    expected = np.array([[255, 0, 128], [0, 64, 32]], dtype=np.uint8)
+    assert((out == expected).all())
+    stack.getPixels.assert_called_once_with(1)
+
+def test_readStack():
+    planes = [np.array([1, 2, 3, 4, 5, 6], dtype=np.int16),
+              np.array([-1, 8, 9, 10, 11, 12], dtype=np.int16)]
+    pixels = readStack(getImage(16, planes))
+
+    # The planes are stacked in the order of the stack with the native dtype.
+    assert(pixels.dtype == np.uint16)
+    assert(pixels.shape == (2, 2, 3))
+    assert(pixels[1, 0, 0] == 65535)
+    assert(pixels[1, 1, 2] == 12)
+
+def test_readStackHyperstack():
+    # Two channels and two frames, stored in the stack in the order t, c.
+    image = getImage(8, [np.full(6, index, dtype=np.int8) for index in range(1, 5)])
+    image.getDimensions.return_value = [3, 2, 2, 1, 2]
+    image.getStackIndex.side_effect = lambda c, z, t: (c - 1) * 2 + t
+    pixels = readStack(image)
+
+    # The planes are returned in the order c, z, t.
+    assert(list(pixels[:, 0, 0]) == [1, 3, 2, 4])
+
+    # The image is only read.
+    image.setDimensions.assert_not_called()
+    image.setStack.assert_not_called()
+
+def test_readStackStreaming(tmp_path):
+    planes = [np.array([1, 2, 3, 4, 5, 6], dtype=np.int8),
+              np.array([7, 8, 9, 10, 11, 12], dtype=np.int8)]
+    out = allocate((2, 2, 3), np.uint8, memmapDir=str(tmp_path))
+    calls = []
+    pixels = readStack(getImage(8, planes), out, lambda done, total: calls.append((done, total)))
+
+    # The pixels are written into the memory-mapped array passed in.
+    assert(isinstance(pixels, np.memmap))
+    assert(pixels is out)
+    assert(pixels[1, 1, 2] == 12)
+
+    # The progress is reported after each plane.
+    assert(calls == [(1, 2), (2, 2)])
+
+if __name__ == '__main__':
+    import tempfile
+    test_getDtype()
+    test_getLabelsDtype()
+    test_getIJDtype()
+    test_readPlane()
+    test_readStack()
+    test_readStackHyperstack()
+    test_readStackStreaming(tempfile.mkdtemp())
+    test_packRGB()
@@ -1,6 +1,9 @@
 import yaml
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import pandas as pd
 # import pymeshlab
+import os
+import tempfile
 from os import listdir
 from os.path import isfile, join
 from jpype import *
@@ -9,11 +12,23 @@ from jpype.types import *
 import numpy as np
 from ij.measure import ResultsTable
 from ij import IJ, ImagePlus, WindowManager
-from ij.plugin import HyperStackConverter
+from napari.layers import Image as ImageLayer
+from napari.utils.notifications import show_warning
 from napari.utils.colormaps import * 
 from napari.utils.colormaps.colormap_utils import * 
 from vispy.color import Colormap, get_colormap
 from .config import Config
+from .transfer import allocate, getDtype, getIJDtype, getLabelsDtype, getStackIndices, hashPlanes, \
+    isVirtual, packRGB, readPlane, readStack, toJavaArray, attachThread
+from .lazy import LazyImage, PlaneCache, Prefetcher
+from .cache import ChangeTracker, TransferCache, getReadOnlyView
+from .pyramid import buildPyramid
+from .shm import SharedArray
+from .mesh import combineMeshes, decimate, getCategoricalColors, getLevelsOfDetail, getVisibleFaces, \
+    splitMeshes
+from .surfaces import SurfaceSeries
+from .movie import MovieRecorder, getRotationStates, getTimeStates, getViewState, setViewState
+from .table import findHeading, getHeadings, readColumn, readColumns, writeColumns
 
 
 class Bridge:
@@ -21,6 +36,7 @@ class Bridge:
         The Bridge allows napari to communicate with ImageJ.
     """
     colors = ['magenta', 'cyan', 'yellow', 'red', 'green', 'blue', 'orange', 'brown', 'white']
+    highlightColor = [1, 1, 1, 1]
 
     def __init__(self, viewer):
         """
@@ -36,84 +52,919 @@ class Bridge:
         None.
         """
         self.viewer = viewer
+        self.config = None
+        self.planeCache = None
+        self.prefetcher = None
+        self.transferCache = None
+        self.sharedArrays = {}
+        self.pendingUnlinks = []
+        self.planeTracking = False
 
-    def getActiveImageFromIJ(self):
+    def getConfig(self):
+        """
+        Answer the settings of napari-j, read when first needed.
+
+        Returns
+        -------
+        config : napari_j.config.Config
+            The settings of napari-j.
+        """
+        if not self.config:
+            self.config = Config()
+        return self.config
+
+    def getPlaneCache(self):
+        """
+        Answer the cache of the planes of lazily displayed images. Its size
+        is the plane cache size in MB of the settings. The planes of an image
+        are dropped when the ChangeTracker of the transfer cache reports an
+        update of the image.
+
+        Returns
+        -------
+        cache : napari_j.lazy.PlaneCache
+            The cache shared by all lazy images of the bridge.
+        """
+        if not self.planeCache:
+            maxBytes = self.getConfig().planeCacheSize * 1024 * 1024
+            self.planeCache = PlaneCache(maxBytes, self.getTransferCache().tracker)
+        return self.planeCache
+
+    def getPrefetcher(self):
+        """
+        Answer the prefetcher that reads the planes next to the displayed
+        planes of lazy images ahead of time. The number of planes read on
+        each side is the prefetch depth of the settings.
+
+        Returns
+        -------
+        prefetcher : napari_j.lazy.Prefetcher
+            The prefetcher shared by all lazy images of the bridge.
+        """
+        if not self.prefetcher:
+            self.prefetcher = Prefetcher(self.getConfig().prefetchDepth)
+        return self.prefetcher
+
+    def getTransferCache(self):
+        """
+        Answer the cache of the pixels transferred from ImageJ. Its size in
+        MB and its number of entries are taken from the settings. When the
+        JVM is running, a ChangeTracker counts the updates of the images.
+
+        Returns
+        -------
+        cache : napari_j.cache.TransferCache
+            The cache of the bridge.
+        """
+        if not self.transferCache:
+            config = self.getConfig()
+            tracker = None
+            if isJVMStarted():
+                tracker = ChangeTracker()
+                tracker.start()
+            self.transferCache = TransferCache(config.transferCacheSize * 1024 * 1024,
+                                               config.transferCacheEntries,
+                                               tracker)
+        return self.transferCache
+
+    def getActiveImageFromIJ(self, lazy=False, pyramid=False, image=None):
         """
         Removes all layers from the viewer. Gets the active image from ImageJ
         and add it's channels as image-layers to the viewer.
-        
+
+        Parameters
+        ----------
+        lazy : bool, optional
+            If True, the channels are added as lazy arrays backed by the
+            stack in ImageJ, from which only the displayed planes are read.
+        pyramid : bool, optional
+            If True, the channels are added as multiscale image-layers.
+            Ignored for lazy channels and virtual stacks.
+        image : ij.ImagePlus, optional
+            The image to get instead of the active image.
+
         Returns
         -------
         None.
         """
-        for c in range(0, len(self.viewer.layers)):
-            self.viewer.layers.pop(0)
-        title, dims, voxelSize, unit, pixels = self.getPixelsFromImageJ()
-        if dims[3]==1:
-            voxelSize = (voxelSize[1], voxelSize[2])
-        for c in range(0, dims[2]):
-            data = pixels.reshape(
-                    dims[4], dims[3], dims[2], dims[1], dims[0])[:, :, c, :, :]
-            while data.shape[0] == 1:
-                data = np.squeeze(data, axis=0)    
-            self.viewer.add_image(
-                data, 
-                name = "C" + str(c + 1) + "-" + str(title),
-                colormap = self.colors[c],
-                blending = 'additive',
-                scale = voxelSize)
+        self.removeAllLayers()
+        title, dims, voxelSize, unit, channels = self.fetchImage(image, lazy=lazy)
+        for c, data in enumerate(channels):
+            if pyramid and not isinstance(data, LazyImage):
+                self.addChannel(c, self.getPyramid(data, dims), title, dims, voxelSize,
+                                multiscale=True)
+            else:
+                self.addChannel(c, data, title, dims, voxelSize)
         self.viewer.scale_bar.unit = unit
         self.viewer.dims.ndisplay = 3
 
-    def getLabelsFromIJ(self):
+    def fetchImage(self, image=None, lazy=False, progress=None, channelDone=None):
+        """
+        Get an image from ImageJ without touching the viewer, so that it
+        can be called from a worker thread. The thread is attached to the
+        JVM.
+
+        Parameters
+        ----------
+        image : ij.ImagePlus, optional
+            The image to fetch, by default the active image.
+        lazy : bool, optional
+            If True, the channels are answered as lazy arrays backed by the
+            stack in ImageJ. Virtual stacks are always answered as lazy
+            arrays, whose planes are read from disk when they are displayed.
+        progress : callable, optional
+            Called as progress(done, total) after each plane has been read.
+            It can raise napari_j.transfer.TransferCancelled to stop the
+            transfer.
+        channelDone : callable, optional
+            Called as channelDone(c, data, title, dims, voxelSize) as soon as
+            the data of the channel c is complete.
+
+        Returns
+        -------
+        title : java.lang.String
+            The title of the image.
+        dims : list
+            A list [x,y,c,z,t] of the size in each dimension of the image.
+        voxelSize : list
+            A list of the voxel sizes in the order z, y, x.
+        unit : string
+            The unit string, for example nm, micrometer or cm.
+        channels : list
+            The data of the channels, with the dimensions t, z, y, x without
+            the leading dimensions of size one.
+        """
+        attachThread()
+        if image is None:
+            image = IJ.getImage()
+        title, dims, voxelSize, unit, size = self.getMetadataFromImage(image)
+        if lazy or isVirtual(image):
+            cache = self.getPlaneCache()
+            prefetcher = self.getPrefetcher()
+            channels = [LazyImage(image, c, cache, prefetcher=prefetcher) for c in range(0, dims[2])]
+            if channelDone:
+                for c, data in enumerate(channels):
+                    channelDone(c, data, title, dims, voxelSize)
+            return title, dims, voxelSize, unit, channels
+        onChannelRead = None
+        if channelDone:
+            onChannelRead = lambda c, pixels: channelDone(
+                c, self.getChannel(pixels, dims, c), title, dims, voxelSize)
+        title, dims, voxelSize, unit, pixels = self.getPixelsFromImageJ(progress, onChannelRead, image)
+        channels = [self.getChannel(pixels, dims, c) for c in range(0, dims[2])]
+        return title, dims, voxelSize, unit, channels
+
+    def displaySharedImage(self, name, unlink=False):
+        """
+        Removes all layers from the viewer and adds the channels of an image
+        published as a shared memory segment or file by another process, as
+        the FIJI script image_to_napari_shm.py does. The layers are backed
+        by the shared memory, the pixels are not copied. The mapping is
+        released when the layers have been removed from the viewer.
+
+        Parameters
+        ----------
+        name : str
+            The name of the segment or the path of the file. The array has
+            the dimensions t, z, c, y, x, leading dimensions can be omitted.
+        unlink : bool, optional
+            If True, the segment or file is removed, so that its memory is
+            freed once the layers are deleted. On posix systems it is
+            removed at once, elsewhere, where a mapped file can't be
+            removed, when the layers are released.
+
+        Returns
+        -------
+        None.
+        """
+        self.removeAllLayers()
+        shared = SharedArray(name)
+        if unlink and os.name == 'posix':
+            shared.unlink()
+            unlink = False
+        description = shared.description
+        t, z, c, h, w = ([1] * 5 + list(shared.array.shape))[-5:]
+        dims = [w, h, c, z, t]
+        title = description.get('title', name)
+        voxelSize = description.get('voxelSize', [1, 1, 1])
+        layers = [self.addChannel(channel, self.getChannel(shared.array, dims, channel), title, dims, voxelSize)
+                  for channel in range(0, c)]
+        if not self.sharedArrays and not self.pendingUnlinks:
+            self.viewer.layers.events.removed.connect(self.releaseSharedImages)
+        self.sharedArrays[name] = (shared, layers, unlink)
+        self.viewer.scale_bar.unit = description.get('unit', 'pixel')
+        self.viewer.dims.ndisplay = 3
+
+    def releaseSharedImages(self, event=None):
         """
-        Adds the active image in ImageJ as a new labels-layer to the viewer.
+        Drop the mappings of the shared images none of whose layers is in
+        the viewer any longer, so that their memory is freed as soon as the
+        arrays are no longer used. Files that couldn't be removed while
+        they were mapped are removed, if FIJI has released them too. Those
+        that are still in use are tried again at the next release.
+
+        Parameters
+        ----------
+        event : napari.utils.events.Event, optional
+            The event of the removed layer.
 
         Returns
         -------
         None.
         """
-        title, dims, voxelSize, unit, pixels = self.getPixelsFromImageJ()
-        if dims[3] == 1:
-            voxelSize = (voxelSize[1], voxelSize[2])
+        released = [name for name, (shared, layers, unlink) in self.sharedArrays.items()
+                    if not any(layer in self.viewer.layers for layer in layers)]
+        for name in released:
+            shared, layers, unlink = self.sharedArrays.pop(name)
+            try:
+                shared.close()
+            except BufferError:
+                # Arrays of the segment are still referenced, it is unmapped
+                # when they are deleted.
+                pass
+            if unlink:
+                self.pendingUnlinks.append((name, shared))
+        pending = []
+        for name, shared in self.pendingUnlinks:
+            try:
+                shared.unlink()
+            except OSError:
+                if name in released:
+                    show_warning("The shared image " + name + " is still in use and can't be removed yet")
+                pending.append((name, shared))
+        removed = len(pending) < len(self.pendingUnlinks)
+        self.pendingUnlinks = pending
+        if (released or removed) and not self.sharedArrays and not self.pendingUnlinks:
+            self.viewer.layers.events.removed.disconnect(self.releaseSharedImages)
+
+    def getAllImagesFromIJ(self):
+        """
+        Removes all layers from the viewer. Gets all open images from
+        ImageJ and add their channels as image-layers to the viewer.
+
+        Returns
+        -------
+        None.
+        """
+        self.removeAllLayers()
+        for title, dims, voxelSize, unit, channels in self.fetchAllImages():
+            for c, data in enumerate(channels):
+                self.addChannel(c, data, title, dims, voxelSize)
+            self.viewer.scale_bar.unit = unit
+        self.viewer.dims.ndisplay = 3
+
+    def fetchAllImages(self, progress=None, imageDone=None):
+        """
+        Get all open images from ImageJ concurrently, on a pool of threads
+        attached to the JVM, whose size is the number of workers of the
+        settings. The images are copied as long as their total size stays
+        within the memory budget of the settings, the remaining images are
+        answered as lazy arrays. Like fetchImage, it doesn't touch the
+        viewer.
+
+        Parameters
+        ----------
+        progress : callable, optional
+            Called as progress(done, total) with the number of transferred
+            images, while the images are read. It can raise
+            napari_j.transfer.TransferCancelled to stop the transfer.
+        imageDone : callable, optional
+            Called as imageDone(result) as soon as an image has been fetched,
+            with the result answered by fetchImage.
+
+        Returns
+        -------
+        results : list
+            The results of fetchImage for the images in the order of their
+            IDs in the WindowManager.
+        """
+        imageIDs = WindowManager.getIDList()
+        if not imageIDs:
+            return []
+        images = [WindowManager.getImage(imageID) for imageID in imageIDs]
+        config = self.getConfig()
+        budget = config.memoryBudget * 1024 * 1024
+        lazy = []
+        for image in images:
+            nbytes = image.getSizeInBytes()
+            lazy.append(nbytes > budget or isVirtual(image))
+            if not lazy[-1]:
+                budget = budget - nbytes
+        # The caches and the prefetcher are created before the threads, which
+        # would otherwise each create their own.
+        self.getTransferCache()
+        self.getPlaneCache()
+        self.getPrefetcher()
+        done = [0]
+        planeProgress = None
+        if progress:
+            planeProgress = lambda plane, total: progress(done[0], len(images))
+        results = [None] * len(images)
+        with ThreadPoolExecutor(max_workers=config.workers, initializer=attachThread) as executor:
+            futures = {executor.submit(self.fetchImage, image, lazy[index], planeProgress): index
+                       for index, image in enumerate(images)}
+            try:
+                for future in as_completed(futures):
+                    results[futures[future]] = future.result()
+                    done[0] = done[0] + 1
+                    if imageDone:
+                        imageDone(results[futures[future]])
+                    if progress:
+                        progress(done[0], len(images))
+            except BaseException:
+                for future in futures:
+                    future.cancel()
+                raise
+        return results
+
+    def getChannel(self, pixels, dims, c):
+        """
+        Answer a view of one channel of the pixels of an image.
+
+        Parameters
+        ----------
+        pixels : numpy.ndarray
+            The pixel data as a linear list, as answered by
+            getPixelsFromImageJ.
+        dims : list
+            A list [x,y,c,z,t] of the size in each dimension of the image.
+        c : int
+            The channel, starting at 0.
+
+        Returns
+        -------
+        data : numpy.ndarray
+            The channel with the dimensions t, z, y, x without the leading
+            dimensions of size one.
+        """
         data = pixels.reshape(
-            dims[4], dims[3], dims[2], dims[1], dims[0])[:, :, 0, :, :].astype(int)
+                dims[4], dims[3], dims[2], dims[1], dims[0])[:, :, c, :, :]
         while data.shape[0] == 1:
             data = np.squeeze(data, axis=0)
+        return data
+
+    def getPyramid(self, data, dims, levelDone=None):
+        """
+        Compute the levels of a multiscale pyramid of one channel of an
+        image, on as many threads as the number of workers of the settings.
+        The spatial dimensions are halved from one level to the next, until
+        the biggest of them is smaller than twice the pyramid min size of
+        the settings. The coarsest level is computed first.
+
+        Parameters
+        ----------
+        data : numpy.ndarray
+            The data of the channel as answered by getChannel.
+        dims : list
+            A list [x,y,c,z,t] of the size in each dimension of the image.
+        levelDone : callable, optional
+            Called as levelDone(k, level) as soon as the level k is computed.
+
+        Returns
+        -------
+        levels : list
+            The levels from the full resolution data to the coarsest level.
+        """
+        spatialDims = 2 if dims[3] == 1 else 3
+        axes = list(range(data.ndim - spatialDims, data.ndim))
+        config = self.getConfig()
+        return buildPyramid(data, axes, config.pyramidMinSize, levelDone, config.workers)
+
+    def addChannel(self, c, data, title, dims, voxelSize, multiscale=False):
+        """
+        Add one channel of an image as an image-layer to the viewer.
+
+        Parameters
+        ----------
+        c : int
+            The channel, starting at 0.
+        data : numpy.ndarray or napari_j.lazy.LazyImage or list
+            The data of the channel as answered by getChannel or the levels
+            answered by getPyramid.
+        title : java.lang.String
+            The title of the image.
+        dims : list
+            A list [x,y,c,z,t] of the size in each dimension of the image.
+        voxelSize : list
+            A list of the voxel sizes in the order z, y, x.
+        multiscale : bool, optional
+            If True, data is the list of the levels of a pyramid.
+
+        Returns
+        -------
+        layer : napari.layers.Image
+            The new layer.
+        """
+        if dims[3]==1:
+            voxelSize = (voxelSize[1], voxelSize[2])
+        contrastLimits = None
+        if isinstance(data, LazyImage):
+            contrastLimits = data.getContrastLimits()
+        return self.viewer.add_image(
+            data, 
+            name = "C" + str(c + 1) + "-" + str(title),
+            colormap = self.colors[c],
+            blending = 'additive',
+            contrast_limits = contrastLimits,
+            multiscale = multiscale,
+            scale = voxelSize)
+
+    def removeAllLayers(self):
+        """
+        Remove all layers from the viewer.
+
+        Returns
+        -------
+        None.
+        """
+        for c in range(0, len(self.viewer.layers)):
+            self.viewer.layers.pop(0)
+
+    def syncImageFromIJ(self, image=None, fetch=True):
+        """
+        Update the layers of an image previously fetched with
+        getActiveImageFromIJ with the planes that have changed in ImageJ.
+        The changed planes are found by comparing the hash codes of the
+        pixel arrays of the planes, computed in the JVM, with those from
+        the last transfer. The hash codes are only computed by transfers
+        while planeTracking is on, otherwise by the first synchronization
+        of an unchanged image. Only these planes are read, into a copy of
+        the cached pixels, since the arrays answered before must not
+        change. The copy replaces the data of the layers. If the image
+        can't be synchronized, for example because its dimensions have
+        changed, it is fetched again.
+
+        Parameters
+        ----------
+        image : ij.ImagePlus, optional
+            The image to synchronize, by default the active image.
+        fetch : bool, optional
+            If False, an image that can't be synchronized is left as it is.
+
+        Returns
+        -------
+        changed : list
+            The indices of the changed planes in the order c, z, t.
+        """
+        if image is None:
+            image = IJ.getImage()
+        title, dims, voxelSize, unit, size = self.getMetadataFromImage(image)
+        cache = self.getTransferCache()
+        entry = cache.getEntry(image.getID())
+        names = ["C" + str(c + 1) + "-" + str(title) for c in range(0, dims[2])]
+        synchronizable = entry is not None \
+            and entry.pixels.dtype == getDtype(image) \
+            and entry.pixels.size == size * dims[2] \
+            and all(name in self.viewer.layers for name in names) \
+            and all(isinstance(self.viewer.layers[name].data, np.ndarray)
+                    and np.may_share_memory(self.viewer.layers[name].data, entry.pixels) for name in names)
+        signature = cache.getSignature(image)
+        if synchronizable and entry.hashes is None:
+            if cache.isCurrent(entry, signature):
+                # The image hasn't changed since it has been read, the hash
+                # codes of its planes are the reference for the next sync.
+                entry.hashes = hashPlanes(image, getStackIndices(image))
+                return []
+            synchronizable = False
+        if not synchronizable:
+            if not fetch:
+                return []
+            self.getActiveImageFromIJ(image=image)
+            return list(range(0, dims[2] * dims[3] * dims[4]))
+        if cache.isCurrent(entry, signature):
+            return []
+        indices = getStackIndices(image)
+        hashes = hashPlanes(image, indices)
+        changed = np.flatnonzero(hashes != entry.hashes)
+        if len(changed) == 0:
+            entry.signature = signature
+            return []
+        planes = self.allocatePixels(entry.pixels.shape, entry.pixels.dtype)
+        planes[...] = entry.pixels
+        stack = image.getStack()
+        for plane in changed:
+            readPlane(stack, indices[plane], planes[plane])
+        cache.put(image, planes, signature, hashes)
+        pixels = getReadOnlyView(planes).reshape(-1)
+        for c in range(0, dims[2]):
+            self.viewer.layers[names[c]].data = self.getChannel(pixels, dims, c)
+        return list(changed)
+
+    def getLabelsFromIJ(self, lazy=False):
+        """
+        Adds the first channel of the active image in ImageJ as a new
+        labels-layer to the viewer. The labels are stored with the smallest
+        unsigned integer type that holds the biggest label.
+
+        Parameters
+        ----------
+        lazy : bool, optional
+            If True, the labels are added as a lazy array backed by the
+            stack in ImageJ, from which only the displayed planes are read.
+            The labels then keep the type of the image or are converted to
+            uint32 for 32-bit images. Virtual stacks are always added as lazy
+            arrays.
+
+        Returns
+        -------
+        None.
+        """
+        image = IJ.getImage()
+        title, dims, voxelSize, unit, size = self.getMetadataFromImage(image)
+        if dims[3] == 1:
+            voxelSize = (voxelSize[1], voxelSize[2])
+        if lazy or isVirtual(image):
+            dtype = getDtype(image)
+            if dtype.kind == 'f':
+                dtype = np.dtype(np.uint32)
+            data = LazyImage(image, 0, self.getPlaneCache(), dtype, self.getPrefetcher())
+        else:
+            indices = getStackIndices(image)[0::dims[2]]
+            pixels = readStack(image, indices=indices)
+            data = pixels.reshape(dims[4], dims[3], dims[1], dims[0])
+            data = data.astype(getLabelsDtype(data.max()), copy=False)
+            while data.shape[0] == 1:
+                data = np.squeeze(data, axis=0)
         self.viewer.add_labels(data, name=str(title), scale=voxelSize)
         self.viewer.scale_bar.unit = unit
 
-    def getSurfacesFromIJ(self):
+    def getSurfacesFromIJ(self, combined=False, budget=None, levels=1):
+        """
+        Add the surfaces of the cells segmented with LimeSeg at the first
+        time point as surface-layers to the viewer, with the scale of the
+        first layer. The meshes can be decimated to a number of triangles
+        per layer and into levels of detail, which are kept in the metadata
+        of the layers, see setSurfaceLevel.
+
+        Parameters
+        ----------
+        combined : bool, optional
+            If True, all cells are added as one surface-layer, see
+            addCombinedSurface, instead of one layer per cell.
+        budget : int, optional
+            The maximal number of triangles of a layer, by default all
+            triangles are kept.
+        levels : int, optional
+            The number of levels of detail, each with a quarter of the
+            triangles of the previous one.
+
+        Returns
+        -------
+        None.
+        """
         from eu.kiaru.limeseg import LimeSeg
-        from eu.kiaru.limeseg.struct import Cell
-        vertices = np.array([])
-        meshes = np.array([])
         zScale = LimeSeg.opt.getOptParam("ZScale")
+        scale = [1, 1, 1]
+        if len(self.viewer.layers) > 0:
+            scale = self.viewer.layers[0].scale
+        meshes = []
+        cellIds = []
         for c in LimeSeg.allCells:
             LimeSeg.currentCell = c
             ct = c.getCellTAt(1)
-            for dot in ct.dots:
-                vector = np.array([dot.pos.z / zScale, dot.pos.y, dot.pos.x])
-                if vertices.size == 0:
-                    vertices = np.array(vector)
-                else:
-                    vertices = np.vstack((vertices, vector))
-            for triangle in ct.triangles:
-                indices = np.array([triangle.id1, triangle.id2, triangle.id3])
-                if meshes.size == 0:
-                    meshes = np.array(indices)
-                else:
-                    meshes = np.vstack((meshes, indices))
-            scale = [1, 1, 1]
-            if len(self.viewer.layers) > 0:
-                scale = self.viewer.layers[0].scale
+            if ct is None:
+                continue
+            vertices, faces = self.getMeshFromCellT(ct, zScale)
+            if combined:
+                meshes.append((vertices, faces))
+                cellIds.append(str(c.id_Cell))
+                continue
+            meshLevels = getLevelsOfDetail(vertices, faces, budget, levels)
             name = "cell " + str(c.id_Cell)
-            surface = self.viewer.add_surface((vertices, meshes), name=name)
+            surface = self.viewer.add_surface(meshLevels[0], name=name,
+                                              metadata={'levels': meshLevels, 'level': 0})
+            surface.scale = scale
+        if meshes:
+            self.addCombinedSurface(meshes, cellIds, scale, budget=budget, levels=levels)
+
+    def addCombinedSurface(self, meshes, cellIds, scale=None, name="cells", budget=None, levels=1):
+        """
+        Add the meshes of many cells as one surface-layer. The value of each
+        vertex is the index of its cell and selects the color of the cell in
+        a categorical colormap. The metadata of the layer holds the index of
+        each cell, the vertex and face ranges of the cells, the faces and
+        values of all cells and the set of hidden cells, which are used by
+        setCellVisible and highlightCell. The budget is shared among the
+        cells in proportion to their number of triangles.
+
+        Parameters
+        ----------
+        meshes : list
+            The meshes of the cells as tuples (vertices, faces).
+        cellIds : list
+            The ids of the cells.
+        scale : list, optional
+            The scale of the layer.
+        name : str, optional
+            The name of the layer.
+        budget : int, optional
+            The maximal number of triangles of the layer, by default all
+            triangles are kept.
+        levels : int, optional
+            The number of levels of detail.
+
+        Returns
+        -------
+        layer : napari.layers.Surface
+            The new layer.
+        """
+        total = sum(len(faces) for vertices, faces in meshes)
+        cellLevels = []
+        for vertices, faces in meshes:
+            cellBudget = None
+            if budget is not None:
+                cellBudget = max(budget * len(faces) // max(total, 1), 4)
+            cellLevels.append(getLevelsOfDetail(vertices, faces, cellBudget, levels))
+        meshLevels = [combineMeshes([cell[level] for cell in cellLevels]) for level in range(0, levels)]
+        vertices, faces, values, ranges = meshLevels[0]
+        colormap = self.getCellColormap(len(meshes), name)
+        metadata = {'cells': {cellId: index for index, cellId in enumerate(cellIds)},
+                    'ranges': ranges,
+                    'faces': faces,
+                    'values': values,
+                    'hidden': set(),
+                    'highlighted': None,
+                    'levels': meshLevels,
+                    'level': 0}
+        surface = self.viewer.add_surface((vertices, faces, values), name=name,
+                                          colormap=colormap, contrast_limits=[0, len(meshes) + 1],
+                                          metadata=metadata)
+        if scale is not None:
             surface.scale = scale
+        return surface
+
+    def getCellColormap(self, count, name="cells"):
+        """
+        Answer a categorical colormap for surfaces whose vertex values are
+        the indices of their cells, with the contrast limits [0, count + 1].
+        The value count is displayed in the highlight color.
+
+        Parameters
+        ----------
+        count : int
+            The number of cells.
+        name : str, optional
+            The name of the colormap.
+
+        Returns
+        -------
+        colormap : napari.utils.colormaps.Colormap
+            The colormap.
+        """
+        from napari.utils.colormaps import Colormap as LayerColormap
+        colors = np.vstack((getCategoricalColors(count), self.highlightColor))
+        return LayerColormap(colors, name=name, interpolation='zero',
+                             controls=np.linspace(0, 1, len(colors) + 1))
+
+    def getSurfaceSeriesFromIJ(self, budget=None, cacheSize=8, name="cells"):
+        """
+        Add the surfaces of the cells segmented with LimeSeg at all time
+        points as one 4D surface-layer. The layer only holds the meshes of
+        the frame selected by the time slider, which are read from LimeSeg
+        when the frame is displayed. The frames around it are read ahead
+        and a few frames are cached, see napari_j.surfaces.SurfaceSeries.
+        The series is kept in the metadata of the layer.
+
+        Parameters
+        ----------
+        budget : int, optional
+            The maximal number of triangles of a frame, by default all
+            triangles are kept.
+        cacheSize : int, optional
+            The number of frames kept in memory.
+        name : str, optional
+            The name of the layer.
+
+        Returns
+        -------
+        layer : napari.layers.Surface
+            The new layer.
+        """
+        from eu.kiaru.limeseg import LimeSeg
+        zScale = LimeSeg.opt.getOptParam("ZScale")
+        cells = list(LimeSeg.allCells)
+        frameCount = max([ct.frame for c in cells for ct in c.cellTs], default=1)
+        scale = [1, 1, 1]
+        if len(self.viewer.layers) > 0:
+            scale = self.viewer.layers[0].scale[-3:]
+
+        def readFrame(frame):
+            meshes = []
+            indices = []
+            for index, c in enumerate(cells):
+                ct = c.getCellTAt(frame + 1)
+                if ct is None:
+                    continue
+                meshes.append(self.getMeshFromCellT(ct, zScale))
+                indices.append(index)
+            total = sum(len(faces) for vertices, faces in meshes)
+            if budget is not None:
+                meshes = [decimate(vertices, faces, max(budget * len(faces) // max(total, 1), 4))
+                          for vertices, faces in meshes]
+            vertices, faces, values, ranges = combineMeshes(meshes)
+            values = np.repeat(np.array(indices, dtype=np.float32), ranges[:, 1] - ranges[:, 0])
+            return vertices, faces, values
+
+        series = SurfaceSeries(readFrame, frameCount, cacheSize)
+        frame = self.getCurrentFrame(series)
+        surface = self.viewer.add_surface(series.getLayerData(frame), name=name,
+                                          colormap=self.getCellColormap(len(cells), name),
+                                          contrast_limits=[0, len(cells) + 1],
+                                          metadata={'series': series, 'frame': frame})
+        surface.scale = [1] + list(scale)
+        series.prefetch(frame)
+
+        def onStepChanged(event):
+            if surface not in self.viewer.layers:
+                self.viewer.dims.events.current_step.disconnect(onStepChanged)
+                series.shutdown()
+                return
+            frame = self.getCurrentFrame(series)
+            if frame == surface.metadata['frame']:
+                return
+            surface.metadata['frame'] = frame
+            surface.data = series.getLayerData(frame)
+            series.prefetch(frame)
+
+        self.viewer.dims.events.current_step.connect(onStepChanged)
+        return surface
+
+    def getCurrentFrame(self, series):
+        """
+        Answer the frame selected by the time slider of the viewer, for a
+        4D surface-layer whose first dimension is the time.
+
+        Parameters
+        ----------
+        series : napari_j.surfaces.SurfaceSeries
+            The series displayed by the layer.
+
+        Returns
+        -------
+        frame : int
+            The frame, starting at 0, within the frames of the series.
+        """
+        step = tuple(self.viewer.dims.current_step)
+        if len(step) < 4:
+            return 0
+        return int(min(max(step[-4], 0), series.frameCount - 1))
+
+    def setCellVisible(self, layer, cellId, visible):
+        """
+        Show or hide one cell of a layer added by addCombinedSurface, by
+        removing its faces from the displayed mesh.
+
+        Parameters
+        ----------
+        layer : napari.layers.Surface
+            The layer of the cells.
+        cellId : str
+            The id of the cell.
+        visible : bool
+            True to show the cell, False to hide it.
+
+        Returns
+        -------
+        None.
+        """
+        metadata = layer.metadata
+        index = metadata['cells'][cellId]
+        if visible:
+            metadata['hidden'].discard(index)
+        else:
+            metadata['hidden'].add(index)
+        faces = getVisibleFaces(metadata['faces'], metadata['ranges'], metadata['hidden'])
+        layer.data = (layer.data[0], faces, layer.data[2])
 
+    def highlightCell(self, layer, cellId=None):
+        """
+        Display one cell of a layer added by addCombinedSurface in the
+        highlight color.
 
+        Parameters
+        ----------
+        layer : napari.layers.Surface
+            The layer of the cells.
+        cellId : str, optional
+            The id of the cell, None to remove the highlight.
 
-    def getPixelsFromImageJ(self):
+        Returns
+        -------
+        None.
+        """
+        metadata = layer.metadata
+        metadata['highlighted'] = cellId
+        values = metadata['values']
+        if cellId is not None:
+            start, end = metadata['ranges'][metadata['cells'][cellId], 0:2]
+            values = values.copy()
+            values[start:end] = len(metadata['ranges'])
+        layer.data = (layer.data[0], layer.data[1], values)
+
+    def setSurfaceLevel(self, layer, level):
+        """
+        Display a level of detail of a surface-layer added by
+        getSurfacesFromIJ. Missing levels are built first, see
+        addSurfaceLevels. Hidden and highlighted cells of combined layers
+        stay hidden and highlighted.
+
+        Parameters
+        ----------
+        layer : napari.layers.Surface
+            The layer.
+        level : int
+            The level of detail, 0 for the finest. Levels beyond the coarsest
+            display the coarsest.
+
+        Returns
+        -------
+        None.
+        """
+        metadata = layer.metadata
+        levels = metadata.get('levels')
+        if not levels:
+            return
+        self.addSurfaceLevels(layer, level + 1)
+        level = min(level, len(levels) - 1)
+        if metadata['level'] == level:
+            return
+        metadata['level'] = level
+        if 'cells' not in metadata:
+            layer.data = levels[level]
+            return
+        vertices, faces, values, ranges = levels[level]
+        metadata['faces'] = faces
+        metadata['values'] = values
+        metadata['ranges'] = ranges
+        layer.data = (vertices, getVisibleFaces(faces, ranges, metadata['hidden']), values)
+        if metadata['highlighted'] is not None:
+            self.highlightCell(layer, metadata['highlighted'])
+
+    def addSurfaceLevels(self, layer, count):
+        """
+        Decimate the coarsest level of detail of a surface-layer added by
+        getSurfacesFromIJ into further levels, each with a quarter of the
+        triangles of the previous one, until the layer has count levels or
+        the mesh can't be reduced any further. The cells of combined layers
+        are decimated one by one.
+
+        Parameters
+        ----------
+        layer : napari.layers.Surface
+            The layer.
+        count : int
+            The number of levels needed.
+
+        Returns
+        -------
+        None.
+        """
+        levels = layer.metadata['levels']
+        while len(levels) < count:
+            if 'cells' in layer.metadata:
+                vertices, faces, values, ranges = levels[-1]
+                meshes = [getLevelsOfDetail(*mesh, count=2)[1] for mesh in splitMeshes(vertices, faces, ranges)]
+                level = combineMeshes(meshes)
+            else:
+                level = getLevelsOfDetail(*levels[-1], count=2)[1]
+            if len(level[1]) == len(levels[-1][1]):
+                return
+            levels.append(level)
+
+    def getMeshFromCellT(self, ct, zScale):
+        """
+        Read the mesh of a cell at one time point from LimeSeg. The arrays
+        are allocated from the number of dots and triangles and filled in
+        one pass over each list.
+
+        Parameters
+        ----------
+        ct : eu.kiaru.limeseg.struct.CellT
+            The cell at one time point.
+        zScale : float
+            The ratio of the z-step and the pixel size used by LimeSeg.
+
+        Returns
+        -------
+        vertices : numpy.ndarray
+            The positions of the dots in the order z, y, x, with z in
+            pixels, of shape (dots, 3).
+        faces : numpy.ndarray
+            The indices of the dots of the triangles, of shape
+            (triangles, 3).
+        """
+        nDots = ct.dots.size()
+        nTriangles = ct.triangles.size()
+        positions = (dot.pos for dot in ct.dots)
+        vertices = np.fromiter((value for pos in positions for value in (pos.z, pos.y, pos.x)),
+                               dtype=np.float64, count=3 * nDots).reshape(nDots, 3)
+        vertices[:, 0] /= zScale
+        faces = np.fromiter((index for triangle in ct.triangles
+                             for index in (triangle.id1, triangle.id2, triangle.id3)),
+                            dtype=np.int64, count=3 * nTriangles).reshape(nTriangles, 3)
+        return vertices, faces
+
+    def getPixelsFromImageJ(self, progress=None, channelDone=None, image=None):
         """
         Get the title, dimensions, zFactor and pixel data from the active 
         image in ImageJ. The pixel data is returned as a linear list. Use
@@ -122,6 +973,26 @@ class Bridge:
         
         to get an image with the right order of dimensions for python.
 
+        The image in ImageJ is not modified. If it hasn't changed since it
+        has last been read, the pixels are answered from the transfer cache.
+        Otherwise they are read plane by plane into a new array, allocated
+        by allocatePixels, or into the array of the outdated cache entry if
+        nothing references it anymore. The answered pixels are a read-only
+        view of the array kept by the cache.
+
+        Parameters
+        ----------
+        progress : callable, optional
+            Called as progress(done, total) after each plane has been read.
+            It can raise napari_j.transfer.TransferCancelled to stop the
+            transfer.
+        channelDone : callable, optional
+            Called as channelDone(c, pixels) as soon as all planes of the
+            channel c have been read into pixels. The channels are read one
+            after the other.
+        image : ij.ImagePlus, optional
+            The image to read instead of the active image.
+
         Returns
         -------
         title : java.lang.String
@@ -133,31 +1004,68 @@ class Bridge:
         unit : string
             The unit string, for example nm, micrometer or cm.
         pixels : numpy.ndarray
-            The pixel data of the active image in ImageJ as a linear list.
+            The pixel data of the active image in ImageJ as a linear,
+            read-only list. The dtype is uint8, uint16 or float32 depending
+            on the bit-depth of the image.
         """
-        image = IJ.getImage()
+        if image is None:
+            image = IJ.getImage()
         title, dims, voxelSize, unit, size = self.getMetadataFromImage(image)
-        isHyperStack = image.isHyperStack()
-        HyperStackConverter.toStack(image)
-        stackDims = list(image.getDimensions())
-        dim = stackDims[3]
-        if stackDims[2] == 1 and stackDims[3] == 1 and stackDims[4] > 1:
-            dim = dims[4]
-        if size <= 2147483647: #(2^31)-1
-                pixels = np.array(image.getStack().getVoxels(0, 0, 0, stackDims[0], stackDims[1], dim, []))
-        else:
-                ia = image.getStack().getImageArray()
-                ia = list(filter(None, ia))
-                pixels = np.array(ia)
-        if isHyperStack:
-            self.toHyperstack(image, dims)
-        bitDepth = image.getBitDepth();
-        if bitDepth == 8:
-            pixels = pixels.astype(np.uint8)
-        if bitDepth == 16:
-            pixels = pixels.astype(np.uint16)
-            
+        cache = self.getTransferCache()
+        pixels = cache.get(image)
+        if pixels is not None:
+            pixels = pixels.reshape(-1)
+            if channelDone:
+                for c in range(0, dims[2]):
+                    channelDone(c, pixels)
+            return title, dims, voxelSize, unit, pixels
+        signature = cache.getSignature(image)
+        shape = (dims[2] * dims[3] * dims[4], dims[1], dims[0])
+        out = cache.takeBuffer(image, shape, getDtype(image))
+        if out is None:
+            out = self.allocatePixels(shape, getDtype(image))
+        pixels = getReadOnlyView(out).reshape(-1)
+        indices = getStackIndices(image)
+        planes = out.reshape(dims[4] * dims[3], dims[2], dims[1], dims[0])
+        for c in range(0, dims[2]):
+            channelProgress = None
+            if progress:
+                done = c * len(indices) // dims[2]
+                channelProgress = lambda plane, total: progress(done + plane, len(indices))
+            readStack(image, planes[:, c], channelProgress, indices[c::dims[2]])
+            if channelDone:
+                channelDone(c, pixels)
+        hashes = None
+        if self.planeTracking and cache.tracker and not image.getStack().isVirtual():
+            hashes = hashPlanes(image)
+        cache.put(image, out, signature, hashes)
         return title, dims, voxelSize, unit, pixels
+
+    def allocatePixels(self, shape, dtype):
+        """
+        Allocate the array into which the planes of an image are read.
+        Arrays with more elements than the streaming threshold of the
+        settings are memory-mapped files, in the memmap folder of the
+        settings or, if none is configured, in the temporary folder of the
+        system.
+
+        Parameters
+        ----------
+        shape : tuple
+            The shape of the array.
+        dtype : numpy.dtype
+            The dtype of the array.
+
+        Returns
+        -------
+        out : numpy.ndarray
+            The new, uninitialized array.
+        """
+        config = self.getConfig()
+        memmapDir = None
+        if int(np.prod(shape)) > config.streamingThreshold:
+            memmapDir = config.memmapDir or tempfile.gettempdir()
+        return allocate(shape, dtype, memmapDir)
     
     def getMetadataFromImage(self, image):
         """
@@ -189,67 +1097,200 @@ class Bridge:
         title = image.getShortTitle()
         return title, dims, voxelSize, unit, size
     
-    def toHyperstack(self, image, dims):
+    def layerToIJ(self, layer):
         """
-        Convert image to a hyperstack with the dimensions dims. The number of
-        voxels must be equal to the product of the elements of dims. 
+        Send the data of an image-layer to ImageJ as a new image.
 
         Parameters
         ----------
+        layer : napari.layers.Image
+            The layer whose data is sent to ImageJ.
+
+        Returns
+        -------
         image : ij.ImagePlus
-            The image that will be converted to a hyperstack.
-        dims : list
-            A list [x,y,c,z,t] of the size in each dimension of the image. 
+            The new image in ImageJ.
+        """
+        return self.layersToIJ([layer], str(layer.name))
+
+    def layersToIJ(self, layers=None, title=None):
+        """
+        Send the data of image-layers of the same shape to ImageJ as a new
+        hyperstack, with one channel per layer. The planes are copied in bulk
+        into java arrays. The scale, the unit, the colormaps and the contrast
+        limits of the layers are carried over.
+
+        Parameters
+        ----------
+        layers : list, optional
+            The image-layers to send, by default the selected image-layers.
+            The dimensions of the data are interpreted as [[t,] z,] y, x.
+        title : str, optional
+            The title of the new image, by default the name of the first
+            layer without the channel prefix.
 
         Returns
         -------
-        hyperstack : ij.ImagePlus
-            The hyperstack into which the input image has been converted.
+        image : ij.ImagePlus
+            The new image in ImageJ.
         """
-        hyperstack = HyperStackConverter.toHyperStack(image, dims[2], dims[3], dims[4], "Composite");
-        if hyperstack.getID() == image.getID():
-            image.hide()
-            image.show()
-        else:
-            image.close()
-            hyperstack.show()
-        return hyperstack
-            
+        from ij import ImageStack, CompositeImage
+        from ij.process import LUT
+        if layers is None:
+            layers = [layer for layer in self.viewer.layers.selection
+                      if isinstance(layer, ImageLayer)]
+        if len(layers) == 0:
+            return None
+        if title is None:
+            title = str(layers[0].name)
+            if title.startswith('C1-'):
+                title = title[3:]
+        channels = [np.asarray(layer.data) for layer in layers]
+        shape = channels[0].shape
+        if any(data.shape != shape for data in channels) or not 2 <= len(shape) <= 4:
+            raise ValueError("The layers must be 2D to 4D and have the same shape")
+        dtype = max((getIJDtype(data) for data in channels), key=lambda dtype: dtype.itemsize)
+        channels = [data.reshape((1,) * (4 - len(shape)) + shape) for data in channels]
+        frames, slices, height, width = channels[0].shape
+        stack = ImageStack(width, height)
+        for t in range(0, frames):
+            for z in range(0, slices):
+                for data in channels:
+                    plane = data[t, z].astype(dtype, copy=False)
+                    stack.addSlice("", toJavaArray(plane))
+        image = ImagePlus(title, stack)
+        image.setDimensions(len(channels), slices, frames)
+        if len(channels) > 1:
+            image = CompositeImage(image, CompositeImage.COMPOSITE)
+        for c, layer in enumerate(layers):
+            colors = layer.colormap.map(np.linspace(0, 1, 256))
+            colors = (colors[:, 0:3] * 255).round().astype(np.uint8)
+            lut = LUT(toJavaArray(colors[:, 0].copy()), toJavaArray(colors[:, 1].copy()),
+                      toJavaArray(colors[:, 2].copy()))
+            lut.min, lut.max = layer.contrast_limits
+            if len(channels) > 1:
+                image.setChannelLut(lut, c + 1)
+            else:
+                image.getProcessor().setLut(lut)
+                image.setDisplayRange(lut.min, lut.max)
+        scale = layers[0].scale
+        cal = image.getCalibration()
+        cal.pixelWidth = float(scale[-1])
+        cal.pixelHeight = float(scale[-2])
+        if len(shape) > 2:
+            cal.pixelDepth = float(scale[-3])
+        if self.viewer.scale_bar.unit:
+            cal.setUnit(str(self.viewer.scale_bar.unit))
+        image.show()
+        return image
+
     def screenshot(self):
+        """
+        Send a screenshot of the canvas of the viewer to ImageJ as a new RGB
+        image. The pixels are packed into the int values of a ColorProcessor
+        with numpy and copied into the JVM in bulk.
+
+        Returns
+        -------
+        None.
+        """
+        from ij.process import ColorProcessor
         screenshot = self.viewer.screenshot(canvas_only=True)
-        pixels = JInt[:](list(screenshot[:, :, 0:3].flatten()))
-        image = java.awt.image.BufferedImage(screenshot.shape[1],
-                                             screenshot.shape[0],
-                                             java.awt.image.BufferedImage.TYPE_3BYTE_BGR)
-        image.getRaster().setPixels(0,0,screenshot.shape[1], screenshot.shape[0], pixels)
+        height, width = screenshot.shape[0:2]
+        pixels = toJavaArray(packRGB(screenshot))
         title = self.viewer.layers[0].name
         if 'C1-' in title:
             title = title.split('C1-')[1]
-        ip = ImagePlus("screenshot of " + title, image)
+        ip = ImagePlus("screenshot of " + title, ColorProcessor(width, height, pixels))
         ip.show()
 
+    def recordMovie(self, states, title="movie", queueSize=8):
+        """
+        Record a movie of the canvas into a new RGB image in ImageJ. Each
+        state is applied to the viewer and a screenshot is taken on the
+        calling thread, which must be the GUI thread. The screenshots are
+        converted into the slices of the stack by a MovieRecorder on a
+        worker thread. The view is restored at the end.
+
+        Parameters
+        ----------
+        states : iterable
+            The camera and dims settings of the frames, see
+            napari_j.movie.getViewState.
+        title : str, optional
+            The title of the image.
+        queueSize : int, optional
+            The maximal number of screenshots waiting to be converted.
+
+        Returns
+        -------
+        image : ij.ImagePlus
+            The movie or None if there were no states.
+        """
+        recorder = MovieRecorder(queueSize)
+        recorder.start()
+        initialState = getViewState(self.viewer)
+        try:
+            for state in states:
+                setViewState(self.viewer, state)
+                recorder.addFrame(self.viewer.screenshot(canvas_only=True))
+        finally:
+            setViewState(self.viewer, initialState)
+            stack = recorder.finish()
+        if stack is None:
+            return None
+        image = ImagePlus(title, stack)
+        image.show()
+        return image
+
+    def recordRotation(self, count=72, axis=2):
+        """
+        Record a full turn of the camera around one axis, starting at the
+        current view, see recordMovie.
+
+        Parameters
+        ----------
+        count : int, optional
+            The number of frames.
+        axis : int, optional
+            The index of the camera angle that is increased.
+
+        Returns
+        -------
+        image : ij.ImagePlus
+            The movie.
+        """
+        states = getRotationStates(getViewState(self.viewer), count, axis)
+        return self.recordMovie(states, title="rotation")
+
+    def recordTimeLapse(self, axis=0):
+        """
+        Record a frame for each step of one dimension, by default the first
+        one, which is the time for hyperstacks, see recordMovie.
+
+        Parameters
+        ----------
+        axis : int, optional
+            The index of the dimension.
+
+        Returns
+        -------
+        image : ij.ImagePlus
+            The movie.
+        """
+        count = self.viewer.dims.nsteps[axis]
+        states = getTimeStates(getViewState(self.viewer), count, axis)
+        return self.recordMovie(states, title="time-lapse")
+
     def displayPoints(self,tableTitle="Results", inColormap='inferno'):
         results = ResultsTable.getResultsTable(tableTitle)
         cal = IJ.getImage().getCalibration()
-        headings = list(results.getColumnHeadings().split("\t"))[0:]
-        confidenceHeaders = ["V", "Confidence"]
-        confidenceHeaderID = len(confidenceHeaders)
-        confidenceID = len(headings)
-        data = {}
-        for i in range(0, len(headings)):
-            if(headings[i] in confidenceHeaders):
-                confidenceHeaderID = min(confidenceHeaders.index(headings[i]), confidenceHeaderID)
-                confidenceID = min(confidenceID,i)
-            data[headings[i]] = results.getColumn(i)
-        resultsDF = pd.DataFrame(data=data)
-
-        coords = [[z, y, x] for [x, y, z] in resultsDF.iloc[:,0:3].to_numpy()]
+        headings = getHeadings(results)
+        confidenceHeading = findHeading(headings, ["V", "Confidence"])
+        # The first three columns are x, y and z, napari expects z, y, x.
+        coords = readColumns(results, headings[0:3])[:, ::-1]
         zFactor = cal.getZ(1) / cal.getX(1)
-
-        qualities = resultsDF[confidenceHeaders[confidenceHeaderID]].to_numpy(copy=True)
-        print("qualities type: "+str(type(qualities)))
-        print(qualities)
-
+        qualities = readColumn(results, confidenceHeading)
         properties = {'confidence' : qualities}
         points_layer = self.viewer.add_points(coords,
                                                 properties=properties,
@@ -281,19 +1322,15 @@ class Bridge:
 
     def pointsToIJ(self, points):
         tableTitle = self.viewer.layers.selection.active.name
-        print(tableTitle)
-        sel = [(coords, v) for coords, v in zip(points.data, points.properties['confidence']) if v > 0]
+        confidence = np.asarray(points.properties['confidence'])
+        selected = confidence > 0
+        coords = np.asarray(points.data)[selected]
         resultsWindow = WindowManager.getWindow(tableTitle)
         if resultsWindow:
             resultsWindow.close(False)
-        counter = 0;
-        rt = ResultsTable(JObject(JInt(len(sel))));
-        for row in sel:
-            rt.setValue("X", counter, row[0][2])
-            rt.setValue("Y", counter, row[0][1])
-            rt.setValue("Z", counter, row[0][0])
-            rt.setValue("V", counter, row[1])
-            counter = counter + 1
+        rt = ResultsTable(JObject(JInt(len(coords))));
+        writeColumns(rt, {"X": coords[:, 2], "Y": coords[:, 1], "Z": coords[:, 0],
+                          "V": confidence[selected]})
         rt.show(tableTitle)
 
     def saveAllLayers(self, directoryName):
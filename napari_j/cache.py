@@ -0,0 +1,361 @@
+"""
+Caching of the pixels transferred from ImageJ.
+
+The TransferCache keeps the pixels of the images fetched from ImageJ, keyed
+by the ID of the ImagePlus. An entry is only used as long as the signature
+of the image, i.e. its dimensions, bit-depth, changes flag, stack and the
+number of updates counted by the ChangeTracker, is the same as when it was
+read. Without a tracker, edits of the pixels can't be seen, so that the
+entries are only used to synchronize the images and as buffers.
+
+The cache owns the arrays of its entries. The callers only get read-only
+views of them, and an array is only reused to read an image again if no
+view of it is left.
+"""
+import sys
+import threading
+from collections import OrderedDict
+import numpy as np
+
+
+def getReadOnlyView(pixels):
+    """
+    Answer a view of the pixels that can't be written.
+
+    Parameters
+    ----------
+    pixels : numpy.ndarray
+        The array.
+
+    Returns
+    -------
+    view : numpy.ndarray
+        A read-only view of the whole array.
+    """
+    view = pixels.view()
+    view.flags.writeable = False
+    return view
+
+
+class ChangeTracker:
+    """
+        Counts the updates of the images in ImageJ, using an ImageListener.
+    """
+
+    def __init__(self):
+        """
+        Create a new tracker. It has to be started to receive the events.
+
+        Returns
+        -------
+        None.
+        """
+        self.counts = {}
+        self.updateCallbacks = []
+        self.closeCallbacks = []
+        self.listener = None
+        self.lock = threading.Lock()
+
+    def start(self):
+        """
+        Register an ImageListener with ImageJ. The JVM must be running.
+
+        Returns
+        -------
+        None.
+        """
+        from jpype import JImplements, JOverride
+        from ij import ImagePlus
+        tracker = self
+
+        @JImplements("ij.ImageListener")
+        class Listener:
+            @JOverride
+            def imageOpened(self, imp):
+                pass
+
+            @JOverride
+            def imageClosed(self, imp):
+                tracker.imageClosed(imp.getID())
+
+            @JOverride
+            def imageUpdated(self, imp):
+                tracker.imageUpdated(imp.getID())
+
+        self.listener = Listener()
+        ImagePlus.addImageListener(self.listener)
+
+    def stop(self):
+        """
+        Unregister the ImageListener from ImageJ.
+
+        Returns
+        -------
+        None.
+        """
+        if not self.listener:
+            return
+        from ij import ImagePlus
+        ImagePlus.removeImageListener(self.listener)
+        self.listener = None
+
+    def imageUpdated(self, imageID):
+        with self.lock:
+            self.counts[imageID] = self.counts.get(imageID, 0) + 1
+        for callback in self.updateCallbacks:
+            callback(imageID)
+
+    def imageClosed(self, imageID):
+        with self.lock:
+            self.counts.pop(imageID, None)
+        for callback in self.closeCallbacks:
+            callback(imageID)
+
+    def getCount(self, imageID):
+        """
+        Answer the number of updates of the image since the tracker has
+        been started.
+
+        Parameters
+        ----------
+        imageID : int
+            The ID of the ImagePlus.
+
+        Returns
+        -------
+        count : int
+            The number of update events received for the image.
+        """
+        with self.lock:
+            return self.counts.get(imageID, 0)
+
+
+class CacheEntry:
+    """
+        The pixels of an image read from ImageJ, the signature of the image
+        at the time they were read and optionally the hash codes of the
+        planes, which allow to find the planes that have changed since.
+    """
+
+    def __init__(self, signature, pixels, hashes=None):
+        self.signature = signature
+        self.pixels = pixels
+        self.hashes = hashes
+
+
+class TransferCache:
+    """
+        An LRU-cache of the pixels of the images transferred from ImageJ,
+        limited in size and in number of entries.
+    """
+
+    def __init__(self, maxBytes, maxEntries, tracker=None):
+        """
+        Create a new, empty cache.
+
+        Parameters
+        ----------
+        maxBytes : int
+            The maximal number of bytes of the pixels held by the cache.
+        maxEntries : int
+            The maximal number of images held by the cache.
+        tracker : ChangeTracker, optional
+            The tracker whose update counts are part of the signatures. The
+            entries of closed images are removed.
+
+        Returns
+        -------
+        None.
+        """
+        self.maxBytes = maxBytes
+        self.maxEntries = maxEntries
+        self.tracker = tracker
+        self.nbytes = 0
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        if tracker:
+            tracker.closeCallbacks.append(self.remove)
+
+    def getSignature(self, image):
+        """
+        Answer a cheap value that changes when the pixels of the image change.
+
+        Parameters
+        ----------
+        image : ij.ImagePlus
+            The image in ImageJ.
+
+        Returns
+        -------
+        signature : tuple
+            The dimensions, bit-depth, changes flag, stack hash and the update
+            count of the image.
+        """
+        count = 0
+        if self.tracker:
+            count = self.tracker.getCount(image.getID())
+        return (tuple(image.getDimensions()), image.getBitDepth(), bool(image.changes),
+                image.getStack().hashCode(), count)
+
+    def isCurrent(self, entry, signature):
+        """
+        Answer whether the pixels of the entry are those of the image with
+        the given signature. That is never the case without a tracker, since
+        the signature then doesn't change when the pixels are edited.
+
+        Parameters
+        ----------
+        entry : CacheEntry
+            The entry of the image.
+        signature : tuple
+            The current signature of the image.
+
+        Returns
+        -------
+        current : bool
+            True if the entry is up to date.
+        """
+        return self.tracker is not None and entry.signature == signature
+
+    def get(self, image):
+        """
+        Answer the cached pixels of the image, if they are still valid.
+
+        Parameters
+        ----------
+        image : ij.ImagePlus
+            The image in ImageJ.
+
+        Returns
+        -------
+        pixels : numpy.ndarray
+            A read-only view of the pixels of the image or None if they
+            aren't in the cache or the image may have changed since they
+            have been read.
+        """
+        signature = self.getSignature(image)
+        with self.lock:
+            entry = self.entries.get(image.getID())
+            if entry is None or not self.isCurrent(entry, signature):
+                return None
+            self.entries.move_to_end(image.getID())
+            return getReadOnlyView(entry.pixels)
+
+    def getEntry(self, imageID):
+        """
+        Answer the entry of the image with the given ID, even if outdated.
+
+        Parameters
+        ----------
+        imageID : int
+            The ID of the ImagePlus.
+
+        Returns
+        -------
+        entry : CacheEntry
+            The entry or None.
+        """
+        with self.lock:
+            return self.entries.get(imageID)
+
+    def takeBuffer(self, image, shape, dtype):
+        """
+        Remove the entry of the image and answer its pixels if they have the
+        given shape and dtype, so that the array can be reused to read the
+        image again. The array is only answered if the cache held the last
+        reference to it, i.e. no view of it has been kept by the callers.
+
+        Parameters
+        ----------
+        image : ij.ImagePlus
+            The image in ImageJ.
+        shape : tuple
+            The shape of the needed array.
+        dtype : numpy.dtype
+            The dtype of the needed array.
+
+        Returns
+        -------
+        buffer : numpy.ndarray
+            The array of the old entry or None.
+        """
+        entry = self.remove(image.getID())
+        if entry is None:
+            return None
+        pixels = entry.pixels
+        del entry
+        if pixels.dtype != dtype or pixels.shape != tuple(shape):
+            return None
+        # The views of an array reference the array owning the memory, only
+        # the local variable and the argument of getrefcount must be left.
+        if isinstance(pixels.base, np.ndarray) or sys.getrefcount(pixels) > 2:
+            return None
+        return pixels
+
+    def put(self, image, pixels, signature=None, hashes=None):
+        """
+        Store the pixels of the image, evicting the least recently used
+        entries while the size or the number of entries is exceeded.
+
+        Parameters
+        ----------
+        image : ij.ImagePlus
+            The image in ImageJ.
+        pixels : numpy.ndarray
+            The pixels read from the image. The cache takes the ownership
+            of the array, the caller must only hand out read-only views of
+            it.
+        signature : tuple, optional
+            The signature of the image taken before the pixels were read. By
+            default the current signature of the image.
+        hashes : numpy.ndarray, optional
+            The hash codes of the planes of the image.
+
+        Returns
+        -------
+        None.
+        """
+        if signature is None:
+            signature = self.getSignature(image)
+        self.remove(image.getID())
+        if pixels.nbytes > self.maxBytes or self.maxEntries < 1:
+            return
+        with self.lock:
+            self.entries[image.getID()] = CacheEntry(signature, pixels, hashes)
+            self.nbytes = self.nbytes + pixels.nbytes
+            while self.nbytes > self.maxBytes or len(self.entries) > self.maxEntries:
+                imageID, entry = self.entries.popitem(last=False)
+                self.nbytes = self.nbytes - entry.pixels.nbytes
+
+    def remove(self, imageID):
+        """
+        Remove the entry of the image with the given ID.
+
+        Parameters
+        ----------
+        imageID : int
+            The ID of the ImagePlus.
+
+        Returns
+        -------
+        entry : CacheEntry
+            The removed entry or None.
+        """
+        with self.lock:
+            entry = self.entries.pop(imageID, None)
+            if entry is not None:
+                self.nbytes = self.nbytes - entry.pixels.nbytes
+            return entry
+
+    def clear(self):
+        """
+        Remove all entries from the cache.
+
+        Returns
+        -------
+        None.
+        """
+        with self.lock:
+            self.entries.clear()
+            self.nbytes = 0
+
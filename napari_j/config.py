@@ -16,6 +16,15 @@ class Config:
         self.jvmPath = None
         self.fijiPath = None
         self.autostartFIJI = None
+        self.memmapDir = None
+        self.streamingThreshold = None
+        self.planeCacheSize = None
+        self.transferCacheSize = None
+        self.transferCacheEntries = None
+        self.workers = None
+        self.memoryBudget = None
+        self.pyramidMinSize = None
+        self.prefetchDepth = None
         self.create()
         self.read()
 
@@ -27,7 +36,12 @@ class Config:
             self.dir.mkdir()
         configFile = self.dir.joinpath("naparij.yml")
         if not configFile.exists():
-            self.config = {'connection': {'fiji_path': str(Path.home()), 'jvm_path': str(Path.home()), 'autostart_fiji': False}}
+            self.config = {'connection': {'fiji_path': str(Path.home()), 'jvm_path': str(Path.home()), 'autostart_fiji': False},
+                           'transfer': {'memmap_dir': None, 'streaming_threshold': 2147483647,
+                                        'plane_cache_size': 1024, 'transfer_cache_size': 4096,
+                                        'transfer_cache_entries': 8, 'workers': 4,
+                                        'memory_budget': 8192, 'pyramid_min_size': 256,
+                                        'prefetch_depth': 2}}
             with configFile.open(mode='w') as file:
                 yaml.dump(self.config, file)
 
@@ -39,6 +53,16 @@ class Config:
         self.jvmPath = connectionParams['jvm_path']
         self.fijiPath = connectionParams['fiji_path']
         self.autostartFIJI = connectionParams['autostart_fiji']
+        transferParams = params.setdefault('transfer', {})
+        self.memmapDir = transferParams.setdefault('memmap_dir', None)
+        self.streamingThreshold = transferParams.setdefault('streaming_threshold', 2147483647)
+        self.planeCacheSize = transferParams.setdefault('plane_cache_size', 1024)
+        self.transferCacheSize = transferParams.setdefault('transfer_cache_size', 4096)
+        self.transferCacheEntries = transferParams.setdefault('transfer_cache_entries', 8)
+        self.workers = transferParams.setdefault('workers', 4)
+        self.memoryBudget = transferParams.setdefault('memory_budget', 8192)
+        self.pyramidMinSize = transferParams.setdefault('pyramid_min_size', 256)
+        self.prefetchDepth = transferParams.setdefault('prefetch_depth', 2)
 
     def save(self):
         with self.dir.joinpath("naparij.yml").open(mode='w') as file:
@@ -56,6 +80,42 @@ class Config:
         self.autostartFIJI = aBool
         self.config['connection']['autostart_fiji'] = aBool
 
+    def setMemmapDir(self, aPath):
+        self.memmapDir = aPath
+        self.config['transfer']['memmap_dir'] = aPath
+
+    def setStreamingThreshold(self, voxels):
+        self.streamingThreshold = voxels
+        self.config['transfer']['streaming_threshold'] = voxels
+
+    def setPlaneCacheSize(self, megabytes):
+        self.planeCacheSize = megabytes
+        self.config['transfer']['plane_cache_size'] = megabytes
+
+    def setTransferCacheSize(self, megabytes):
+        self.transferCacheSize = megabytes
+        self.config['transfer']['transfer_cache_size'] = megabytes
+
+    def setTransferCacheEntries(self, entries):
+        self.transferCacheEntries = entries
+        self.config['transfer']['transfer_cache_entries'] = entries
+
+    def setWorkers(self, workers):
+        self.workers = workers
+        self.config['transfer']['workers'] = workers
+
+    def setMemoryBudget(self, megabytes):
+        self.memoryBudget = megabytes
+        self.config['transfer']['memory_budget'] = megabytes
+
+    def setPyramidMinSize(self, pixels):
+        self.pyramidMinSize = pixels
+        self.config['transfer']['pyramid_min_size'] = pixels
+
+    def setPrefetchDepth(self, planes):
+        self.prefetchDepth = planes
+        self.config['transfer']['prefetch_depth'] = planes
+
     def makeSettingsDefault(self):
         shutil.copy(str(self.dir.joinpath("naparij.yml")),
                     str(self.dir.joinpath("naparij_default.yml")))
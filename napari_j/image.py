@@ -1,13 +1,29 @@
 import os
 import napari
-from qtpy.QtWidgets import QWidget, QPushButton, QGridLayout, QFileDialog, QLineEdit, QLabel
+from qtpy.QtCore import QTimer, Signal
+from qtpy.QtWidgets import QWidget, QPushButton, QGridLayout, QFileDialog, QLineEdit, QLabel, QCheckBox, QProgressBar, \
+    QSpinBox
+from napari.qt.threading import create_worker
 from .config import Config
+from .transfer import TransferCancelled
+from .pyramid import scaleVoxelSize
+from .lazy import LazyImage
 from magicgui import magic_factory
 
 
 class Image(QWidget):
 
+    imageUpdated = Signal(int)
+    transferProgress = Signal(int, int)
+    channelFetched = Signal(object)
+    imageFetched = Signal(object)
+    levelComputed = Signal(object)
+
     bridge = None
+    worker = None
+    surfaceLevels = 3
+    cancelRequested = False
+    fetchedChannels = 0
     loadPath = None
     loadInput = None
 
@@ -22,13 +38,61 @@ class Image(QWidget):
         btnNewViewer.clicked.connect(self._on_click_new_viewer)
         btnGetImage = QPushButton("Get Image")
         btnGetImage.clicked.connect(self._on_click_get_image)
+        self.lazyCB = QCheckBox("lazy")
+        self.lazyCB.setToolTip("Read only the displayed planes from IJ")
+        self.pyramidCB = QCheckBox("pyramid")
+        self.pyramidCB.setToolTip("Display the image as a multiscale pyramid")
+        self.pyramidWorkers = []
+        self.previewLayers = {}
+        self.levelComputed.connect(self._on_level_computed)
+        btnSyncImage = QPushButton("Sync Image")
+        btnSyncImage.clicked.connect(self._on_click_sync_image)
+        self.autoSyncCB = QCheckBox("auto")
+        self.autoSyncCB.setToolTip("Sync the image whenever it is updated in IJ")
+        self.autoSyncCB.stateChanged.connect(self._on_auto_sync_changed)
+        self.pendingSync = set()
+        self.syncTimer = QTimer(self)
+        self.syncTimer.setSingleShot(True)
+        self.syncTimer.setInterval(100)
+        self.syncTimer.timeout.connect(self._on_sync_timer)
+        self.imageUpdated.connect(self._on_image_updated)
+        self.progressBar = QProgressBar(self)
+        self.progressBar.setValue(0)
+        self.btnCancel = QPushButton("Cancel")
+        self.btnCancel.clicked.connect(self._on_click_cancel)
+        self.btnCancel.setEnabled(False)
+        self.transferProgress.connect(self._on_transfer_progress)
+        self.channelFetched.connect(self._on_channel_fetched)
+        self.imageFetched.connect(self._on_one_of_all_images_fetched)
+        btnGetAllImages = QPushButton("Get All Images")
+        btnGetAllImages.clicked.connect(self._on_click_get_all_images)
+        btnImageToIJ = QPushButton("Image to IJ")
+        btnImageToIJ.clicked.connect(self._on_click_image_to_ij)
         btnGetLabels = QPushButton("Get Labels")
         btnGetLabels.clicked.connect(self._on_click_get_labels)
         if config.isLimeSegInstalled():
             btnGetSurfaces = QPushButton("Get Surfaces")
             btnGetSurfaces.clicked.connect(self._on_click_get_surfaces)
+        self.combinedCB = QCheckBox("combined")
+        self.combinedCB.setToolTip("Add all cells as one surface layer")
+        self.budgetSB = QSpinBox()
+        self.budgetSB.setRange(0, 100000000)
+        self.budgetSB.setSingleStep(10000)
+        self.budgetSB.setSpecialValueText("all")
+        self.budgetSB.setToolTip("The maximal number of triangles per surface layer")
+        self.levelSB = QSpinBox()
+        self.levelSB.setRange(0, self.surfaceLevels - 1)
+        self.levelSB.setPrefix("LOD ")
+        self.levelSB.setToolTip("The level of detail of the surfaces, 0 for the finest")
+        self.levelSB.valueChanged.connect(self._on_level_of_detail_changed)
+        self.seriesCB = QCheckBox("all frames")
+        self.seriesCB.setToolTip("Add the surfaces of all time points, read as the time slider moves")
         btnScreenshot = QPushButton("Screenshot")
         btnScreenshot.clicked.connect(self._on_click_screenshot)
+        btnRecordRotation = QPushButton("Record Rotation")
+        btnRecordRotation.clicked.connect(self._on_click_record_rotation)
+        btnRecordTimeLapse = QPushButton("Record Time-lapse")
+        btnRecordTimeLapse.clicked.connect(self._on_click_record_time_lapse)
 
         loadLabel = QLabel(self)
         loadLabel.setText("Loading Files from a Folder :")
@@ -50,20 +114,35 @@ class Image(QWidget):
 
         self.setLayout(QGridLayout())
         self.layout().addWidget(btnNewViewer    , 1, 1, 1, -1)
-        self.layout().addWidget(btnGetImage     , 2, 1, 1, -1)
-        self.layout().addWidget(btnGetLabels    , 3, 1, 1, -1)
-        self.layout().addWidget(btnGetSurfaces  , 4, 1, 1, -1)
-        self.layout().addWidget(btnScreenshot   , 5, 1, 1, -1)
+        self.layout().addWidget(btnGetImage     , 2, 1)
+        self.layout().addWidget(self.lazyCB     , 2, 2)
+        self.layout().addWidget(btnSyncImage    , 2, 3)
+        self.layout().addWidget(self.autoSyncCB , 2, 4)
+        self.layout().addWidget(self.progressBar, 3, 1, 1, 3)
+        self.layout().addWidget(self.btnCancel  , 3, 4)
+        self.layout().addWidget(self.pyramidCB  , 4, 2)
+        self.layout().addWidget(btnGetAllImages , 5, 1, 1, 2)
+        self.layout().addWidget(btnGetLabels    , 5, 3, 1, -1)
+        self.layout().addWidget(btnGetSurfaces  , 6, 1)
+        self.layout().addWidget(self.combinedCB , 6, 2)
+        self.layout().addWidget(self.budgetSB   , 6, 3)
+        self.layout().addWidget(self.levelSB    , 6, 4)
+        self.layout().addWidget(self.seriesCB   , 7, 2)
+        self.layout().addWidget(btnScreenshot   , 8, 1, 1, 2)
+        self.layout().addWidget(btnImageToIJ    , 8, 3, 1, -1)
+
+        self.layout().addWidget(btnRecordRotation , 9, 1, 1, 2)
+        self.layout().addWidget(btnRecordTimeLapse, 9, 3, 1, -1)
 
-        self.layout().addWidget(loadLabel       , 6, 1, 1, 2)
-        self.layout().addWidget(self.loadInput  , 7, 1)
-        self.layout().addWidget(btnBrowseload   , 7, 2)
-        self.layout().addWidget(btnLoad         , 8, 1, 1, 2)
+        self.layout().addWidget(loadLabel       , 10, 1, 1, 2)
+        self.layout().addWidget(self.loadInput  , 11, 1)
+        self.layout().addWidget(btnBrowseload   , 11, 2)
+        self.layout().addWidget(btnLoad         , 12, 1, 1, 2)
 
-        self.layout().addWidget(saveLabel       , 9, 1, 1, 2)
-        self.layout().addWidget(self.saveInput  , 10, 1)
-        self.layout().addWidget(btnBrowseSave   , 10, 2)
-        self.layout().addWidget(btnSave         , 11, 1, 1, 2)
+        self.layout().addWidget(saveLabel       , 13, 1, 1, 2)
+        self.layout().addWidget(self.saveInput  , 14, 1)
+        self.layout().addWidget(btnBrowseSave   , 14, 2)
+        self.layout().addWidget(btnSave         , 15, 1, 1, 2)
 
 
     def _on_click_browse_load(self):
@@ -84,15 +163,125 @@ class Image(QWidget):
     def _on_click_get_image(self):
         self.getImage()
 
+    def _on_click_get_all_images(self):
+        self.getAllImages()
+
+    def _on_click_cancel(self):
+        self.cancelRequested = True
+
+    def _on_transfer_progress(self, done, total):
+        self.progressBar.setMaximum(total)
+        self.progressBar.setValue(done)
+
+    def _on_channel_fetched(self, channel):
+        c, data, title, dims, voxelSize = channel
+        if self.pyramidCB.isChecked() and not isinstance(data, LazyImage):
+            self.buildPyramid(c, data, title, dims, voxelSize)
+        else:
+            self.getBridge().addChannel(c, data, title, dims, voxelSize)
+        self.fetchedChannels = self.fetchedChannels + 1
+
+    def _on_level_computed(self, result):
+        channel, baseShape, level = result
+        c, title, dims, voxelSize = channel
+        levelVoxelSize = scaleVoxelSize(voxelSize, baseShape, level.shape)
+        layer = self.previewLayers.get(c)
+        if layer is None:
+            self.previewLayers[c] = self.getBridge().addChannel(c, level, title, dims, levelVoxelSize)
+            return
+        layer.data = level
+        layer.scale = levelVoxelSize if dims[3] > 1 else levelVoxelSize[1:]
+
+    def _on_pyramid_built(self, channel, levels):
+        c, title, dims, voxelSize = channel
+        preview = self.previewLayers.pop(c, None)
+        if preview is not None and preview in self.viewer.layers:
+            self.viewer.layers.remove(preview)
+        if len(levels) == 1:
+            self.getBridge().addChannel(c, levels[0], title, dims, voxelSize)
+        else:
+            self.getBridge().addChannel(c, levels, title, dims, voxelSize, multiscale=True)
+
+    def _on_one_of_all_images_fetched(self, result):
+        title, dims, voxelSize, unit, channels = result
+        for c, data in enumerate(channels):
+            self.getBridge().addChannel(c, data, title, dims, voxelSize)
+            self.fetchedChannels = self.fetchedChannels + 1
+        self.viewer.scale_bar.unit = unit
+
+    def _on_all_images_fetched(self, results):
+        self.viewer.dims.ndisplay = 3
+
+    def _on_image_fetched(self, result):
+        title, dims, voxelSize, unit, channels = result
+        self.viewer.scale_bar.unit = unit
+        self.viewer.dims.ndisplay = 3
+
+    def _on_fetch_errored(self, error):
+        if isinstance(error, TransferCancelled):
+            print("The transfer of the image has been cancelled")
+        else:
+            print("The transfer of the image failed: " + str(error))
+
+    def _on_fetch_finished(self):
+        self.worker = None
+        self.btnCancel.setEnabled(False)
+        self.progressBar.setValue(0)
+
+    def _report_progress(self, done, total):
+        if self.cancelRequested:
+            raise TransferCancelled()
+        self.transferProgress.emit(done, total)
+
+    def _report_image(self, result):
+        self.imageFetched.emit(result)
+
+    def _report_channel(self, c, data, title, dims, voxelSize):
+        self.channelFetched.emit((c, data, title, dims, voxelSize))
+
+    def _on_click_sync_image(self):
+        self.syncImage()
+
+    def _on_auto_sync_changed(self, state):
+        self.setAutoSync(self.autoSyncCB.isChecked())
+
+    def _forward_image_updated(self, imageID):
+        self.imageUpdated.emit(imageID)
+
+    def _on_image_updated(self, imageID):
+        self.pendingSync.add(imageID)
+        self.syncTimer.start()
+
+    def _on_sync_timer(self):
+        from ij import WindowManager
+        imageIDs = self.pendingSync
+        self.pendingSync = set()
+        for imageID in imageIDs:
+            image = WindowManager.getImage(imageID)
+            if image:
+                self.getBridge().syncImageFromIJ(image, fetch=False)
+
     def _on_click_get_labels(self):
         self.getLabels()
 
     def _on_click_get_surfaces(self):
         self.getSurfaces()
 
+    def _on_level_of_detail_changed(self, level):
+        self.setLevelOfDetail(level)
+
+    def _on_click_image_to_ij(self):
+        self.imageToIJ()
+
     def _on_click_screenshot(self):
         self.screenshot()
 
+    def _on_click_record_rotation(self):
+        self.recordRotation()
+
+    def _on_click_record_time_lapse(self):
+        self.recordTimeLapse()
+
     def _on_click_load(self):
         self.loadFromFolders()
 
@@ -109,21 +298,139 @@ class Image(QWidget):
         return self.bridge
        
     def getImage(self):
+        """
+        Fetch the active image from IJ on a worker thread. The channels are
+        added to the viewer on the GUI thread as soon as they are complete.
+        Lazy images are added at once, since nothing is transferred.
+        """
         print("Fetching the active image from IJ")
-        self.getBridge().getActiveImageFromIJ()	 
+        if self.lazyCB.isChecked():
+            self.getBridge().getActiveImageFromIJ(lazy=True)
+            return
+        if self.worker:
+            return
+        self.cancelRequested = False
+        self.fetchedChannels = 0
+        self.previewLayers = {}
+        self.btnCancel.setEnabled(True)
+        self.progressBar.setValue(0)
+        # The worker may read the pixels into the arrays of the outdated
+        # layers, which must not be displayed any longer.
+        self.getBridge().removeAllLayers()
+        self.worker = create_worker(self.getBridge().fetchImage,
+                                    progress=self._report_progress,
+                                    channelDone=self._report_channel,
+                                    _start_thread=False)
+        self.worker.returned.connect(self._on_image_fetched)
+        self.worker.errored.connect(self._on_fetch_errored)
+        self.worker.finished.connect(self._on_fetch_finished)
+        self.worker.start()
+
+    def buildPyramid(self, c, data, title, dims, voxelSize):
+        """
+        Compute a multiscale pyramid of a channel on a worker thread. While
+        it is computed, the levels are displayed from the coarsest to the
+        finest in a preview layer, which is replaced by a multiscale layer
+        once the pyramid is complete.
+        """
+        channel = (c, title, dims, voxelSize)
+        worker = create_worker(self.getBridge().getPyramid, data, dims,
+                               levelDone=lambda k, level: self.levelComputed.emit((channel, data.shape, level)),
+                               _start_thread=False)
+        worker.returned.connect(lambda levels: self._on_pyramid_built(channel, levels))
+        worker.errored.connect(self._on_fetch_errored)
+        worker.finished.connect(lambda: self.pyramidWorkers.remove(worker))
+        self.pyramidWorkers.append(worker)
+        worker.start()
+
+    def getAllImages(self):
+        """
+        Fetch all open images from IJ concurrently on a pool of worker
+        threads. Each image is added to the viewer on the GUI thread as soon
+        as it has been transferred.
+        """
+        print("Fetching all open images from IJ")
+        if self.worker:
+            return
+        self.cancelRequested = False
+        self.fetchedChannels = 0
+        self.btnCancel.setEnabled(True)
+        self.progressBar.setValue(0)
+        # The worker may read the pixels into the arrays of the outdated
+        # layers, which must not be displayed any longer.
+        self.getBridge().removeAllLayers()
+        self.worker = create_worker(self.getBridge().fetchAllImages,
+                                    progress=self._report_progress,
+                                    imageDone=self._report_image,
+                                    _start_thread=False)
+        self.worker.returned.connect(self._on_all_images_fetched)
+        self.worker.errored.connect(self._on_fetch_errored)
+        self.worker.finished.connect(self._on_fetch_finished)
+        self.worker.start()
  
+    def syncImage(self):
+        print("Synchronizing the active image with IJ")
+        self.getBridge().syncImageFromIJ()
+
+    def setAutoSync(self, enabled):
+        """
+        Synchronize the displayed images whenever they are updated in IJ.
+        The update events arrive on a java thread and are forwarded to the
+        GUI thread with the imageUpdated signal.
+        """
+        tracker = self.getBridge().getTransferCache().tracker
+        if not tracker:
+            print("Auto sync needs a running FIJI")
+            return
+        # The transfers compute the hash codes of the planes only while
+        # the images are synchronized automatically.
+        self.getBridge().planeTracking = enabled
+        if enabled and self._forward_image_updated not in tracker.updateCallbacks:
+            tracker.updateCallbacks.append(self._forward_image_updated)
+        if not enabled and self._forward_image_updated in tracker.updateCallbacks:
+            tracker.updateCallbacks.remove(self._forward_image_updated)
+
     def getLabels(self):
         print("Fetching the active labels image from IJ")
-        self.getBridge().getLabelsFromIJ()	 
+        self.getBridge().getLabelsFromIJ(lazy=self.lazyCB.isChecked())
 
     def getSurfaces(self):
         print("Fetching the surfaces from IJ")
-        self.getBridge().getSurfacesFromIJ()
+        budget = self.budgetSB.value() or None
+        if self.seriesCB.isChecked():
+            self.getBridge().getSurfaceSeriesFromIJ(budget=budget)
+            return
+        # The coarser levels of detail are built by setSurfaceLevel when
+        # they are first displayed, since each one costs a decimation pass
+        # per cell.
+        self.getBridge().getSurfacesFromIJ(combined=self.combinedCB.isChecked(), budget=budget)
+        self.setLevelOfDetail(self.levelSB.value())
+
+    def setLevelOfDetail(self, level):
+        """
+        Display the given level of detail of all surface layers that have
+        been decimated into levels.
+        """
+        for layer in self.viewer.layers:
+            if 'levels' in layer.metadata:
+                self.getBridge().setSurfaceLevel(layer, level)
+
+    def imageToIJ(self):
+        print("Sending the selected image layers to IJ")
+        self.getBridge().layersToIJ()
 
     def screenshot(self):
         print("Sending screenshot to IJ")
         self.getBridge().screenshot()	 
 
+    def recordRotation(self):
+        print("Recording a rotation of the view to IJ")
+        self.getBridge().recordRotation()
+
+    def recordTimeLapse(self):
+        print("Recording the time points of the view to IJ")
+        self.getBridge().recordTimeLapse()
+
     def loadFromFolders(self):
         print("Loading Files from folder")
         self.getBridge().loadAllLayers(self.loadPath)
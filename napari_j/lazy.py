@@ -0,0 +1,402 @@
+"""
+Lazy access to the pixels of an ImageJ image.
+
+A LazyImage is an array-like view of one channel of a live ImageJ image. It
+can be given to napari instead of a numpy array. Only the planes that are
+sliced by the viewer are copied from ImageJ. They are kept in a PlaneCache,
+which drops the least recently used planes when its memory budget is
+exceeded, and the planes of the images that are updated or closed in ImageJ. A Prefetcher reads the planes next to the displayed ones in the
+background, to hide the latency of virtual stacks that are read from disk.
+"""
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from .transfer import attachThread, getDtype, readPlane
+
+
+class PlaneCache:
+    """
+        A thread-safe LRU-cache of image planes with a budget in bytes.
+    """
+
+    def __init__(self, maxBytes, tracker=None):
+        """
+        Create a new, empty cache.
+
+        Parameters
+        ----------
+        maxBytes : int
+            The maximal number of bytes of the planes held by the cache.
+        tracker : napari_j.cache.ChangeTracker, optional
+            The tracker whose events remove the planes of the images that
+            have been updated or closed.
+
+        Returns
+        -------
+        None.
+        """
+        self.maxBytes = maxBytes
+        self.nbytes = 0
+        self.planes = OrderedDict()
+        self.lock = threading.Lock()
+        if tracker:
+            tracker.updateCallbacks.append(self.removeImage)
+            tracker.closeCallbacks.append(self.removeImage)
+
+    def get(self, key):
+        """
+        Answer the plane stored under key and mark it as recently used.
+
+        Parameters
+        ----------
+        key : tuple
+            The key of the plane.
+
+        Returns
+        -------
+        plane : numpy.ndarray
+            The plane or None if it is not in the cache.
+        """
+        with self.lock:
+            plane = self.planes.get(key)
+            if plane is not None:
+                self.planes.move_to_end(key)
+            return plane
+
+    def put(self, key, plane):
+        """
+        Store the plane under key, evicting the least recently used planes
+        while the budget is exceeded. A plane bigger than the budget is not
+        stored.
+
+        Parameters
+        ----------
+        key : tuple
+            The key of the plane.
+        plane : numpy.ndarray
+            The plane to store.
+
+        Returns
+        -------
+        None.
+        """
+        if plane.nbytes > self.maxBytes:
+            return
+        with self.lock:
+            old = self.planes.pop(key, None)
+            if old is not None:
+                self.nbytes = self.nbytes - old.nbytes
+            self.planes[key] = plane
+            self.nbytes = self.nbytes + plane.nbytes
+            while self.nbytes > self.maxBytes:
+                key, old = self.planes.popitem(last=False)
+                self.nbytes = self.nbytes - old.nbytes
+
+    def removeImage(self, imageID):
+        """
+        Remove the planes of an image from the cache. The keys of the planes
+        must start with the ID of the image.
+
+        Parameters
+        ----------
+        imageID : int
+            The ID of the ImagePlus.
+
+        Returns
+        -------
+        None.
+        """
+        with self.lock:
+            for key in [key for key in self.planes if key[0] == imageID]:
+                self.nbytes = self.nbytes - self.planes.pop(key).nbytes
+
+    def clear(self):
+        """
+        Remove all planes from the cache.
+
+        Returns
+        -------
+        None.
+        """
+        with self.lock:
+            self.planes.clear()
+            self.nbytes = 0
+
+
+class Prefetcher:
+    """
+        Reads planes of lazy images into their cache on a background thread
+        attached to the JVM. Only the planes requested last are read, the
+        requests that haven't been started yet are dropped when new planes
+        are requested.
+    """
+
+    def __init__(self, depth):
+        """
+        Create a new prefetcher. Its thread is started when first needed.
+
+        Parameters
+        ----------
+        depth : int
+            The number of planes read ahead on each side of a displayed
+            plane along the z-axis.
+
+        Returns
+        -------
+        None.
+        """
+        self.depth = depth
+        self.executor = None
+        self.futures = []
+        self.lock = threading.Lock()
+
+    def prefetch(self, image, planeIndex):
+        """
+        Read the planes next to a plane of a lazy image in the background.
+
+        Parameters
+        ----------
+        image : LazyImage
+            The image from which the planes are read.
+        planeIndex : tuple
+            The indices of the displayed plane in the leading dimensions of
+            the image.
+
+        Returns
+        -------
+        None.
+        """
+        with self.lock:
+            for future in self.futures:
+                future.cancel()
+            self.futures = []
+            if self.depth < 1:
+                return
+            if not self.executor:
+                self.executor = ThreadPoolExecutor(max_workers=1, initializer=attachThread)
+            for neighbour in image.getNeighbours(planeIndex, self.depth):
+                if not image.isCached(neighbour):
+                    self.futures.append(self.executor.submit(image.getPlane, neighbour))
+
+    def shutdown(self):
+        """
+        Drop the pending requests and stop the thread.
+
+        Returns
+        -------
+        None.
+        """
+        with self.lock:
+            for future in self.futures:
+                future.cancel()
+            self.futures = []
+            if self.executor:
+                self.executor.shutdown(wait=False)
+                self.executor = None
+
+
+class LazyImage:
+    """
+        An array-like view of one channel of an ImageJ image, with the
+        dimensions t, z, y, x. As for the images copied from ImageJ, the
+        leading dimensions of size one are dropped.
+    """
+
+    def __init__(self, image, channel, cache, dtype=None, prefetcher=None):
+        """
+        Create a lazy view of a channel of the image.
+
+        Parameters
+        ----------
+        image : ij.ImagePlus
+            The image in ImageJ.
+        channel : int
+            The channel, starting at 0.
+        cache : PlaneCache
+            The cache in which the planes read from ImageJ are kept.
+        dtype : numpy.dtype, optional
+            The dtype of the array, by default the dtype of the image.
+        prefetcher : Prefetcher, optional
+            The prefetcher that reads the planes next to the sliced ones.
+
+        Returns
+        -------
+        None.
+        """
+        self.image = image
+        self.channel = channel
+        self.cache = cache
+        self.prefetcher = prefetcher
+        self.imageDtype = getDtype(image)
+        self.dtype = np.dtype(dtype or self.imageDtype)
+        dims = list(image.getDimensions())
+        shape = [dims[4], dims[3], dims[1], dims[0]]
+        while len(shape) > 2 and shape[0] == 1:
+            shape.pop(0)
+        self.shape = tuple(shape)
+
+    @property
+    def ndim(self):
+        return len(self.shape)
+
+    @property
+    def size(self):
+        return int(np.prod(self.shape))
+
+    @property
+    def nbytes(self):
+        return self.size * self.dtype.itemsize
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __array__(self, dtype=None, copy=None):
+        data = self[...]
+        if dtype is not None:
+            data = data.astype(dtype, copy=False)
+        return data
+
+    def __getitem__(self, key):
+        if not isinstance(key, tuple):
+            key = (key,)
+        if Ellipsis in key:
+            position = key.index(Ellipsis)
+            fill = (slice(None),) * (self.ndim - len(key) + 1)
+            key = key[:position] + fill + key[position + 1:]
+        key = key + (slice(None),) * (self.ndim - len(key))
+        planeKey, pixelKey = key[:-2], key[-2:]
+        selections = [np.arange(size)[k] for k, size in zip(planeKey, self.shape[:-2])]
+        indices = [np.atleast_1d(selection) for selection in selections]
+        pixelShape = np.broadcast_to(0, self.shape[-2:])[pixelKey].shape
+        out = np.empty([len(index) for index in indices] + list(pixelShape), dtype=self.dtype)
+        for position in np.ndindex(*[len(index) for index in indices]):
+            planeIndex = tuple(index[p] for index, p in zip(indices, position))
+            out[position] = self.getPlane(planeIndex)[pixelKey]
+        if self.prefetcher and len(indices) > 0:
+            self.prefetcher.prefetch(self, tuple(int(index[-1]) for index in indices))
+        shape = [len(index) for index, selection in zip(indices, selections) if np.ndim(selection) > 0]
+        return out.reshape(shape + list(pixelShape))
+
+    def getNeighbours(self, planeIndex, depth):
+        """
+        Answer the planes next to a plane, nearest first: up to depth planes
+        on each side along the z-axis, then the same plane in the previous
+        and next frame.
+
+        Parameters
+        ----------
+        planeIndex : tuple
+            The indices of the plane in the leading dimensions of the array.
+        depth : int
+            The number of planes on each side along the z-axis.
+
+        Returns
+        -------
+        neighbours : list
+            The indices of the neighbouring planes inside the image.
+        """
+        neighbours = []
+        steps = [(-1, step) for distance in range(1, depth + 1) for step in (distance, -distance)]
+        steps = steps + [(-2, 1), (-2, -1)]
+        for axis, step in steps:
+            if len(planeIndex) < -axis:
+                continue
+            neighbour = list(planeIndex)
+            neighbour[axis] = neighbour[axis] + step
+            if 0 <= neighbour[axis] < self.shape[axis - 2]:
+                neighbours.append(tuple(neighbour))
+        return neighbours
+
+    def isCached(self, planeIndex):
+        """
+        Answer whether a plane of this channel is in the cache.
+
+        Parameters
+        ----------
+        planeIndex : tuple
+            The indices of the plane in the leading dimensions of the array.
+
+        Returns
+        -------
+        cached : bool
+            True if the plane doesn't need to be read from ImageJ.
+        """
+        return self.cache.get(self.getCacheKey(self.getStackIndex(planeIndex))) is not None
+
+    def getCacheKey(self, index):
+        """
+        Answer the key of a plane in the cache. It contains the dtype, since
+        views with different dtypes of the same image share the cache.
+
+        Parameters
+        ----------
+        index : int
+            The index of the plane in the stack, starting at 1.
+
+        Returns
+        -------
+        key : tuple
+            The ID of the image, the index and the dtype.
+        """
+        return (self.image.getID(), index, self.dtype.str)
+
+    def getStackIndex(self, planeIndex):
+        """
+        Answer the index in the ImageJ stack of a plane of this channel.
+
+        Parameters
+        ----------
+        planeIndex : tuple
+            The indices of the plane in the leading dimensions of the array.
+
+        Returns
+        -------
+        index : int
+            The index of the plane in the stack, starting at 1.
+        """
+        tz = (0,) * (2 - len(planeIndex)) + tuple(planeIndex)
+        return self.image.getStackIndex(self.channel + 1, int(tz[1]) + 1, int(tz[0]) + 1)
+
+    def getPlane(self, planeIndex):
+        """
+        Answer a plane of this channel, from the cache if possible.
+
+        Parameters
+        ----------
+        planeIndex : tuple
+            The indices of the plane in the leading dimensions of the array.
+
+        Returns
+        -------
+        plane : numpy.ndarray
+            The plane of shape (height, width).
+        """
+        index = self.getStackIndex(planeIndex)
+        key = self.getCacheKey(index)
+        plane = self.cache.get(key)
+        if plane is None:
+            plane = np.empty(self.shape[-2:], dtype=self.imageDtype)
+            readPlane(self.image.getStack(), index, plane)
+            plane = plane.astype(self.dtype, copy=False)
+            self.cache.put(key, plane)
+        return plane
+
+    def getContrastLimits(self):
+        """
+        Estimate the contrast limits from the first plane of the middle of
+        the stack, so that napari doesn't have to read the whole image.
+
+        Returns
+        -------
+        limits : list
+            The minimum and maximum of the plane.
+        """
+        planeIndex = tuple(0 for size in self.shape[:-2])
+        if len(planeIndex) > 0:
+            planeIndex = planeIndex[:-1] + (self.shape[-3] // 2,)
+        plane = self.getPlane(planeIndex)
+        limits = [float(plane.min()), float(plane.max())]
+        if limits[0] == limits[1]:
+            limits[1] = limits[0] + 1
+        return limits
@@ -0,0 +1,257 @@
+"""
+Operations on the triangle meshes of the surfaces fetched from LimeSeg.
+
+Many cells can be merged into one mesh, displayed by a single surface-layer.
+The value of each vertex is the index of its cell, which selects the color
+of the cell in a categorical colormap. The vertices and faces of each cell
+are contiguous ranges of the merged mesh, so that a cell can be hidden by
+dropping its range of faces, or highlighted by changing the values of its
+range of vertices.
+
+Dense meshes can be decimated by vertex clustering: the vertices in each
+cell of a regular grid are merged into their mean, the faces that collapse
+are dropped. The grid is chosen so that the number of faces stays within a
+budget. Levels of detail are decimated meshes with a quarter of the faces
+of the previous level.
+"""
+import colorsys
+import numpy as np
+
+
+def combineMeshes(meshes):
+    """
+    Merge meshes into one mesh. The face indices of each mesh are offset by
+    the number of vertices of the meshes before it.
+
+    Parameters
+    ----------
+    meshes : list
+        The meshes as tuples (vertices, faces).
+
+    Returns
+    -------
+    vertices : numpy.ndarray
+        The vertices of all meshes, of shape (vertices, 3).
+    faces : numpy.ndarray
+        The faces of all meshes, of shape (faces, 3).
+    values : numpy.ndarray
+        The index of the mesh of each vertex.
+    ranges : numpy.ndarray
+        The rows (vertexStart, vertexEnd, faceStart, faceEnd) of the
+        meshes.
+    """
+    vertexCounts = np.array([len(vertices) for vertices, faces in meshes], dtype=np.int64)
+    faceCounts = np.array([len(faces) for vertices, faces in meshes], dtype=np.int64)
+    vertexEnds = np.cumsum(vertexCounts)
+    faceEnds = np.cumsum(faceCounts)
+    ranges = np.column_stack((vertexEnds - vertexCounts, vertexEnds, faceEnds - faceCounts, faceEnds))
+    vertices = np.empty((int(vertexCounts.sum()), 3), dtype=np.float64)
+    faces = np.empty((int(faceCounts.sum()), 3), dtype=np.int64)
+    for (meshVertices, meshFaces), (vertexStart, vertexEnd, faceStart, faceEnd) in zip(meshes, ranges):
+        vertices[vertexStart:vertexEnd] = meshVertices
+        np.add(meshFaces, vertexStart, out=faces[faceStart:faceEnd])
+    values = np.repeat(np.arange(len(meshes), dtype=np.float32), vertexCounts)
+    return vertices, faces, values, ranges
+
+
+def splitMeshes(vertices, faces, ranges):
+    """
+    Split a merged mesh into the meshes it has been combined from.
+
+    Parameters
+    ----------
+    vertices : numpy.ndarray
+        The vertices of the merged mesh, of shape (vertices, 3).
+    faces : numpy.ndarray
+        The faces of the merged mesh, of shape (faces, 3).
+    ranges : numpy.ndarray
+        The rows (vertexStart, vertexEnd, faceStart, faceEnd) of the
+        meshes, as answered by combineMeshes.
+
+    Returns
+    -------
+    meshes : list
+        The meshes as tuples (vertices, faces), whose face indices start at
+        the first vertex of each mesh.
+    """
+    return [(vertices[vertexStart:vertexEnd], faces[faceStart:faceEnd] - vertexStart)
+            for vertexStart, vertexEnd, faceStart, faceEnd in ranges]
+
+
+def getVisibleFaces(faces, ranges, hidden):
+    """
+    Answer the faces of the merged mesh without those of the hidden meshes.
+
+    Parameters
+    ----------
+    faces : numpy.ndarray
+        The faces of the merged mesh.
+    ranges : numpy.ndarray
+        The ranges of the meshes, as answered by combineMeshes.
+    hidden : collection
+        The indices of the hidden meshes.
+
+    Returns
+    -------
+    faces : numpy.ndarray
+        The faces of the visible meshes.
+    """
+    if not hidden:
+        return faces
+    visible = np.ones(len(faces), dtype=bool)
+    for index in hidden:
+        visible[ranges[index, 2]:ranges[index, 3]] = False
+    return faces[visible]
+
+
+def getCategoricalColors(count):
+    """
+    Answer distinct colors, by stepping the hue with the golden ratio.
+
+    Parameters
+    ----------
+    count : int
+        The number of colors.
+
+    Returns
+    -------
+    colors : numpy.ndarray
+        The RGBA colors of shape (count, 4).
+    """
+    hues = (np.arange(count) * 0.618033988749895) % 1
+    colors = [colorsys.hsv_to_rgb(hue, 0.65 + 0.35 * (index % 2), 1)
+              for index, hue in enumerate(hues)]
+    return np.column_stack((np.reshape(colors, (count, 3)), np.ones(count)))
+
+
+def getArea(vertices, faces):
+    """
+    Answer the surface area of a mesh.
+
+    Parameters
+    ----------
+    vertices : numpy.ndarray
+        The vertices of shape (vertices, 3).
+    faces : numpy.ndarray
+        The faces of shape (faces, 3).
+
+    Returns
+    -------
+    area : float
+        The sum of the areas of the triangles.
+    """
+    corners = vertices[faces]
+    normals = np.cross(corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0])
+    return 0.5 * float(np.linalg.norm(normals, axis=1).sum())
+
+
+def clusterVertices(vertices, faces, cellSize):
+    """
+    Decimate a mesh by merging the vertices in each cell of a grid into
+    their mean. Faces that collapse to a line or a point and duplicated
+    faces are dropped, so are the vertices no longer used by a face.
+
+    Parameters
+    ----------
+    vertices : numpy.ndarray
+        The vertices of shape (vertices, 3).
+    faces : numpy.ndarray
+        The faces of shape (faces, 3).
+    cellSize : float
+        The edge length of the cells of the grid.
+
+    Returns
+    -------
+    vertices : numpy.ndarray
+        The vertices of the decimated mesh.
+    faces : numpy.ndarray
+        The faces of the decimated mesh.
+    """
+    cells = np.floor((vertices - vertices.min(axis=0)) / cellSize).astype(np.int64)
+    keys = np.ravel_multi_index(cells.T, tuple(cells.max(axis=0) + 1))
+    keys, inverse = np.unique(keys, return_inverse=True)
+    faces = inverse.reshape(-1)[faces]
+    keep = (faces[:, 0] != faces[:, 1]) & (faces[:, 1] != faces[:, 2]) & (faces[:, 0] != faces[:, 2])
+    faces = faces[keep]
+    rows, first = np.unique(np.sort(faces, axis=1), axis=0, return_index=True)
+    faces = faces[np.sort(first)]
+    used, faces = np.unique(faces, return_inverse=True)
+    faces = faces.reshape(-1, 3)
+    lookup = np.full(len(keys), -1, dtype=np.int64)
+    lookup[used] = np.arange(len(used))
+    members = lookup[inverse.reshape(-1)]
+    inside = members >= 0
+    counts = np.bincount(members[inside], minlength=len(used))
+    clustered = np.empty((len(used), 3), dtype=np.float64)
+    for axis in range(0, 3):
+        clustered[:, axis] = np.bincount(members[inside], weights=vertices[inside, axis],
+                                         minlength=len(used)) / counts
+    return clustered, faces
+
+
+def decimate(vertices, faces, budget):
+    """
+    Decimate a mesh by vertex clustering until it has at most budget faces.
+    The first grid is estimated from the surface area, its cells are grown
+    until the budget is met.
+
+    Parameters
+    ----------
+    vertices : numpy.ndarray
+        The vertices of shape (vertices, 3).
+    faces : numpy.ndarray
+        The faces of shape (faces, 3).
+    budget : int
+        The maximal number of faces.
+
+    Returns
+    -------
+    vertices : numpy.ndarray
+        The vertices of the decimated mesh.
+    faces : numpy.ndarray
+        The faces of the decimated mesh, the input mesh if it is within
+        the budget.
+    """
+    if len(faces) <= budget:
+        return vertices, faces
+    cellSize = np.sqrt(2 * getArea(vertices, faces) / max(budget, 1))
+    if not cellSize > 0:
+        cellSize = 1.0
+    for attempt in range(0, 32):
+        decimated = clusterVertices(vertices, faces, cellSize)
+        if len(decimated[1]) <= budget:
+            break
+        cellSize = cellSize * 1.25
+    return decimated
+
+
+def getLevelsOfDetail(vertices, faces, budget=None, count=1):
+    """
+    Answer decimated versions of a mesh. The first level is within the
+    budget, each following level has at most a quarter of the faces of
+    the previous one, but isn't reduced below four faces.
+
+    Parameters
+    ----------
+    vertices : numpy.ndarray
+        The vertices of shape (vertices, 3).
+    faces : numpy.ndarray
+        The faces of shape (faces, 3).
+    budget : int, optional
+        The maximal number of faces of the first level, by default the
+        number of faces of the mesh.
+    count : int, optional
+        The number of levels.
+
+    Returns
+    -------
+    levels : list
+        The meshes as tuples (vertices, faces), from the finest to the
+        coarsest.
+    """
+    if budget is None:
+        budget = len(faces)
+    levels = [decimate(vertices, faces, budget)]
+    for level in range(1, count):
+        levels.append(decimate(*levels[-1], max(len(levels[-1][1]) // 4, 4)))
+    return levels
@@ -0,0 +1,205 @@
+"""
+Recording of movies from the canvas of the viewer into ImageJ.
+
+A movie is a sequence of view states, i.e. of camera and dims settings.
+The states are applied and the screenshots taken on the GUI thread, while a
+MovieRecorder converts the screenshots into the slices of an RGB ImageStack
+on a worker thread. The screenshots wait in a bounded queue, so that only a
+few of them are held as numpy arrays, whatever the length of the movie.
+"""
+import queue
+import threading
+import numpy as np
+from .transfer import attachThread, packRGB, toJavaArray
+
+
+def getViewState(viewer):
+    """
+    Answer the camera and dims settings of the viewer.
+
+    Parameters
+    ----------
+    viewer : napari.viewer.Viewer
+        The viewer.
+
+    Returns
+    -------
+    state : dict
+        The camera center, zoom and angles and the current step of the dims.
+    """
+    return {'center': tuple(viewer.camera.center),
+            'zoom': viewer.camera.zoom,
+            'angles': tuple(viewer.camera.angles),
+            'step': tuple(viewer.dims.current_step)}
+
+
+def setViewState(viewer, state):
+    """
+    Apply camera and dims settings to the viewer. Missing entries are left
+    unchanged.
+
+    Parameters
+    ----------
+    viewer : napari.viewer.Viewer
+        The viewer.
+    state : dict
+        The settings as answered by getViewState.
+
+    Returns
+    -------
+    None.
+    """
+    if 'center' in state:
+        viewer.camera.center = state['center']
+    if 'zoom' in state:
+        viewer.camera.zoom = state['zoom']
+    if 'angles' in state:
+        viewer.camera.angles = state['angles']
+    if 'step' in state:
+        viewer.dims.current_step = state['step']
+
+
+def getRotationStates(state, count, axis=2):
+    """
+    Answer the states of a full turn of the camera around one axis.
+
+    Parameters
+    ----------
+    state : dict
+        The state of the first frame.
+    count : int
+        The number of frames.
+    axis : int, optional
+        The index of the camera angle that is increased.
+
+    Returns
+    -------
+    states : list
+        The states of the frames.
+    """
+    states = []
+    for angle in np.linspace(0, 360, count, endpoint=False):
+        angles = list(state['angles'])
+        angles[axis] = angles[axis] + angle
+        states.append(dict(state, angles=tuple(angles)))
+    return states
+
+
+def getTimeStates(state, count, axis=0):
+    """
+    Answer the states that step through one dimension, like the time.
+
+    Parameters
+    ----------
+    state : dict
+        The state of the first frame.
+    count : int
+        The number of steps of the dimension.
+    axis : int, optional
+        The index of the dimension.
+
+    Returns
+    -------
+    states : list
+        The states of the frames.
+    """
+    states = []
+    for index in range(0, count):
+        step = list(state['step'])
+        step[axis] = index
+        states.append(dict(state, step=tuple(step)))
+    return states
+
+
+class MovieRecorder:
+    """
+        Converts screenshots into the slices of an RGB ImageStack on a
+        worker thread attached to the JVM.
+    """
+
+    def __init__(self, queueSize=8):
+        """
+        Create a new recorder. It has to be started before frames are added.
+
+        Parameters
+        ----------
+        queueSize : int, optional
+            The maximal number of screenshots waiting to be converted.
+            Adding a frame blocks while the queue is full.
+
+        Returns
+        -------
+        None.
+        """
+        self.queue = queue.Queue(maxsize=queueSize)
+        self.stack = None
+        self.error = None
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def addFrame(self, frame):
+        """
+        Queue a screenshot for conversion.
+
+        Parameters
+        ----------
+        frame : numpy.ndarray
+            The RGB or RGBA screenshot of shape (height, width, channels).
+
+        Returns
+        -------
+        None.
+        """
+        if self.error:
+            raise self.error
+        self.queue.put(frame)
+
+    def finish(self):
+        """
+        Wait until all frames are converted.
+
+        Returns
+        -------
+        stack : ij.ImageStack
+            The stack of the frames or None if no frame has been added.
+        """
+        self.queue.put(None)
+        self.thread.join()
+        if self.error:
+            raise self.error
+        return self.stack
+
+    def run(self):
+        attachThread()
+        while True:
+            frame = self.queue.get()
+            if frame is None:
+                return
+            if self.error:
+                continue
+            try:
+                self.appendFrame(frame)
+            except Exception as error:
+                self.error = error
+
+    def appendFrame(self, frame):
+        """
+        Append a screenshot as a new slice to the stack.
+
+        Parameters
+        ----------
+        frame : numpy.ndarray
+            The RGB or RGBA screenshot of shape (height, width, channels).
+
+        Returns
+        -------
+        None.
+        """
+        from ij import ImageStack
+        height, width = frame.shape[0:2]
+        if self.stack is None:
+            self.stack = ImageStack(width, height)
+        self.stack.addSlice("frame " + str(self.stack.getSize() + 1), toJavaArray(packRGB(frame)))
@@ -1,12 +1,86 @@
-import copy
+import weakref
+import numpy as np
 import matplotlib.pyplot as plt
 from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
-from qtpy.QtCore import Qt
+from qtpy.QtCore import Qt, QSignalBlocker, QTimer
 from qtpy.QtWidgets import QWidget, QPushButton, QGridLayout, QSlider, QLineEdit, QDoubleSpinBox
 from magicgui import magic_factory
 
 
 _MAXIMUM_HISTOGRAM = 65536
+_COLORMAP_LEVELS = 256
+_UPDATE_INTERVAL = 16
+
+
+def getLayer(layer):
+    """
+    Answer the layer behind the proxy that napari hands to plugins. The
+    proxy is created anew on each access and can't be used as a key.
+
+    Parameters
+    ----------
+    layer : napari.layers.Layer
+        A layer or a proxy of it.
+
+    Returns
+    -------
+    layer : napari.layers.Layer
+        The layer itself.
+    """
+    return getattr(layer, '__wrapped__', layer)
+
+
+def getColorIndices(values, contrastLimits, levels=_COLORMAP_LEVELS):
+    """
+    Answer the index of each value in a lookup table of the colormap
+    sampled at levels equidistant values between the contrast limits.
+
+    Parameters
+    ----------
+    values : numpy.ndarray
+        The values, for example the confidences of the points.
+    contrastLimits : tuple
+        The values mapped to the first and the last color.
+    levels : int, optional
+        The number of colors of the lookup table, at most 256.
+
+    Returns
+    -------
+    indices : numpy.ndarray
+        The indices of dtype uint8.
+    """
+    low, high = contrastLimits
+    scale = (levels - 1) / (high - low) if high > low else 0
+    indices = np.rint((np.asarray(values, dtype=np.float64) - low) * scale)
+    return np.clip(indices, 0, levels - 1).astype(np.uint8)
+
+
+class LayerState:
+    """
+        The thresholds of a points layer and a read-only copy of the
+        original confidences of its points.
+    """
+    __slots__ = ('confidence', 'lowBound', 'highBound')
+
+    def __init__(self, confidence):
+        """
+        Create the state of a layer, with the thresholds at the minimal and
+        maximal confidence.
+
+        Parameters
+        ----------
+        confidence : numpy.ndarray
+            The confidences of the points, they are copied.
+
+        Returns
+        -------
+        None.
+        """
+        self.confidence = np.array(confidence, copy=True)
+        self.confidence.setflags(write=False)
+        self.lowBound = self.confidence.min() if self.confidence.size else 0
+        self.highBound = self.confidence.max() if self.confidence.size else 0
+
 
 class Points(QWidget):
     bridge = None
@@ -21,16 +95,25 @@ class Points(QWidget):
     thresholdMin = 0
     thresholdMax = 0
     
-    lowBound = {}
-    highBound = {}
     confidence = None
-    points = {}
     selectedPoints = None
     colormapID = 0
+    colorTable = None
+    colorIndices = None
+    histogramConfidence = None
+    histogramKey = None
+    histogramCounts = None
+    histogramEdges = None
+    thresholdLines = None
+    background = None
+    appliedConfidence = None
+    appliedThresholds = None
 
     def __init__(self, napari_viewer):
         super().__init__()
         self.viewer = napari_viewer
+        # The states are dropped with their layers.
+        self.layerStates = weakref.WeakKeyDictionary()
 
         self.fieldTableName = QLineEdit(self)
         self.fieldTableName.setText("Results")
@@ -54,8 +137,16 @@ class Points(QWidget):
         self.histogramMaxBox.setMaximum(_MAXIMUM_HISTOGRAM)
         self.histogramMaxBox.valueChanged[float].connect(self.changeHistogramMax)
 
+        # Threshold and range changes are merged and applied at most once
+        # per interval, with the latest values.
+        self.updateTimer = QTimer(self)
+        self.updateTimer.setSingleShot(True)
+        self.updateTimer.setInterval(_UPDATE_INTERVAL)
+        self.updateTimer.timeout.connect(self.applyUpdate)
+
         self.figure = plt.figure()
         self.canvas = FigureCanvas(self.figure)
+        self.canvas.mpl_connect('draw_event', self._on_draw)
         
         self.sliderMin = QSlider(Qt.Horizontal, self)
         self.sliderMin.valueChanged[int].connect(self.changeSliderMin)
@@ -93,25 +184,15 @@ class Points(QWidget):
         self.viewer.layers.events.removed.connect(self._on_remove_layer)
 
     def _on_layer_changed(self, event):
-        anID = id(self.viewer.layers.selection.active)
-        if anID in self.points:
-            self.confidence = self.points[anID][1]
-            self.selectedPoints = self.points[anID][0]
-            self.thresholdMin = self.lowBound[anID]
-            self.thresholdMax = self.highBound[anID]
-        else:
-            points = self.getSelectedLayer()
-            if not points:
-                return
-            self.confidence = copy.deepcopy(points.properties['confidence'])
-            self.points[anID] = points, self.confidence
-            self.lowBound[anID] = min(self.confidence)
-            self.highBound[anID] = max(self.confidence)
-
-            self.selectedPoints = self.points[anID][0]
-
-        self.thresholdMin = self.lowBound[anID]
-        self.thresholdMax = self.highBound[anID]
+        self.clearColorTable()
+        points = self.getSelectedLayer()
+        if not points:
+            return
+        state = self.getLayerState(points)
+        self.selectedPoints = points
+        self.confidence = state.confidence
+        self.thresholdMin = state.lowBound
+        self.thresholdMax = state.highBound
         self.resetHistogramRange()
         sliderMin = self.getValueInSlider(self.thresholdMin, self.histogramMin, self.histogramMax)
         sliderMax = self.getValueInSlider(self.thresholdMax, self.histogramMin, self.histogramMax)
@@ -122,12 +203,15 @@ class Points(QWidget):
         self.drawHistogram()
 
     def setSliderMin(self, value):
-        self.sliderMin.setValue(value)
-        self.sliderMin.setSliderPosition(value)
+        # Only move the slider, the threshold is already set.
+        with QSignalBlocker(self.sliderMin):
+            self.sliderMin.setValue(value)
+            self.sliderMin.setSliderPosition(value)
 
     def setSliderMax(self, value):
-        self.sliderMax.setValue(value)
-        self.sliderMax.setSliderPosition(value)
+        with QSignalBlocker(self.sliderMax):
+            self.sliderMax.setValue(value)
+            self.sliderMax.setSliderPosition(value)
 
     def getValueInSlider(self, floatValue, histoMin, histoMax):
         valueOut = int(_MAXIMUM_HISTOGRAM * (floatValue - histoMin) / (histoMax - histoMin))
@@ -138,38 +222,123 @@ class Points(QWidget):
         return valueOut;
 
     def _on_remove_layer(self, event):
-        anID = id(self.viewer.layers.selection.active)
-        if anID in self.points:
-            self.points.pop(anID)
-            self.lowBound.pop(anID)
-            self.highBound.pop(anID)
-
-            self.confidence = None
-            self.selectedPoints = None
+        if self.selectedPoints is None or getLayer(self.selectedPoints) is not getLayer(event.value):
+            return
+        self.confidence = None
+        self.selectedPoints = None
+        self.clearColorTable()
+        self.histogramConfidence = None
+        self.appliedConfidence = None
+
+    def getLayerState(self, points):
+        """
+        Answer the state of a points layer, a new state the first time the
+        layer is selected.
+
+        Parameters
+        ----------
+        points : napari.layers.Points
+            The layer or a proxy of it.
+
+        Returns
+        -------
+        state : LayerState
+            The state of the layer.
+        """
+        layer = getLayer(points)
+        state = self.layerStates.get(layer)
+        if state is None:
+            state = LayerState(points.properties['confidence'])
+            self.layerStates[layer] = state
+        return state
+
+    def getHistogram(self):
+        """
+        Answer the bin counts of the confidences within the histogram range.
+        They are computed with the Freedman-Diaconis rule once per layer and
+        range and cached.
+
+        Returns
+        -------
+        counts : numpy.ndarray
+            The number of points in each bin.
+        edges : numpy.ndarray
+            The edges of the bins.
+        """
+        if not self.isHistogramCached():
+            self.histogramCounts, self.histogramEdges = np.histogram(self.confidence, bins='fd',
+                                                                     range=(self.histogramMin, self.histogramMax))
+            self.histogramConfidence = self.confidence
+            self.histogramKey = (self.histogramMin, self.histogramMax)
+        return self.histogramCounts, self.histogramEdges
+
+    def isHistogramCached(self):
+        # The confidences are compared by identity, their id could be
+        # reused once the array of a removed layer has been freed.
+        return self.histogramConfidence is self.confidence \
+            and self.histogramKey == (self.histogramMin, self.histogramMax)
 
     def drawHistogram(self):
-        print("Drawing Histogram...")
+        """
+        Draw the histogram of the confidences and the thresholds. The bars
+        are only drawn again if the layer or the histogram range changed,
+        otherwise only the thresholds are moved.
+
+        Returns
+        -------
+        None.
+        """
         if self.confidence is None:
             return
+        if self.ax and self.thresholdLines and self.isHistogramCached():
+            self.drawThresholds()
+            return
+        counts, edges = self.getHistogram()
         self.figure.clear()
 
         # create an axis
         self.ax = self.figure.add_subplot(111)
-        
-        range = (self.histogramMin, self.histogramMax)
-
-        # plot data
-        self.ax.hist(self.confidence, bins='fd', range=range)
-        self.ax.axvline(self.thresholdMin, color='k', linestyle='dashed', linewidth=1)
-        self.ax.axvline(self.thresholdMax, color='k', linestyle='dashed', linewidth=1)
-   
-        # refresh canvas
+
+        # plot the cached counts, the lines are drawn by blitting
+        self.ax.stairs(counts, edges, fill=True)
+        self.thresholdLines = [self.ax.axvline(threshold, color='k', linestyle='dashed', linewidth=1, animated=True)
+                               for threshold in (self.thresholdMin, self.thresholdMax)]
+
+        # refresh canvas, which saves the background for blitting
         self.canvas.draw()
 
+    def drawThresholds(self):
+        """
+        Move the threshold lines over the saved background of the histogram,
+        without drawing the bars again.
+
+        Returns
+        -------
+        None.
+        """
+        if not self.thresholdLines:
+            return
+        for line, threshold in zip(self.thresholdLines, (self.thresholdMin, self.thresholdMax)):
+            line.set_xdata([threshold, threshold])
+        if self.background is None:
+            self.canvas.draw()
+            return
+        self.canvas.restore_region(self.background)
+        for line in self.thresholdLines:
+            self.ax.draw_artist(line)
+        self.canvas.blit(self.ax.bbox)
+
+    def _on_draw(self, event):
+        if not self.ax or not self.thresholdLines:
+            return
+        self.background = self.canvas.copy_from_bbox(self.ax.bbox)
+        for line in self.thresholdLines:
+            self.ax.draw_artist(line)
+
     def _on_click_get_points(self):
         #print(str(self.fieldTableName.text()))
         self.selectedPoints, self.confidence = self.getPoints(self.fieldTableName.text())
-        self.points[id(self.selectedPoints)] = self.selectedPoints, self.confidence
+        self.clearColorTable()
         self.drawHistogram()
 
     def _on_click_resetRange(self):
@@ -190,37 +359,57 @@ class Points(QWidget):
 
     def changeSliderMin(self, value):
         self.thresholdMin = self.getValueFromSlider(value, self.histogramMin, self.histogramMax)
-        anID = id(self.viewer.layers.selection.active)
-        self.lowBound[anID] = self.thresholdMin
-        if not self.ax:
-            return
-        points = self.selectedPoints
-        if not points:
-            return
-        self.drawHistogram()
-        self.setOutsidePointsBlack(points)
-        points.refresh_colors() 
+        if self.selectedPoints is not None:
+            self.getLayerState(self.selectedPoints).lowBound = self.thresholdMin
+        self.scheduleUpdate()
 
     def changeSliderMax(self, value):
         self.thresholdMax = self.getValueFromSlider(value, self.histogramMin, self.histogramMax)
-        anID = id(self.viewer.layers.selection.active)
-        self.highBound[anID] = self.thresholdMax
+        if self.selectedPoints is not None:
+            self.getLayerState(self.selectedPoints).highBound = self.thresholdMax
+        self.scheduleUpdate()
+
+    def scheduleUpdate(self):
+        """
+        Request the histogram and the colors of the points to be updated.
+        Requests made before the timer runs out are merged into one update.
+
+        Returns
+        -------
+        None.
+        """
+        if not self.updateTimer.isActive():
+            self.updateTimer.start()
+
+    def applyUpdate(self):
+        """
+        Draw the histogram with the current range and thresholds and recolor
+        the points, if the thresholds changed since the last update.
+
+        Returns
+        -------
+        None.
+        """
         if not self.ax:
             return
         points = self.selectedPoints
-        if not points:
+        if not points or self.confidence is None:
             return
         self.drawHistogram()
+        thresholds = (self.thresholdMin, self.thresholdMax)
+        if self.appliedConfidence is self.confidence and thresholds == self.appliedThresholds:
+            return
         self.setOutsidePointsBlack(points)
-        points.refresh_colors()
+        self.appliedConfidence = self.confidence
+        self.appliedThresholds = thresholds
 
     def resetHistogramRange(self):
         tMin = self.thresholdMin
         tMax = self.thresholdMax
         self.thresholdMin = 0
         self.thresholdMax = _MAXIMUM_HISTOGRAM+1
-        self.histogramMin = min(self.confidence)
-        self.histogramMax = max(self.confidence)
+        self.histogramMin = float(self.confidence.min())
+        self.histogramMax = float(self.confidence.max())
         self.thresholdMin = tMin
         self.thresholdMax = tMax
         self.changeHistogramMin(self.histogramMin)
@@ -229,33 +418,71 @@ class Points(QWidget):
 
     def changeHistogramMin(self,value):
         self.histogramMin = value
-        self.histogramMinBox.setValue(self.histogramMin)
+        with QSignalBlocker(self.histogramMinBox):
+            self.histogramMinBox.setValue(self.histogramMin)
         sliderMin = self.getValueInSlider(self.thresholdMin, self.histogramMin, self.histogramMax)
         sliderMax = self.getValueInSlider(self.thresholdMax, self.histogramMin, self.histogramMax)
 
         self.setSliderMin(sliderMin)
         self.setSliderMax(sliderMax)
-        self.drawHistogram()
+        self.scheduleUpdate()
 
     def changeHistogramMax(self,value):
         self.histogramMax = value
-        self.histogramMaxBox.setValue(self.histogramMax)
+        with QSignalBlocker(self.histogramMaxBox):
+            self.histogramMaxBox.setValue(self.histogramMax)
         sliderMin = self.getValueInSlider(self.thresholdMin, self.histogramMin, self.histogramMax)
         sliderMax = self.getValueInSlider(self.thresholdMax, self.histogramMin, self.histogramMax)
 
         self.setSliderMin(sliderMin)
         self.setSliderMax(sliderMax)
-        self.drawHistogram()
+        self.scheduleUpdate()
         
     def setOutsidePointsBlack(self,points):
-        p = points.properties['confidence']
-        #print(str(p))
-        print("Bounds = ["+str(self.thresholdMin)+"; "+str(self.thresholdMax)+"]")
-        for i in range(0, len(p)):
-            if self.confidence[i]>self.thresholdMax or self.confidence[i]<self.thresholdMin:
-                p[i] = 0
-            else:
-                p[i] = self.confidence[i]
+        """
+        Set the confidence of the points outside of the thresholds to zero
+        and color them like a confidence of zero. The colors are looked up
+        in a sampled colormap, so that napari doesn't have to map all
+        confidences again.
+
+        Parameters
+        ----------
+        points : napari.layers.Points
+            The selected points layer.
+
+        Returns
+        -------
+        None.
+        """
+        confidence = np.asarray(self.confidence)
+        inside = (confidence >= self.thresholdMin) & (confidence <= self.thresholdMax)
+        points.features['confidence'] = np.where(inside, confidence, 0)
+        if self.colorIndices is None:
+            self.updateColorTable(points)
+        outsideIndex = getColorIndices(0, points.face_contrast_limits)
+        points.face_color = self.colorTable[np.where(inside, self.colorIndices, outsideIndex)]
+
+    def updateColorTable(self, points):
+        """
+        Sample the colormap of the points and look up the color index of
+        the original confidences, once per layer and colormap.
+
+        Parameters
+        ----------
+        points : napari.layers.Points
+            The selected points layer.
+
+        Returns
+        -------
+        None.
+        """
+        samples = np.linspace(0, 1, _COLORMAP_LEVELS)
+        self.colorTable = points.face_colormap.map(samples).astype(np.float32)
+        self.colorIndices = getColorIndices(self.confidence, points.face_contrast_limits)
+
+    def clearColorTable(self):
+        self.colorTable = None
+        self.colorIndices = None
 
     def getBridge(self):
         from .bridge import Bridge
@@ -268,9 +495,8 @@ class Points(QWidget):
         self.getBridge().displayPoints(tableTitle)
         points = self.getSelectedLayer()
         if not points:
-            return
-        self.confidence = copy.deepcopy(points.properties['confidence'])
-        return points, self.confidence
+            return None, None
+        return points, self.getLayerState(points).confidence
 
     def changeColormap(self):
         colormaps = ['viridis','cividis','inferno']
@@ -279,7 +505,12 @@ class Points(QWidget):
             return
         points.face_colormap=colormaps[self.colormapID]
         self.colormapID=(self.colormapID+1)%len(colormaps)
-        points.refresh_colors() 
+        if self.confidence is not None:
+            # The colors have been set directly, look them up in the new colormap.
+            self.clearColorTable()
+            self.setOutsidePointsBlack(points)
+        else:
+            points.refresh_colors()
 
     def pointsToIJ(self):
         if not self.selectedPoints:
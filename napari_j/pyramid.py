@@ -0,0 +1,143 @@
+"""
+Multiscale pyramids of the images fetched from ImageJ.
+
+The levels of a pyramid are computed from the full resolution data by
+averaging blocks of 2^k pixels along the spatial axes. Each level is
+computed directly from the data, in chunks along the first axis on a pool
+of threads, starting with the coarsest level, which is the cheapest to
+compute and can be displayed first.
+"""
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+
+def downsample(data, factor, axes, executor=None):
+    """
+    Reduce the data by averaging blocks of factor pixels along the axes.
+    Axes shorter than factor are reduced to one pixel, pixels that don't
+    fill a whole block at the end of an axis are dropped.
+
+    Parameters
+    ----------
+    data : numpy.ndarray
+        The data to reduce.
+    factor : int
+        The size of the blocks along each of the axes.
+    axes : list
+        The indices of the axes that are reduced.
+    executor : concurrent.futures.Executor, optional
+        The executor on which the chunks along the first axis are reduced.
+
+    Returns
+    -------
+    out : numpy.ndarray
+        The reduced data with the dtype of the input data.
+    """
+    factors = [min(factor, size) if axis in axes else 1
+               for axis, size in enumerate(data.shape)]
+    outShape = [size // f for size, f in zip(data.shape, factors)]
+    out = np.empty(outShape, dtype=data.dtype)
+    blockShape = []
+    for size, f in zip(outShape[1:], factors[1:]):
+        blockShape.extend((size, f))
+    crop = tuple(slice(0, size * f) for size, f in zip(outShape[1:], factors[1:]))
+    blockAxes = tuple(range(1, 2 * len(crop) + 1, 2))
+
+    def reduceChunk(index):
+        chunk = np.asarray(data[index * factors[0]:(index + 1) * factors[0]])
+        chunk = chunk[(slice(None),) + crop].reshape([factors[0]] + blockShape)
+        block = chunk.mean(axis=(0,) + tuple(axis + 1 for axis in blockAxes))
+        if out.dtype.kind in 'iu':
+            block = block.round()
+        out[index] = block
+
+    if executor:
+        list(executor.map(reduceChunk, range(0, outShape[0])))
+    else:
+        for index in range(0, outShape[0]):
+            reduceChunk(index)
+    return out
+
+
+def getLevelCount(shape, axes, minSize=256):
+    """
+    Answer the number of levels of the pyramid, including the full
+    resolution, so that the biggest spatial axis of the coarsest level
+    is not smaller than minSize.
+
+    Parameters
+    ----------
+    shape : tuple
+        The shape of the full resolution data.
+    axes : list
+        The indices of the spatial axes.
+    minSize : int, optional
+        The minimal size of the biggest spatial axis of the coarsest level.
+
+    Returns
+    -------
+    count : int
+        The number of levels.
+    """
+    size = max(shape[axis] for axis in axes)
+    count = 1
+    while size // 2 ** count >= minSize:
+        count = count + 1
+    return count
+
+
+def buildPyramid(data, axes, minSize=256, levelDone=None, workers=4):
+    """
+    Compute the levels of a multiscale pyramid of the data. The coarsest
+    level is computed first.
+
+    Parameters
+    ----------
+    data : numpy.ndarray
+        The full resolution data.
+    axes : list
+        The indices of the spatial axes, which are reduced by a factor of
+        two from one level to the next.
+    minSize : int, optional
+        The minimal size of the biggest spatial axis of the coarsest level.
+    levelDone : callable, optional
+        Called as levelDone(k, level) as soon as the level k is computed.
+    workers : int, optional
+        The number of threads used to compute a level.
+
+    Returns
+    -------
+    levels : list
+        The levels from the full resolution data to the coarsest level.
+    """
+    count = getLevelCount(data.shape, axes, minSize)
+    levels = [data] + [None] * (count - 1)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for k in range(count - 1, 0, -1):
+            levels[k] = downsample(data, 2 ** k, axes, executor)
+            if levelDone:
+                levelDone(k, levels[k])
+    return levels
+
+
+def scaleVoxelSize(voxelSize, baseShape, levelShape):
+    """
+    Answer the voxel size of a level of a pyramid.
+
+    Parameters
+    ----------
+    voxelSize : list
+        The voxel size of the full resolution data in the order z, y, x.
+    baseShape : tuple
+        The shape of the full resolution data.
+    levelShape : tuple
+        The shape of the level.
+
+    Returns
+    -------
+    voxelSize : list
+        The voxel size of the level in the order z, y, x.
+    """
+    ratios = [base / level for base, level in zip(baseShape, levelShape)]
+    ratios = ([1] * 3 + ratios)[-3:]
+    return [size * ratio for size, ratio in zip(voxelSize, ratios)]
@@ -0,0 +1,219 @@
+"""
+Transfer of pixels between processes through shared memory.
+
+An image is published as a named shared memory segment or as a file, ideally
+on a memory file system like /dev/shm. Both start with a header, followed by
+the pixels in C-order:
+
+    magic        4 bytes, b'NPJ1'
+    length       uint32, little-endian, the length of the description
+    description  JSON, UTF-8, with the keys dtype, shape and optionally
+                 title, voxelSize and unit
+    padding      up to the next multiple of 64 bytes
+
+The reading process maps the segment or file and answers a numpy array
+backed by it, so that the pixels are not copied. The FIJI script
+image_to_napari_shm.py writes the same format from ImageJ.
+"""
+import json
+import os
+import struct
+from multiprocessing import shared_memory
+import numpy as np
+
+MAGIC = b'NPJ1'
+ALIGNMENT = 64
+
+
+def getDataOffset(descriptionLength):
+    """
+    Answer the position of the pixels after a header.
+
+    Parameters
+    ----------
+    descriptionLength : int
+        The length in bytes of the JSON description.
+
+    Returns
+    -------
+    offset : int
+        The offset of the pixels, a multiple of ALIGNMENT.
+    """
+    end = len(MAGIC) + 4 + descriptionLength
+    return (end + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def encodeHeader(dtype, shape, **metadata):
+    """
+    Answer the header describing an array.
+
+    Parameters
+    ----------
+    dtype : numpy.dtype
+        The dtype of the array.
+    shape : tuple
+        The shape of the array.
+    **metadata
+        Further JSON-serializable entries of the description, like title,
+        voxelSize and unit.
+
+    Returns
+    -------
+    header : bytes
+        The header, padded up to the offset of the pixels.
+    """
+    description = dict(metadata)
+    description['dtype'] = np.dtype(dtype).str
+    description['shape'] = [int(size) for size in shape]
+    text = json.dumps(description).encode('utf-8')
+    header = MAGIC + struct.pack('<I', len(text)) + text
+    return header.ljust(getDataOffset(len(text)), b'\0')
+
+
+def decodeHeader(buffer):
+    """
+    Read the header at the start of a segment or file.
+
+    Parameters
+    ----------
+    buffer : bytes-like
+        The start of the segment or file, at least up to the end of the
+        description.
+
+    Returns
+    -------
+    description : dict
+        The description of the array.
+    offset : int
+        The offset of the pixels.
+    """
+    if bytes(buffer[0:len(MAGIC)]) != MAGIC:
+        raise ValueError("The data doesn't start with a napari-j header")
+    length = struct.unpack('<I', bytes(buffer[len(MAGIC):len(MAGIC) + 4]))[0]
+    start = len(MAGIC) + 4
+    description = json.loads(bytes(buffer[start:start + length]).decode('utf-8'))
+    return description, getDataOffset(length)
+
+
+class SharedArray:
+    """
+        An array mapped from a shared memory segment or a file published by
+        another process. The pixels are not copied.
+    """
+
+    def __init__(self, name):
+        """
+        Map a published array.
+
+        Parameters
+        ----------
+        name : str
+            The path of a file or the name of a shared memory segment.
+
+        Returns
+        -------
+        None.
+        """
+        self.name = name
+        self.segment = None
+        if os.path.isfile(name):
+            raw = np.memmap(name, dtype=np.uint8, mode='r')
+            self.description, offset = decodeHeader(raw)
+            dtype = np.dtype(self.description['dtype'])
+            shape = tuple(self.description['shape'])
+            nbytes = int(np.prod(shape)) * dtype.itemsize
+            self.array = raw[offset:offset + nbytes].view(dtype).reshape(shape)
+        else:
+            self.segment = attachSegment(name)
+            self.description, offset = decodeHeader(self.segment.buf)
+            self.array = np.ndarray(tuple(self.description['shape']),
+                                    dtype=np.dtype(self.description['dtype']),
+                                    buffer=self.segment.buf, offset=offset)
+
+    def unlink(self):
+        """
+        Remove the file or segment, so that its memory is freed once it is
+        no longer mapped. The array stays valid on posix systems.
+
+        Returns
+        -------
+        None.
+        """
+        if self.segment:
+            self.segment.unlink()
+        else:
+            os.remove(self.name)
+
+    def close(self):
+        """
+        Drop the mapping. The array must no longer be used.
+
+        Returns
+        -------
+        None.
+        """
+        self.array = None
+        if self.segment:
+            self.segment.close()
+            self.segment = None
+
+
+def attachSegment(name):
+    """
+    Attach an existing shared memory segment without handing it over to the
+    resource tracker, which would otherwise remove it when this process
+    exits, although it belongs to the publishing process.
+
+    Parameters
+    ----------
+    name : str
+        The name of the segment.
+
+    Returns
+    -------
+    segment : multiprocessing.shared_memory.SharedMemory
+        The attached segment.
+    """
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        from multiprocessing import resource_tracker
+        segment = shared_memory.SharedMemory(name=name)
+        if os.name == 'posix':
+            resource_tracker.unregister(segment._name, 'shared_memory')
+        return segment
+
+
+def publish(data, name=None, path=None, **metadata):
+    """
+    Copy an array into a new shared memory segment or file, from which other
+    processes can map it.
+
+    Parameters
+    ----------
+    data : numpy.ndarray
+        The array to publish.
+    name : str, optional
+        The name of the segment, by default a generated name.
+    path : str, optional
+        If given, the array is written to a file at this path instead.
+    **metadata
+        Further JSON-serializable entries of the description.
+
+    Returns
+    -------
+    target : multiprocessing.shared_memory.SharedMemory or str
+        The segment, which the caller has to close and unlink, or the path
+        of the file.
+    """
+    data = np.ascontiguousarray(data)
+    header = encodeHeader(data.dtype, data.shape, **metadata)
+    if path:
+        with open(path, 'wb') as file:
+            file.write(header)
+            file.write(data.tobytes())
+        return path
+    segment = shared_memory.SharedMemory(name=name, create=True, size=len(header) + data.nbytes)
+    segment.buf[0:len(header)] = header
+    np.ndarray(data.shape, dtype=data.dtype, buffer=segment.buf, offset=len(header))[...] = data
+    return segment
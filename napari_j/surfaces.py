@@ -0,0 +1,150 @@
+"""
+Time series of surfaces, read frame by frame.
+
+A SurfaceSeries answers the data of a 4D surface-layer that only contains
+the mesh of one frame. The meshes of the frames are read when they are
+displayed and kept in a small LRU-cache, the frames next to the displayed
+frame are read ahead on a background thread. Two unconnected vertices at the
+first and the last frame give the layer the extent of the whole series, so
+that the time slider of the viewer covers all frames.
+"""
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from .transfer import attachThread
+
+
+class SurfaceSeries:
+    """
+        The meshes of a time series of surfaces, read when needed.
+    """
+
+    def __init__(self, readFrame, frameCount, cacheSize=8, prefetch=1):
+        """
+        Create a new series. Nothing is read before a frame is requested.
+
+        Parameters
+        ----------
+        readFrame : callable
+            Called as readFrame(frame) with the frame starting at 0, answers
+            the mesh of the frame as a tuple (vertices, faces, values).
+        frameCount : int
+            The number of frames.
+        cacheSize : int, optional
+            The maximal number of frames kept in memory.
+        prefetch : int, optional
+            The number of frames read ahead on each side of a displayed
+            frame.
+
+        Returns
+        -------
+        None.
+        """
+        self.readFrame = readFrame
+        self.frameCount = frameCount
+        self.cacheSize = cacheSize
+        self.prefetchCount = prefetch
+        self.frames = OrderedDict()
+        self.futures = []
+        self.executor = None
+        self.lock = threading.Lock()
+
+    def getFrame(self, frame):
+        """
+        Answer the mesh of a frame, from the cache if possible.
+
+        Parameters
+        ----------
+        frame : int
+            The frame, starting at 0.
+
+        Returns
+        -------
+        mesh : tuple
+            The vertices, faces and values of the frame.
+        """
+        with self.lock:
+            mesh = self.frames.get(frame)
+            if mesh is not None:
+                self.frames.move_to_end(frame)
+                return mesh
+        mesh = self.readFrame(frame)
+        with self.lock:
+            self.frames[frame] = mesh
+            self.frames.move_to_end(frame)
+            while len(self.frames) > self.cacheSize:
+                self.frames.popitem(last=False)
+        return mesh
+
+    def isCached(self, frame):
+        with self.lock:
+            return frame in self.frames
+
+    def prefetch(self, frame):
+        """
+        Read the frames next to a frame on a background thread. Requests for
+        other frames that haven't been started yet are dropped.
+
+        Parameters
+        ----------
+        frame : int
+            The displayed frame.
+
+        Returns
+        -------
+        None.
+        """
+        with self.lock:
+            for future in self.futures:
+                future.cancel()
+            self.futures = []
+            if self.prefetchCount < 1:
+                return
+            if not self.executor:
+                self.executor = ThreadPoolExecutor(max_workers=1, initializer=attachThread)
+        for distance in range(1, self.prefetchCount + 1):
+            for neighbour in (frame + distance, frame - distance):
+                if 0 <= neighbour < self.frameCount and not self.isCached(neighbour):
+                    self.futures.append(self.executor.submit(self.getFrame, neighbour))
+
+    def getLayerData(self, frame):
+        """
+        Answer the data of a 4D surface-layer that displays the mesh of a
+        frame.
+
+        Parameters
+        ----------
+        frame : int
+            The frame, starting at 0.
+
+        Returns
+        -------
+        data : tuple
+            The vertices with the dimensions t, z, y, x, the faces and the
+            values of the layer.
+        """
+        vertices, faces, values = self.getFrame(frame)
+        sentinel = vertices[0] if len(vertices) > 0 else np.zeros(vertices.shape[1:])
+        bounds = np.column_stack(([0, self.frameCount - 1], [sentinel, sentinel]))
+        layerVertices = np.vstack((np.column_stack((np.full(len(vertices), frame), vertices)), bounds))
+        fill = values[0] if len(values) > 0 else 0
+        layerValues = np.concatenate((values, [fill, fill]))
+        return layerVertices, faces, layerValues
+
+    def shutdown(self):
+        """
+        Drop the pending requests, stop the thread and clear the cache.
+
+        Returns
+        -------
+        None.
+        """
+        with self.lock:
+            for future in self.futures:
+                future.cancel()
+            self.futures = []
+            self.frames.clear()
+            if self.executor:
+                self.executor.shutdown(wait=False)
+                self.executor = None
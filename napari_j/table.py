@@ -0,0 +1,120 @@
+"""
+Transfer of the columns of ImageJ ResultsTables as numpy arrays.
+
+A column is read as a java double[] and copied in bulk, through the buffer
+protocol of the jpype array, into a numpy array. Columns are addressed by
+their headings, which don't depend on whether the table shows row numbers
+or labels.
+
+In the other direction, each column of numpy values is sent as a new java
+double[] in a single call, instead of one call per cell.
+"""
+import numpy as np
+
+
+def getHeadings(table):
+    """
+    Answer the headings of the data columns of a table, without the columns
+    of the row numbers and labels.
+
+    Parameters
+    ----------
+    table : ij.measure.ResultsTable
+        The table.
+
+    Returns
+    -------
+    headings : list
+        The headings of the columns, in the order of the table.
+    """
+    headings = str(table.getColumnHeadings()).split("\t")
+    return [heading for heading in headings if heading.strip() and heading != "Label"]
+
+
+def findHeading(headings, candidates):
+    """
+    Answer the first of the candidates that is one of the headings.
+
+    Parameters
+    ----------
+    headings : list
+        The headings of a table.
+    candidates : list
+        The accepted headings, by priority.
+
+    Returns
+    -------
+    heading : str
+        The first candidate that is in the table or None.
+    """
+    for candidate in candidates:
+        if candidate in headings:
+            return candidate
+    return None
+
+
+def readColumn(table, heading):
+    """
+    Copy one column of a table into a numpy array.
+
+    Parameters
+    ----------
+    table : ij.measure.ResultsTable
+        The table.
+    heading : str
+        The heading of the column.
+
+    Returns
+    -------
+    column : numpy.ndarray
+        The values of the column, of dtype float64.
+    """
+    index = table.getColumnIndex(heading)
+    if index < 0:
+        raise KeyError("The table has no column " + str(heading))
+    return np.array(table.getColumnAsDoubles(index), dtype=np.float64)
+
+
+def readColumns(table, headings):
+    """
+    Copy columns of a table into the columns of a 2D numpy array.
+
+    Parameters
+    ----------
+    table : ij.measure.ResultsTable
+        The table.
+    headings : list
+        The headings of the columns.
+
+    Returns
+    -------
+    data : numpy.ndarray
+        The values of shape (rows, len(headings)) and dtype float64.
+    """
+    data = np.empty((table.size(), len(headings)), dtype=np.float64)
+    for index, heading in enumerate(headings):
+        data[:, index] = readColumn(table, heading)
+    return data
+
+
+def writeColumns(table, columns):
+    """
+    Set whole columns of a table, each in a single call with a java
+    double[] copied in bulk from a numpy array. Missing columns are
+    created. The JVM must be running.
+
+    Parameters
+    ----------
+    table : ij.measure.ResultsTable
+        The table.
+    columns : dict
+        The values of the columns by heading, as 1D arrays.
+
+    Returns
+    -------
+    None.
+    """
+    from jpype import JArray, JDouble
+    for heading, values in columns.items():
+        values = np.ascontiguousarray(values, dtype=np.float64).reshape(-1)
+        table.setValues(heading, JArray(JDouble)(values))
@@ -0,0 +1,316 @@
+"""
+Transfer of pixel data between ImageJ and numpy.
+
+The pixels of an ImageJ stack are read plane by plane from the native
+primitive arrays of the stack (byte[], short[] or float[]). Each plane is
+copied in bulk, through the buffer protocol of the jpype arrays, into a
+preallocated numpy array of the matching dtype. Since only one plane is
+held in the working memory at a time, images of any size can be streamed
+into an array that is backed by a memory-mapped file.
+
+In the other direction, each plane of a numpy array is copied in bulk into
+a new primitive java array, which can be added to an ImageStack.
+"""
+import tempfile
+import numpy as np
+
+
+DTYPES = {8: np.uint8, 16: np.uint16, 32: np.float32}
+
+
+class TransferCancelled(Exception):
+    """
+        Raised by a progress callback to stop a running transfer.
+    """
+
+
+def attachThread():
+    """
+    Attach the current thread to the JVM as a daemon thread, so that a
+    worker thread can call ImageJ without blocking the shutdown of the JVM.
+    Nothing is done if the JVM is not running or the thread is attached.
+
+    Returns
+    -------
+    None.
+    """
+    import jpype
+    if jpype.isJVMStarted() and not jpype.java.lang.Thread.isAttached():
+        jpype.java.lang.Thread.attachAsDaemon()
+
+
+def getDtype(image):
+    """
+    Answer the numpy dtype that holds the pixels of the image without loss.
+    RGB images are converted to their luminance, i.e. to float32.
+
+    Parameters
+    ----------
+    image : ij.ImagePlus
+        The image for which the dtype is needed.
+
+    Returns
+    -------
+    dtype : numpy.dtype
+        The dtype corresponding to the bit-depth of the image.
+    """
+    return np.dtype(DTYPES.get(image.getBitDepth(), np.float32))
+
+
+def isVirtual(image):
+    """
+    Answer whether the planes of the image are read from disk on demand,
+    like those of a VirtualStack, instead of being held in memory.
+
+    Parameters
+    ----------
+    image : ij.ImagePlus
+        The image in ImageJ.
+
+    Returns
+    -------
+    virtual : bool
+        True if the stack of the image is virtual.
+    """
+    return bool(image.getStack().isVirtual())
+
+
+def getLabelsDtype(maxLabel):
+    """
+    Answer the smallest unsigned integer dtype that can hold the labels.
+
+    Parameters
+    ----------
+    maxLabel : int
+        The biggest label of the image.
+
+    Returns
+    -------
+    dtype : numpy.dtype
+        uint8, uint16, uint32 or uint64.
+    """
+    for dtype in (np.uint8, np.uint16, np.uint32):
+        if maxLabel <= np.iinfo(dtype).max:
+            return np.dtype(dtype)
+    return np.dtype(np.uint64)
+
+
+def readPlane(stack, index, out):
+    """
+    Copy the pixels of one plane of the stack into out.
+
+    Parameters
+    ----------
+    stack : ij.ImageStack
+        The stack from which the plane is read.
+    index : int
+        The index of the plane in the stack, starting at 1 as in ImageJ.
+    out : numpy.ndarray
+        A 2D array of shape (height, width) that receives the pixels.
+
+    Returns
+    -------
+    out : numpy.ndarray
+        The array passed in, filled with the pixels of the plane.
+    """
+    pixels = np.asarray(stack.getPixels(index))
+    if pixels.dtype == np.int32:
+        # Packed RGB pixels, use the luminance as ImageJ does.
+        processor = stack.getProcessor(index).convertToFloatProcessor()
+        pixels = np.asarray(processor.getPixels())
+    if pixels.dtype != out.dtype and pixels.dtype.itemsize == out.dtype.itemsize:
+        # Java has no unsigned types, reinterpret the bytes of byte[] and short[].
+        pixels = pixels.view(out.dtype)
+    np.copyto(out, pixels.reshape(out.shape), casting='unsafe')
+    return out
+
+
+def allocate(shape, dtype, memmapDir=None):
+    """
+    Allocate an uninitialized array for the pixels of an image.
+
+    Parameters
+    ----------
+    shape : tuple
+        The shape of the array.
+    dtype : numpy.dtype
+        The type of the elements of the array.
+    memmapDir : str, optional
+        If given, the array is backed by an anonymous temporary file in this
+        folder instead of the main memory.
+
+    Returns
+    -------
+    out : numpy.ndarray or numpy.memmap
+        The new array.
+    """
+    if memmapDir is None:
+        return np.empty(shape, dtype=dtype)
+    with tempfile.TemporaryFile(dir=memmapDir) as file:
+        return np.memmap(file, dtype=dtype, mode='w+', shape=shape)
+
+
+def getStackIndices(image):
+    """
+    Answer the indices in the stack of the planes of the image, ordered by
+    channel, then z-slice, then frame. They are computed with
+    ImagePlus.getStackIndex, so that the image is not converted.
+
+    Parameters
+    ----------
+    image : ij.ImagePlus
+        The image in ImageJ.
+
+    Returns
+    -------
+    indices : list
+        The indices of the planes in the stack, starting at 1.
+    """
+    dims = list(image.getDimensions())
+    return [image.getStackIndex(c + 1, z + 1, t + 1)
+            for t in range(0, dims[4])
+            for z in range(0, dims[3])
+            for c in range(0, dims[2])]
+
+
+def hashPlanes(image, indices=None, hashCode=None):
+    """
+    Answer the hash codes of the pixel arrays of the planes. They are
+    computed in the JVM, without copying the pixels to python.
+
+    Parameters
+    ----------
+    image : ij.ImagePlus
+        The image in ImageJ.
+    indices : list, optional
+        The indices of the planes in the stack, by default all planes in
+        the order c, z, t.
+    hashCode : callable, optional
+        The function answering the hash code of a pixel array, by default
+        java.util.Arrays.hashCode.
+
+    Returns
+    -------
+    hashes : numpy.ndarray
+        The hash codes of the planes.
+    """
+    if indices is None:
+        indices = getStackIndices(image)
+    if hashCode is None:
+        from java.util import Arrays
+        hashCode = Arrays.hashCode
+    stack = image.getStack()
+    return np.array([hashCode(stack.getPixels(index)) for index in indices], dtype=np.int64)
+
+
+def readStack(image, out=None, progress=None, indices=None):
+    """
+    Read the planes of the hyperstack of the image into one array. By
+    default all planes are read, ordered by channel, then z-slice, then
+    frame. The image is not converted and not modified in ImageJ.
+
+    Parameters
+    ----------
+    image : ij.ImagePlus
+        The image whose stack is read.
+    out : numpy.ndarray, optional
+        An array of shape (channels * slices * frames, height, width) that
+        receives the pixels. If None, a new array of the dtype of the image
+        is allocated.
+    progress : callable, optional
+        Called as progress(done, total) after each plane has been read.
+    indices : list, optional
+        The indices in the stack of the planes to read, by default all
+        planes as answered by getStackIndices.
+
+    Returns
+    -------
+    out : numpy.ndarray
+        The pixels of the planes.
+    """
+    stack = image.getStack()
+    dims = list(image.getDimensions())
+    if indices is None:
+        indices = getStackIndices(image)
+    if out is None:
+        out = np.empty((len(indices), dims[1], dims[0]), dtype=getDtype(image))
+    for plane, index in enumerate(indices):
+        readPlane(stack, index, out[plane])
+        if progress:
+            progress(plane + 1, len(indices))
+    return out
+
+
+def getIJDtype(data):
+    """
+    Answer the dtype of one of the ImageJ image types (8-bit, 16-bit or
+    32-bit) that can hold the values of the array.
+
+    Parameters
+    ----------
+    data : numpy.ndarray
+        The pixel data that will be sent to ImageJ.
+
+    Returns
+    -------
+    dtype : numpy.dtype
+        uint8, uint16 or float32.
+    """
+    if data.dtype == np.bool_ or data.dtype == np.uint8:
+        return np.dtype(np.uint8)
+    if data.dtype == np.uint16:
+        return np.dtype(np.uint16)
+    if data.dtype.kind in 'iu' and data.size > 0:
+        if data.min() >= 0 and data.max() <= np.iinfo(np.uint16).max:
+            return np.dtype(np.uint16)
+    return np.dtype(np.float32)
+
+
+def packRGB(rgb):
+    """
+    Pack RGB or RGBA pixels into the int values of an ImageJ ColorProcessor,
+    0xffRRGGBB, in one vectorized pass.
+
+    Parameters
+    ----------
+    rgb : numpy.ndarray
+        The pixels of shape (height, width, 3 or 4) and dtype uint8. The
+        alpha channel is ignored.
+
+    Returns
+    -------
+    pixels : numpy.ndarray
+        The packed pixels of shape (height, width) and dtype int32.
+    """
+    height, width = rgb.shape[0:2]
+    bgra = np.empty((height, width, 4), dtype=np.uint8)
+    bgra[..., 0:3] = rgb[..., 2::-1]
+    bgra[..., 3] = 255
+    return bgra.view('<i4').reshape(height, width)
+
+
+def toJavaArray(plane):
+    """
+    Copy the pixels of a plane into a new primitive java array, in bulk
+    through the buffer protocol. The JVM must be running.
+
+    Parameters
+    ----------
+    plane : numpy.ndarray
+        A 2D array of dtype uint8, uint16, float32 or int32, for the packed
+        pixels of an RGB image.
+
+    Returns
+    -------
+    pixels : JArray
+        A byte[], short[], int[] or float[] with the pixels of the plane.
+    """
+    from jpype import JArray, JByte, JShort, JInt, JFloat
+    pixels = np.ascontiguousarray(plane).reshape(-1)
+    if pixels.dtype == np.uint8:
+        return JArray(JByte)(pixels.view(np.int8))
+    if pixels.dtype == np.uint16:
+        return JArray(JShort)(pixels.view(np.int16))
+    if pixels.dtype == np.int32:
+        return JArray(JInt)(pixels)
+    return JArray(JFloat)(pixels.astype(np.float32, copy=False))